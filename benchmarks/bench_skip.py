@@ -0,0 +1,115 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+"""
+Compare the linear merge (:func:`grep_vcf.grep_vcf.mmap_match_generator`)
+to the exponential search skip (:func:`grep_vcf.grep_vcf.skip_match_generator`)
+on a synthetic vcf filtered by panels of decreasing density,
+to find the density below which skipping is worth it.
+
+usage: python benchmarks/bench_skip.py [--lines N] [--samples N]
+"""
+
+import os
+import sys
+import random
+import argparse
+import tempfile
+from time import perf_counter
+
+# the benchmarks run on the grep_vcf of the checkout, whether it is installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grep_vcf.grep_vcf as gv
+
+
+def write_vcf(path, lines, samples):
+    """
+    :param str path: where to write the vcf
+    :param int lines: the number of data lines
+    :param int samples: the number of sample columns
+    """
+    genotypes = '\t'.join(['0/1:35'] * samples)
+    with open(path, 'w') as vcf:
+        vcf.write("##fileformat=VCFv4.2\n")
+        for pos in range(1, lines + 1):
+            vcf.write(f"{pos * 10}\trs{pos}\tA\tC\t50\tPASS\t.\tGT:DP\t{genotypes}\n")
+
+
+def write_panel(path, lines, density, seed=0):
+    """
+    :param str path: where to write the panel
+    :param int lines: the number of data lines of the vcf
+    :param float density: the fraction of the vcf lines selected by the panel
+    :param int seed: the seed of the random generator
+    """
+    rng = random.Random(seed)
+    positions = sorted(rng.sample(range(1, lines + 1), max(1, int(lines * density))))
+    with open(path, 'w') as panel:
+        for pos in positions:
+            panel.write(f"{pos * 10}\n")
+
+
+def run(generator, panel_path, vcf_path):
+    """
+    :return: the time to filter the vcf and the number of lines selected
+    :rtype: tuple (float, int)
+    """
+    start = perf_counter()
+    with open(panel_path, 'rb') as panel, open(vcf_path, 'rb') as vcf:
+        count = sum(1 for _ in generator(panel, vcf))
+    return perf_counter() - start, count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=500_000, help="The number of vcf lines")
+    parser.add_argument("--samples", type=int, default=20, help="The number of sample columns")
+    args = parser.parse_args(args)
+
+    densities = (0.5, 0.2, 0.1, 0.05, 0.02, 0.01, 0.005, 0.001, 0.0001, 0.00001)
+    crossover = None
+    with tempfile.TemporaryDirectory(prefix='bench_grep_vcf') as tmpdir:
+        vcf_path = os.path.join(tmpdir, 'data.vcf')
+        panel_path = os.path.join(tmpdir, 'panel.txt')
+        write_vcf(vcf_path, args.lines, args.samples)
+        size = os.path.getsize(vcf_path) / 2 ** 20
+        print(f"vcf: {args.lines} lines, {size:.1f} MiB")
+        print(f"{'density':>10} {'panel':>8} {'linear (s)':>11} {'skip (s)':>9} {'speedup':>8}")
+        for density in densities:
+            write_panel(panel_path, args.lines, density)
+            linear, linear_count = run(gv.mmap_match_generator, panel_path, vcf_path)
+            skip, skip_count = run(gv.skip_match_generator, panel_path, vcf_path)
+            assert linear_count == skip_count
+            if crossover is None and skip < linear:
+                crossover = density
+            print(f"{density:>10} {linear_count:>8} {linear:>11.3f} {skip:>9.3f} {linear / skip:>7.1f}x")
+    if crossover is None:
+        print("the skip mode is never faster than the linear merge")
+    else:
+        print(f"the skip mode is faster than the linear merge from a density of {crossover} (and below)")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
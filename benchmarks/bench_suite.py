@@ -0,0 +1,305 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+"""
+The benchmark suite of grep_vcf.
+Synthetic vcf and panels (see synthetic.py) are generated for each combination of
+size, number of columns, panel density, comment ratio and order,
+then each engine filters them (and inverts the filter) in its own process.
+The time, the throughput (lines/s and MB/s of vcf) and the peak memory (RSS) of each run
+are reported as JSON, to be compared across commits,
+with the overhead of the order check (--strict) of the engines which support it.
+The unsorted data are only filtered by the engines which support them.
+
+usage: python benchmarks/bench_suite.py [--lines N ...] [--columns N ...] [--densities D ...]
+                                        [--comment-ratios R ...] [--unsorted] [--engines E ...]
+                                        [--repeat N] [--output results.json] [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+import itertools
+import subprocess
+import tempfile
+from functools import partial
+from time import perf_counter
+
+# the benchmarks run on the grep_vcf of the checkout, whether it is installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grep_vcf
+import grep_vcf.grep_vcf as gv
+import grep_vcf.parallel as gv_parallel
+import grep_vcf.membership as gv_membership
+
+from synthetic import write_vcf, write_panel
+
+
+def _line(ref_path, vcf_path, invert, strict=False):
+    with open(ref_path) as ref, open(vcf_path) as vcf:
+        gen = gv.invert_match_generator if invert else gv.match_generator
+        yield from gen(ref, vcf, strict=strict)
+
+
+def _binary(generator):
+    def run(ref_path, vcf_path, invert):
+        with open(ref_path, 'rb') as ref, open(vcf_path, 'rb') as vcf:
+            yield from generator(ref, vcf, invert=invert)
+    return run
+
+
+def _parallel(ref_path, vcf_path, invert):
+    yield from gv_parallel.parallel_match_generator(ref_path, vcf_path, invert=invert, processes=2)
+
+
+def _unsorted(ref_path, vcf_path, invert):
+    with open(ref_path, 'rb') as ref, open(vcf_path, 'rb') as vcf:
+        yield from gv_membership.membership_match_generator(ref, vcf, invert=invert)
+
+
+ENGINES = {
+    'line': (_line, True),
+    'block': (_binary(gv.block_match_generator), True),
+    'mmap': (_binary(gv.mmap_match_generator), True),
+    'skip': (_binary(gv.skip_match_generator), True),
+    'numpy': (_binary(gv.numpy_match_generator), True),
+    'parallel': (_parallel, True),
+    'unsorted': (_unsorted, False),
+    'line-strict': (partial(_line, strict=True), True),
+    'block-strict': (_binary(partial(gv.block_match_generator, strict=True)), True),
+    'mmap-strict': (_binary(partial(gv.mmap_match_generator, strict=True)), True),
+}
+"""The engines benchmarked, the function which runs it and if it needs sorted data.
+The '-strict' engines check the order of the files while they merge them, to measure the cost of --strict."""
+
+
+def _run_case(case):
+    """
+    Run one case, in the current process.
+
+    :param dict case: the engine, the paths of the panel and the vcf, and the invert flag.
+    :return: the time of the best run, the number of lines selected and the peak memory in KiB
+    :rtype: dict
+    """
+    import resource
+    run = ENGINES[case['engine']][0]
+    best = None
+    for _ in range(case['repeat']):
+        start = perf_counter()
+        # some engines yield several lines at once, the synthetic lines always end by a newline
+        selected = 0
+        for chunk in run(case['panel'], case['vcf'], case['invert']):
+            selected += chunk.count('\n') if isinstance(chunk, str) else bytes(chunk).count(b'\n')
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'seconds': best,
+            'selected': selected,
+            'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run_case(case):
+    """
+    Run one case in its own process, so its peak memory is not mixed with the other cases.
+
+    :param dict case: the engine, the paths of the panel and the vcf, and the invert flag.
+    :return: the result of :func:`_run_case`
+    :rtype: dict
+    """
+    proc = subprocess.run([sys.executable, __file__, '--case', json.dumps(case)],
+                          stdout=subprocess.PIPE, check=True)
+    return json.loads(proc.stdout)
+
+
+def environment():
+    """
+    :return: the description of the environment the benchmarks run in.
+    :rtype: dict
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'grep_vcf': str(grep_vcf.__version__),
+            'commit': commit or None,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'kernel': 'compiled' if gv._speedups is not None else 'pure python',
+            'numpy': gv.np is not None,
+            }
+
+
+# the fields which identify a case in the results
+_CASE_KEYS = ('engine', 'invert', 'lines', 'columns', 'density', 'comment_ratio', 'sorted')
+
+
+def compare(baseline, results, tolerance=0.1):
+    """
+    Compare results to the results of a previous run.
+
+    :param baseline: the results of the previous run
+    :type baseline: list of dict
+    :param results: the new results
+    :type results: list of dict
+    :param float tolerance: the fraction of throughput which can be lost without being a regression
+    :return: the cases slower than the baseline: the case, the old and the new throughput in lines/s
+    :rtype: list of tuple (dict, int, int)
+    """
+    old = {tuple(result[key] for key in _CASE_KEYS): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = old.get(tuple(result[key] for key in _CASE_KEYS))
+        if previous is None:
+            continue
+        ratio = result['lines_per_s'] / previous['lines_per_s']
+        print(f"{result['engine']:>12} invert={result['invert']!s:<5} lines={result['lines']} "
+              f"columns={result['columns']} density={result['density']} comments={result['comment_ratio']} "
+              f"sorted={result['sorted']}: {ratio:.2f}x", file=sys.stderr)
+        if ratio < 1 - tolerance:
+            regressions.append(({key: result[key] for key in _CASE_KEYS},
+                                previous['lines_per_s'], result['lines_per_s']))
+    return regressions
+
+
+def strict_overhead(results):
+    """
+    :param results: the results of a run
+    :type results: list of dict
+    :return: for each case run by a '-strict' engine and by the same engine without the check,
+             the case and the time added by the check (as a fraction of the time without it)
+    :rtype: list of dict
+    """
+    keys = [key for key in _CASE_KEYS if key != 'engine']
+    times = {(result['engine'], *(result[key] for key in keys)): result['seconds'] for result in results}
+    overheads = []
+    for result in results:
+        engine = result['engine']
+        if not engine.endswith('-strict'):
+            continue
+        base = times.get((engine[:-len('-strict')], *(result[key] for key in keys)))
+        if base:
+            overheads.append({**{key: result[key] for key in _CASE_KEYS},
+                              'overhead': round(result['seconds'] / base - 1, 4)})
+    return overheads
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs='+', default=[100_000], help="The numbers of vcf lines")
+    parser.add_argument("--columns", type=int, nargs='+', default=[10], help="The numbers of sample columns")
+    parser.add_argument("--densities", type=float, nargs='+', default=[0.1, 0.001],
+                        help="The fractions of the vcf lines selected by the panels")
+    parser.add_argument("--comment-ratios", type=float, nargs='+', default=[0.0],
+                        help="The probabilities of a comment line before each data line")
+    parser.add_argument("--unsorted", action='store_true', default=False,
+                        help="Benchmark unsorted data too")
+    parser.add_argument("--engines", nargs='+', choices=list(ENGINES), default=list(ENGINES),
+                        help="The engines to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="The number of runs of each case, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the synthetic data")
+    parser.add_argument("--output", help="Where to write the results, default is stdout")
+    parser.add_argument("--compare",
+                        help="The results of a previous run, the throughputs are compared and "
+                             "the exit code is 2 if a case is more than 10%% slower.")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.case:
+        json.dump(_run_case(json.loads(args.case)), sys.stdout)
+        return 0
+
+    results = []
+    orders = (True, False) if args.unsorted else (True,)
+    with tempfile.TemporaryDirectory(prefix='bench_grep_vcf') as tmpdir:
+        vcf_path = os.path.join(tmpdir, 'data.vcf')
+        panel_path = os.path.join(tmpdir, 'panel.txt')
+        for lines, columns, comment_ratio, sort in itertools.product(args.lines, args.columns,
+                                                                     args.comment_ratios, orders):
+            positions = write_vcf(vcf_path, lines, columns=columns, comment_ratio=comment_ratio,
+                                  sort=sort, seed=args.seed)
+            with open(vcf_path, 'rb') as vcf:
+                vcf_lines = sum(1 for _ in vcf)
+            vcf_bytes = os.path.getsize(vcf_path)
+            for density in args.densities:
+                panel_size = write_panel(panel_path, positions, density, sort=sort, seed=args.seed)
+                for invert in (False, True):
+                    selected = set()
+                    for engine in args.engines:
+                        if ENGINES[engine][1] and not sort:
+                            continue
+                        case = {'engine': engine, 'panel': panel_path, 'vcf': vcf_path,
+                                'invert': invert, 'repeat': args.repeat}
+                        result = run_case(case)
+                        selected.add(result['selected'])
+                        seconds = result['seconds']
+                        results.append({'engine': engine,
+                                        'invert': invert,
+                                        'lines': lines,
+                                        'columns': columns,
+                                        'density': density,
+                                        'comment_ratio': comment_ratio,
+                                        'sorted': sort,
+                                        'vcf_lines': vcf_lines,
+                                        'vcf_bytes': vcf_bytes,
+                                        'panel_positions': panel_size,
+                                        'selected': result['selected'],
+                                        'seconds': round(seconds, 6),
+                                        'lines_per_s': round(vcf_lines / seconds),
+                                        'mb_per_s': round(vcf_bytes / seconds / 1e6, 2),
+                                        'peak_rss_kib': result['peak_rss_kib'],
+                                        })
+                        print(f"{engine:>12} invert={invert!s:<5} lines={lines} columns={columns} "
+                              f"density={density} comments={comment_ratio} sorted={sort}: "
+                              f"{seconds:.3f}s {vcf_lines / seconds:,.0f} lines/s", file=sys.stderr)
+                    if len(selected) > 1:
+                        # all engines must select the same lines
+                        print(f"the engines do not agree on lines={lines} columns={columns} density={density} "
+                              f"comments={comment_ratio} sorted={sort} invert={invert}", file=sys.stderr)
+                        return 1
+
+    overheads = strict_overhead(results)
+    for overhead in overheads:
+        print(f"{overhead['engine']:>12} invert={overhead['invert']!s:<5} lines={overhead['lines']} "
+              f"density={overhead['density']}: {overhead['overhead']:+.1%}", file=sys.stderr)
+    report = {'environment': environment(), 'results': results, 'strict_overhead': overheads}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(json.load(baseline)['results'], results)
+        if regressions:
+            print(f"{len(regressions)} regression(s)", file=sys.stderr)
+            return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
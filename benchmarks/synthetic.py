@@ -0,0 +1,101 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+"""
+Deterministic synthetic data for the benchmarks: a vcf and position panels drawn from it.
+The same arguments always give the same files, so the results can be compared across commits.
+"""
+
+import random
+
+SAMPLE = '0/1:35:12,23:99'
+"""The genotype written in each sample column."""
+
+
+def write_vcf(path, lines, columns=10, comment_ratio=0.0, sort=True, seed=0):
+    """
+    Write a synthetic vcf, with a header, and comments lines spread in the data lines.
+
+    :param str path: where to write the vcf
+    :param int lines: the number of data lines
+    :param int columns: the number of sample columns
+    :param float comment_ratio: the probability of a comment line before each data line
+    :param bool sort: if False the data lines (and the comments) are shuffled
+    :param int seed: the seed of the random generator
+    :return: the positions of the data lines
+    :rtype: list of int
+    """
+    rng = random.Random(seed)
+    positions = []
+    pos = 0
+    for _ in range(lines):
+        pos += rng.randint(1, 20)
+        positions.append(pos)
+    genotypes = '\t'.join([SAMPLE] * columns)
+    body = []
+    for i, pos in enumerate(positions):
+        if comment_ratio and rng.random() < comment_ratio:
+            body.append(f"# comment {i}\n")
+        body.append(f"{pos}\trs{pos}\t{rng.choice('ACGT')}\t{rng.choice('ACGT')}\t50\tPASS\tDP={rng.randint(1, 99)}"
+                    f"\tGT:DP:AD:GQ\t{genotypes}\n")
+    if not sort:
+        rng.shuffle(body)
+    with open(path, 'w') as vcf:
+        vcf.write("##fileformat=VCFv4.2\n")
+        vcf.write("##source=grep_vcf benchmarks\n")
+        vcf.write("#POS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" +
+                  '\t'.join(f"sample_{i}" for i in range(columns)) + '\n')
+        vcf.writelines(body)
+    return positions
+
+
+def write_panel(path, positions, density, sort=True, seed=0):
+    """
+    Write a panel which selects a fraction of the lines of a vcf,
+    plus a tenth of positions which are not in the vcf.
+
+    :param str path: where to write the panel
+    :param positions: the positions of the vcf
+    :type positions: list of int
+    :param float density: the fraction of the vcf lines selected by the panel
+    :param bool sort: if False the positions are shuffled
+    :param int seed: the seed of the random generator
+    :return: the number of positions of the panel
+    :rtype: int
+    """
+    rng = random.Random(seed)
+    selected = rng.sample(positions, max(1, int(len(positions) * density)))
+    present = set(positions)
+    last = positions[-1] if positions else 0
+    missing = [pos for pos in (rng.randint(1, last + 1) for _ in range(len(selected) // 10)) if pos not in present]
+    panel = selected + missing
+    if sort:
+        panel.sort()
+    else:
+        rng.shuffle(panel)
+    with open(path, 'w') as panel_file:
+        panel_file.write("# synthetic panel\n")
+        for pos in panel:
+            panel_file.write(f"{pos}\tpanel\n")
+    return len(panel)
@@ -0,0 +1,1411 @@
+/************************************************************************
+ * grep_vcf - remove line fom vcf file where positions are not in       *
+ * reference file                                                       *
+ * Authors: Bertrand Neron                                              *
+ * Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.               *
+ * See the COPYRIGHT file for details                                   *
+ *                                                                      *
+ * This file is part of grep_vcf package.                               *
+ *                                                                      *
+ * grep_vcf is free software: you can redistribute it and/or modify     *
+ * it under the terms of the GNU General Public License as published by *
+ * the Free Software Foundation, either version 3 of the License, or    *
+ * (at your option) any later version.                                  *
+ *                                                                      *
+ * grep_vcf is distributed in the hope that it will be useful,          *
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of       *
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the         *
+ * GNU General Public License for more details .                        *
+ *                                                                      *
+ * You should have received a copy of the GNU General Public License    *
+ * along with grep_vcf (LICENSE).                                       *
+ * If not, see <https://www.gnu.org/licenses/>.                         *
+ ************************************************************************/
+
+/*
+ * The compiled kernel of grep_vcf.
+ * It provides the same functions as the pure python ones of grep_vcf.grep_vcf:
+ * merge (_merge), scan_records (_scan_records), text_records (_text_records), LineCount (_LineCount)
+ * and BlockFilter (_BlockFilter), which are replaced at import time when this module is built.
+ * The behaviour, the records and the error messages are exactly the same.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <structmember.h>
+#include <string.h>
+
+/* the longest position parsed without the help of int() */
+#define MAX_DIGITS 18
+
+
+/* ------------------------------------------------------------------ */
+/* helpers                                                            */
+/* ------------------------------------------------------------------ */
+
+/*
+ * Replace the pending ValueError by a ValueError "<prefix>: <message of the error>".
+ * The other errors are left untouched.
+ */
+static void
+wrap_value_error(const char *prefix)
+{
+    PyObject *type, *value, *traceback, *msg;
+
+    if (!PyErr_ExceptionMatches(PyExc_ValueError)) {
+        return;
+    }
+    PyErr_Fetch(&type, &value, &traceback);
+    PyErr_NormalizeException(&type, &value, &traceback);
+    msg = PyObject_Str(value);
+    Py_XDECREF(type);
+    Py_XDECREF(value);
+    Py_XDECREF(traceback);
+    if (msg == NULL) {
+        return;
+    }
+    PyErr_Format(PyExc_ValueError, "%s: %U", prefix, msg);
+    Py_DECREF(msg);
+}
+
+
+/* the whitespaces of the bytes regular expressions (\s) */
+static inline int
+is_bytes_space(char c)
+{
+    return c == ' ' || c == '\t' || c == '\n' || c == '\r' || c == '\x0b' || c == '\x0c';
+}
+
+
+/* ------------------------------------------------------------------ */
+/* LineCount                                                          */
+/* ------------------------------------------------------------------ */
+
+typedef struct {
+    PyObject_HEAD
+    Py_ssize_t number;
+} LineCountObject;
+
+
+static PyMemberDef line_count_members[] = {
+    {"number", T_PYSSIZET, offsetof(LineCountObject, number), 0, "the number of the last line read"},
+    {NULL}
+};
+
+
+PyDoc_STRVAR(line_count_doc,
+"LineCount()\n"
+"--\n\n"
+"The compiled version of :class:`grep_vcf.grep_vcf._LineCount`, the scanners count the lines in C.");
+
+static PyTypeObject LineCountType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "grep_vcf._speedups.LineCount",
+    .tp_basicsize = sizeof(LineCountObject),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_doc = line_count_doc,
+    .tp_members = line_count_members,
+    .tp_new = PyType_GenericNew,
+};
+
+
+/*
+ * Get the LineCount given to a scanner, return 0 and set *count (a new reference, or NULL for None)
+ * or -1 with a TypeError.
+ */
+static int
+line_count_arg(PyObject *arg, LineCountObject **count)
+{
+    if (arg == Py_None) {
+        *count = NULL;
+        return 0;
+    }
+    if (!PyObject_TypeCheck(arg, &LineCountType)) {
+        PyErr_Format(PyExc_TypeError, "count must be a LineCount or None, not %.200s", Py_TYPE(arg)->tp_name);
+        return -1;
+    }
+    Py_INCREF(arg);
+    *count = (LineCountObject *)arg;
+    return 0;
+}
+
+
+/* ------------------------------------------------------------------ */
+/* merge                                                              */
+/* ------------------------------------------------------------------ */
+
+enum merge_phase {
+    MERGE_INIT,      /* nothing read yet */
+    MERGE_LOOP,      /* the current records are compared */
+    MERGE_AFTER_EQ,  /* the current target line is yielded, both streams must be advanced */
+    MERGE_AFTER_GT,  /* the current target line is yielded, the target must be advanced */
+    MERGE_TAIL,      /* the reference is exhausted, the rest of the target is yielded */
+    MERGE_DONE
+};
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *ref_records;
+    PyObject *target_records;
+    PyObject *ref_lines;
+    PyObject *target_lines;
+    int invert;
+    int strict;
+    int ref_end;
+    enum merge_phase phase;
+    PyObject *ref_pos;
+    PyObject *target_pos;
+    PyObject *line;
+} MergeObject;
+
+
+/*
+ * Get the next record of an iterator of tuple (position, line).
+ * return 1 and set *pos and *line (new references) if there is a record,
+ * 0 if the iterator is exhausted and -1 on error.
+ */
+static int
+next_record(PyObject *records, PyObject **pos, PyObject **line)
+{
+    PyObject *record = PyIter_Next(records);
+
+    if (record == NULL) {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    if (PyTuple_CheckExact(record) && PyTuple_GET_SIZE(record) == 2) {
+        *pos = PyTuple_GET_ITEM(record, 0);
+        *line = PyTuple_GET_ITEM(record, 1);
+        Py_INCREF(*pos);
+        Py_INCREF(*line);
+        Py_DECREF(record);
+        return 1;
+    }
+    {
+        PyObject *tuple = PySequence_Tuple(record);
+        Py_DECREF(record);
+        if (tuple == NULL) {
+            return -1;
+        }
+        if (PyTuple_GET_SIZE(tuple) != 2) {
+            PyErr_Format(PyExc_ValueError, "too many values to unpack (expected 2)");
+            Py_DECREF(tuple);
+            return -1;
+        }
+        *pos = PyTuple_GET_ITEM(tuple, 0);
+        *line = PyTuple_GET_ITEM(tuple, 1);
+        Py_INCREF(*pos);
+        Py_INCREF(*line);
+        Py_DECREF(tuple);
+        return 1;
+    }
+}
+
+
+/* compare two positions, return -1, 0 or 1, or -2 on error */
+static int
+compare(PyObject *a, PyObject *b)
+{
+    int overflow_a, overflow_b, res;
+    long long la, lb;
+
+    if (PyLong_CheckExact(a) && PyLong_CheckExact(b)) {
+        la = PyLong_AsLongLongAndOverflow(a, &overflow_a);
+        lb = PyLong_AsLongLongAndOverflow(b, &overflow_b);
+        if (!overflow_a && !overflow_b) {
+            return (la > lb) - (la < lb);
+        }
+    }
+    res = PyObject_RichCompareBool(a, b, Py_EQ);
+    if (res < 0) {
+        return -2;
+    }
+    if (res) {
+        return 0;
+    }
+    res = PyObject_RichCompareBool(a, b, Py_GT);
+    if (res < 0) {
+        return -2;
+    }
+    return res ? 1 : -1;
+}
+
+
+/*
+ * in strict mode, check that pos is not lower than previous, return -1 (with an error) if it is.
+ * The error reports the number of the line read from count (a _LineCount),
+ * or only the positions if the lines are not counted (None).
+ */
+static int
+check_order(const char *what, PyObject *previous, PyObject *pos, PyObject *count)
+{
+    PyObject *number;
+    int res = compare(pos, previous);
+
+    if (res == -2) {
+        return -1;
+    }
+    if (res >= 0) {
+        return 0;
+    }
+    if (count == Py_None) {
+        PyErr_Format(PyExc_ValueError, "%s is not sorted: the position %S comes after the position %S",
+                     what, pos, previous);
+        return -1;
+    }
+    number = PyObject_GetAttrString(count, "number");
+    if (number == NULL) {
+        return -1;
+    }
+    PyErr_Format(PyExc_ValueError, "%s is not sorted: the line %S (position %S) comes after the position %S",
+                 what, number, pos, previous);
+    Py_DECREF(number);
+    return -1;
+}
+
+
+/* advance the reference, return 0 on success (even if exhausted) and -1 on error */
+static int
+merge_next_ref(MergeObject *self)
+{
+    PyObject *pos = NULL, *line = NULL;
+    int res = next_record(self->ref_records, &pos, &line);
+
+    if (res < 0) {
+        wrap_value_error("position file has wrong format");
+        return -1;
+    }
+    if (res == 0) {
+        Py_CLEAR(self->ref_pos);
+        self->ref_end = 1;
+        return 0;
+    }
+    if (self->strict && self->ref_pos != NULL &&
+            check_order("position file", self->ref_pos, pos, self->ref_lines) < 0) {
+        Py_DECREF(pos);
+        Py_DECREF(line);
+        return -1;
+    }
+    Py_DECREF(line);
+    Py_XSETREF(self->ref_pos, pos);
+    return 0;
+}
+
+
+/* advance the target, return 1 on success, 0 if exhausted and -1 on error */
+static int
+merge_next_target(MergeObject *self, const char *prefix)
+{
+    PyObject *pos = NULL, *line = NULL;
+    int res = next_record(self->target_records, &pos, &line);
+
+    if (res < 0) {
+        wrap_value_error(prefix);
+        return -1;
+    }
+    if (res == 0) {
+        return 0;
+    }
+    if (self->strict && self->target_pos != NULL &&
+            check_order("vcf", self->target_pos, pos, self->target_lines) < 0) {
+        Py_DECREF(pos);
+        Py_DECREF(line);
+        return -1;
+    }
+    Py_XSETREF(self->target_pos, pos);
+    Py_XSETREF(self->line, line);
+    return 1;
+}
+
+
+static PyObject *
+merge_yield(MergeObject *self, enum merge_phase phase)
+{
+    self->phase = phase;
+    Py_INCREF(self->line);
+    return self->line;
+}
+
+
+static PyObject *
+merge_done(MergeObject *self)
+{
+    self->phase = MERGE_DONE;
+    Py_CLEAR(self->ref_records);
+    Py_CLEAR(self->target_records);
+    Py_CLEAR(self->ref_pos);
+    Py_CLEAR(self->target_pos);
+    Py_CLEAR(self->line);
+    return NULL;
+}
+
+
+static PyObject *
+merge_iternext(MergeObject *self)
+{
+    int res;
+
+    for (;;) {
+        switch (self->phase) {
+        case MERGE_INIT:
+            if (merge_next_ref(self) < 0) {
+                return merge_done(self);
+            }
+            res = merge_next_target(self, "vcf has wrong format");
+            if (res == 0) {
+                return merge_done(self);
+            }
+            if (res < 0) {
+                return merge_done(self);
+            }
+            self->phase = MERGE_LOOP;
+            break;
+
+        case MERGE_AFTER_EQ:
+            res = merge_next_target(self, "vcf has wrong line");
+            if (res == 0) {
+                return merge_done(self);
+            }
+            if (res < 0 || merge_next_ref(self) < 0) {
+                return merge_done(self);
+            }
+            self->phase = MERGE_LOOP;
+            break;
+
+        case MERGE_AFTER_GT:
+            res = merge_next_target(self, "vcf has wrong line");
+            if (res == 0) {
+                return merge_done(self);
+            }
+            if (res < 0) {
+                return merge_done(self);
+            }
+            self->phase = MERGE_LOOP;
+            break;
+
+        case MERGE_LOOP:
+            if (self->ref_end) {
+                /* the reference is exhausted, no more line can match */
+                if (self->invert) {
+                    return merge_yield(self, MERGE_TAIL);
+                }
+                return merge_done(self);
+            }
+            res = compare(self->ref_pos, self->target_pos);
+            if (res == -2) {
+                return merge_done(self);
+            }
+            if (res == 0) {
+                if (!self->invert) {
+                    return merge_yield(self, MERGE_AFTER_EQ);
+                }
+                res = merge_next_target(self, "vcf has wrong line");
+                if (res == 0) {
+                    return merge_done(self);
+                }
+                if (res < 0 || merge_next_ref(self) < 0) {
+                    return merge_done(self);
+                }
+            } else if (res > 0) {
+                if (self->invert) {
+                    return merge_yield(self, MERGE_AFTER_GT);
+                }
+                res = merge_next_target(self, "vcf has wrong line");
+                if (res == 0) {
+                    return merge_done(self);
+                }
+                if (res < 0) {
+                    return merge_done(self);
+                }
+            } else if (merge_next_ref(self) < 0) {
+                return merge_done(self);
+            }
+            break;
+
+        case MERGE_TAIL:
+            res = merge_next_target(self, "vcf has wrong line");
+            if (res <= 0) {
+                return merge_done(self);
+            }
+            Py_INCREF(self->line);
+            return self->line;
+
+        default:
+            return NULL;
+        }
+    }
+}
+
+
+static PyObject *
+merge_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"ref_records", "target_records", "invert", "strict", "ref_lines", "target_lines", NULL};
+    PyObject *ref_records, *target_records, *ref_lines = Py_None, *target_lines = Py_None;
+    int invert = 0, strict = 0;
+    MergeObject *self;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO|ppOO:merge", kwlist,
+                                     &ref_records, &target_records, &invert, &strict,
+                                     &ref_lines, &target_lines)) {
+        return NULL;
+    }
+    self = (MergeObject *)type->tp_alloc(type, 0);
+    if (self == NULL) {
+        return NULL;
+    }
+    self->ref_records = PyObject_GetIter(ref_records);
+    if (self->ref_records == NULL) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    self->target_records = PyObject_GetIter(target_records);
+    if (self->target_records == NULL) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    Py_INCREF(ref_lines);
+    self->ref_lines = ref_lines;
+    Py_INCREF(target_lines);
+    self->target_lines = target_lines;
+    self->invert = invert;
+    self->strict = strict;
+    self->phase = MERGE_INIT;
+    return (PyObject *)self;
+}
+
+
+static int
+merge_traverse(MergeObject *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->ref_records);
+    Py_VISIT(self->target_records);
+    Py_VISIT(self->ref_lines);
+    Py_VISIT(self->target_lines);
+    Py_VISIT(self->ref_pos);
+    Py_VISIT(self->target_pos);
+    Py_VISIT(self->line);
+    return 0;
+}
+
+
+static int
+merge_clear(MergeObject *self)
+{
+    Py_CLEAR(self->ref_records);
+    Py_CLEAR(self->target_records);
+    Py_CLEAR(self->ref_lines);
+    Py_CLEAR(self->target_lines);
+    Py_CLEAR(self->ref_pos);
+    Py_CLEAR(self->target_pos);
+    Py_CLEAR(self->line);
+    return 0;
+}
+
+
+static void
+merge_dealloc(MergeObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    merge_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+
+PyDoc_STRVAR(merge_doc,
+"merge(ref_records, target_records, invert=False, strict=False)\n"
+"--\n\n"
+"The compiled version of :func:`grep_vcf.grep_vcf._merge`.");
+
+static PyTypeObject MergeType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "grep_vcf._speedups.merge",
+    .tp_basicsize = sizeof(MergeObject),
+    .tp_dealloc = (destructor)merge_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,
+    .tp_doc = merge_doc,
+    .tp_traverse = (traverseproc)merge_traverse,
+    .tp_clear = (inquiry)merge_clear,
+    .tp_iter = PyObject_SelfIter,
+    .tp_iternext = (iternextfunc)merge_iternext,
+    .tp_new = merge_new,
+};
+
+
+/* ------------------------------------------------------------------ */
+/* scan_records                                                       */
+/* ------------------------------------------------------------------ */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *buf;
+    PyObject *view;
+    LineCountObject *count;
+    Py_ssize_t start;
+    Py_ssize_t end;
+} ScanObject;
+
+
+/* the position of a field which is not a plain number, parsed by int() as in python */
+static PyObject *
+scan_slow_position(const char *data, Py_ssize_t field_start, Py_ssize_t field_stop, Py_ssize_t stop)
+{
+    PyObject *field, *pos, *line, *field_str, *stripped;
+
+    field = PyBytes_FromStringAndSize(data + field_start, field_stop - field_start);
+    if (field == NULL) {
+        return NULL;
+    }
+    pos = PyNumber_Long(field);
+    Py_DECREF(field);
+    if (pos != NULL || !PyErr_ExceptionMatches(PyExc_ValueError)) {
+        return pos;
+    }
+    PyErr_Clear();
+    while (stop > field_start && data[stop - 1] == '\n') {
+        stop--;
+    }
+    line = PyUnicode_DecodeUTF8(data + field_start, stop - field_start, "replace");
+    field_str = PyUnicode_DecodeUTF8(data + field_start, field_stop - field_start, "replace");
+    if (line != NULL && field_str != NULL) {
+        stripped = PyObject_Repr(field_str);
+        if (stripped != NULL) {
+            PyErr_Format(PyExc_ValueError, "%U: invalid literal for int() with base 10: %U", line, stripped);
+            Py_DECREF(stripped);
+        }
+    }
+    Py_XDECREF(line);
+    Py_XDECREF(field_str);
+    return NULL;
+}
+
+
+static PyObject *
+scan_iternext(ScanObject *self)
+{
+    Py_buffer view;
+    const char *data, *found;
+    Py_ssize_t start, stop, end, field_start, field_stop, i;
+    PyObject *pos = NULL, *line, *record;
+    long long value;
+
+    if (self->buf == NULL) {
+        return NULL;
+    }
+    /* the buffer is not held between two records, so a map can be closed after its last line */
+    if (PyObject_GetBuffer(self->buf, &view, PyBUF_SIMPLE) < 0) {
+        return NULL;
+    }
+    data = (const char *)view.buf;
+    end = self->end < view.len ? self->end : view.len;
+    start = self->start;
+    while (start < end) {
+        found = memchr(data + start, '\n', end - start);
+        stop = found ? found - data + 1 : end;
+        if (self->count != NULL) {
+            self->count->number++;
+        }
+        field_start = start;
+        while (field_start < stop && is_bytes_space(data[field_start])) {
+            field_start++;
+        }
+        field_stop = field_start;
+        while (field_stop < stop && !is_bytes_space(data[field_stop])) {
+            field_stop++;
+        }
+        if (field_stop > field_start && data[field_start] != '#') {
+            value = 0;
+            for (i = field_start; i < field_stop; i++) {
+                if (data[i] < '0' || data[i] > '9') {
+                    break;
+                }
+                value = value * 10 + (data[i] - '0');
+            }
+            if (i == field_stop && field_stop - field_start <= MAX_DIGITS) {
+                pos = PyLong_FromLongLong(value);
+            } else {
+                pos = scan_slow_position(data, field_start, field_stop, stop);
+            }
+            self->start = stop;
+            PyBuffer_Release(&view);
+            if (pos == NULL) {
+                Py_CLEAR(self->buf);
+                return NULL;
+            }
+            if (self->view == NULL) {
+                line = PySequence_GetSlice(self->buf, field_start, stop);
+            } else {
+                line = PySequence_GetSlice(self->view, field_start, stop);
+            }
+            if (line == NULL) {
+                Py_DECREF(pos);
+                return NULL;
+            }
+            record = PyTuple_Pack(2, pos, line);
+            Py_DECREF(pos);
+            Py_DECREF(line);
+            return record;
+        }
+        start = stop;
+    }
+    self->start = start;
+    PyBuffer_Release(&view);
+    Py_CLEAR(self->buf);
+    Py_CLEAR(self->view);
+    return NULL;
+}
+
+
+static PyObject *
+scan_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"buf", "start", "end", "view", "count", NULL};
+    PyObject *buf, *end = Py_None, *view = Py_None, *count = Py_None;
+    Py_ssize_t start = 0;
+    ScanObject *self;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|nOOO:scan_records", kwlist,
+                                     &buf, &start, &end, &view, &count)) {
+        return NULL;
+    }
+    self = (ScanObject *)type->tp_alloc(type, 0);
+    if (self == NULL) {
+        return NULL;
+    }
+    if (line_count_arg(count, &self->count) < 0) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    if (end == Py_None) {
+        self->end = PyObject_Length(buf);
+    } else {
+        self->end = PyNumber_AsSsize_t(end, PyExc_OverflowError);
+    }
+    if (self->end == -1 && PyErr_Occurred()) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    Py_INCREF(buf);
+    self->buf = buf;
+    if (view != Py_None) {
+        Py_INCREF(view);
+        self->view = view;
+    }
+    self->start = start;
+    return (PyObject *)self;
+}
+
+
+static int
+scan_traverse(ScanObject *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->buf);
+    Py_VISIT(self->view);
+    Py_VISIT(self->count);
+    return 0;
+}
+
+
+static int
+scan_clear(ScanObject *self)
+{
+    Py_CLEAR(self->buf);
+    Py_CLEAR(self->view);
+    Py_CLEAR(self->count);
+    return 0;
+}
+
+
+static void
+scan_dealloc(ScanObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    scan_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+
+PyDoc_STRVAR(scan_doc,
+"scan_records(buf, start=0, end=None, view=None, count=None)\n"
+"--\n\n"
+"The compiled version of :func:`grep_vcf.grep_vcf._scan_records`.");
+
+static PyTypeObject ScanType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "grep_vcf._speedups.scan_records",
+    .tp_basicsize = sizeof(ScanObject),
+    .tp_dealloc = (destructor)scan_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,
+    .tp_doc = scan_doc,
+    .tp_traverse = (traverseproc)scan_traverse,
+    .tp_clear = (inquiry)scan_clear,
+    .tp_iter = PyObject_SelfIter,
+    .tp_iternext = (iternextfunc)scan_iternext,
+    .tp_new = scan_new,
+};
+
+
+/* ------------------------------------------------------------------ */
+/* text_records                                                       */
+/* ------------------------------------------------------------------ */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *file;
+    LineCountObject *count;
+} TextObject;
+
+
+/* raise the ValueError of _parse_line: "<line without the trailing newlines>: <error of int()>" */
+static void
+text_value_error(PyObject *line)
+{
+    PyObject *type, *value, *traceback, *msg, *stripped;
+
+    PyErr_Fetch(&type, &value, &traceback);
+    PyErr_NormalizeException(&type, &value, &traceback);
+    msg = PyObject_Str(value);
+    Py_XDECREF(type);
+    Py_XDECREF(value);
+    Py_XDECREF(traceback);
+    if (msg == NULL) {
+        return;
+    }
+    stripped = PyObject_CallMethod(line, "rstrip", "s", "\n");
+    if (stripped != NULL) {
+        PyErr_Format(PyExc_ValueError, "%U: %U", stripped, msg);
+        Py_DECREF(stripped);
+    }
+    Py_DECREF(msg);
+}
+
+
+static PyObject *
+text_iternext(TextObject *self)
+{
+    PyObject *raw, *line, *token, *pos, *record;
+    Py_ssize_t length, start, stop, i;
+    const Py_UCS1 *chars;
+    long long value;
+
+    if (self->file == NULL) {
+        return NULL;
+    }
+    for (;;) {
+        raw = PyIter_Next(self->file);
+        if (raw == NULL) {
+            if (!PyErr_Occurred()) {
+                Py_CLEAR(self->file);
+            }
+            return NULL;
+        }
+        if (self->count != NULL) {
+            self->count->number++;
+        }
+        if (!PyUnicode_CheckExact(raw) || !PyUnicode_IS_ASCII(raw)) {
+            /* the general case, as _parse_line does */
+            line = PyObject_CallMethod(raw, "lstrip", NULL);
+            Py_DECREF(raw);
+            if (line == NULL) {
+                return NULL;
+            }
+            length = PyObject_Length(line);
+            if (length < 0) {
+                Py_DECREF(line);
+                return NULL;
+            }
+            {
+                PyObject *sharp = PyUnicode_FromString("#");
+                Py_ssize_t is_comment;
+                if (sharp == NULL) {
+                    Py_DECREF(line);
+                    return NULL;
+                }
+                is_comment = length == 0 ? 1 : PyUnicode_Tailmatch(line, sharp, 0, 1, -1);
+                Py_DECREF(sharp);
+                if (is_comment < 0) {
+                    Py_DECREF(line);
+                    return NULL;
+                }
+                if (is_comment) {
+                    Py_DECREF(line);
+                    continue;
+                }
+            }
+            {
+                PyObject *fields = PyUnicode_Split(line, NULL, 1);
+                if (fields == NULL) {
+                    Py_DECREF(line);
+                    return NULL;
+                }
+                pos = PyLong_FromUnicodeObject(PyList_GET_ITEM(fields, 0), 10);
+                Py_DECREF(fields);
+            }
+            if (pos == NULL) {
+                if (PyErr_ExceptionMatches(PyExc_ValueError)) {
+                    text_value_error(line);
+                }
+                Py_DECREF(line);
+                return NULL;
+            }
+            record = PyTuple_Pack(2, pos, line);
+            Py_DECREF(pos);
+            Py_DECREF(line);
+            return record;
+        }
+        /* the ascii lines are parsed in place */
+        length = PyUnicode_GET_LENGTH(raw);
+        chars = PyUnicode_1BYTE_DATA(raw);
+        start = 0;
+        while (start < length && Py_UNICODE_ISSPACE(chars[start])) {
+            start++;
+        }
+        if (start == length || chars[start] == '#') {
+            Py_DECREF(raw);
+            continue;
+        }
+        if (start) {
+            line = PyUnicode_Substring(raw, start, length);
+            Py_DECREF(raw);
+            if (line == NULL) {
+                return NULL;
+            }
+        } else {
+            line = raw;
+        }
+        chars += start;
+        length -= start;
+        stop = 0;
+        while (stop < length && !Py_UNICODE_ISSPACE(chars[stop])) {
+            stop++;
+        }
+        value = 0;
+        for (i = 0; i < stop; i++) {
+            if (chars[i] < '0' || chars[i] > '9') {
+                break;
+            }
+            value = value * 10 + (chars[i] - '0');
+        }
+        if (i == stop && stop <= MAX_DIGITS) {
+            pos = PyLong_FromLongLong(value);
+        } else {
+            token = PyUnicode_Substring(line, 0, stop);
+            if (token == NULL) {
+                Py_DECREF(line);
+                return NULL;
+            }
+            pos = PyLong_FromUnicodeObject(token, 10);
+            Py_DECREF(token);
+            if (pos == NULL && PyErr_ExceptionMatches(PyExc_ValueError)) {
+                text_value_error(line);
+            }
+        }
+        if (pos == NULL) {
+            Py_DECREF(line);
+            return NULL;
+        }
+        record = PyTuple_Pack(2, pos, line);
+        Py_DECREF(pos);
+        Py_DECREF(line);
+        return record;
+    }
+}
+
+
+static PyObject *
+text_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"file", "count", NULL};
+    PyObject *file, *count = Py_None;
+    TextObject *self;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|O:text_records", kwlist, &file, &count)) {
+        return NULL;
+    }
+    self = (TextObject *)type->tp_alloc(type, 0);
+    if (self == NULL) {
+        return NULL;
+    }
+    if (line_count_arg(count, &self->count) < 0) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    self->file = PyObject_GetIter(file);
+    if (self->file == NULL) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    return (PyObject *)self;
+}
+
+
+static int
+text_traverse(TextObject *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->file);
+    Py_VISIT(self->count);
+    return 0;
+}
+
+
+static int
+text_clear(TextObject *self)
+{
+    Py_CLEAR(self->file);
+    Py_CLEAR(self->count);
+    return 0;
+}
+
+
+static void
+text_dealloc(TextObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    text_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+
+PyDoc_STRVAR(text_doc,
+"text_records(file, count=None)\n"
+"--\n\n"
+"The compiled version of :func:`grep_vcf.grep_vcf._text_records`.");
+
+static PyTypeObject TextType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "grep_vcf._speedups.text_records",
+    .tp_basicsize = sizeof(TextObject),
+    .tp_dealloc = (destructor)text_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,
+    .tp_doc = text_doc,
+    .tp_traverse = (traverseproc)text_traverse,
+    .tp_clear = (inquiry)text_clear,
+    .tp_iter = PyObject_SelfIter,
+    .tp_iternext = (iternextfunc)text_iternext,
+    .tp_new = text_new,
+};
+
+
+/* ------------------------------------------------------------------ */
+/* BlockFilter                                                        */
+/* ------------------------------------------------------------------ */
+
+/* a position held in a C integer, or in a python integer if it does not fit */
+typedef struct {
+    long long value;
+    PyObject *obj;
+} Position;
+
+
+/* set *pos to the python integer obj (the reference is stolen) */
+static void
+position_set(Position *pos, PyObject *obj)
+{
+    int overflow;
+    long long value;
+
+    if (PyLong_CheckExact(obj)) {
+        value = PyLong_AsLongLongAndOverflow(obj, &overflow);
+        if (!overflow) {
+            Py_CLEAR(pos->obj);
+            pos->value = value;
+            Py_DECREF(obj);
+            return;
+        }
+    }
+    Py_XSETREF(pos->obj, obj);
+}
+
+
+/* return a new reference on the python integer of pos */
+static PyObject *
+position_object(Position *pos)
+{
+    if (pos->obj != NULL) {
+        Py_INCREF(pos->obj);
+        return pos->obj;
+    }
+    return PyLong_FromLongLong(pos->value);
+}
+
+
+/* compare two positions, return -1, 0 or 1, or -2 on error */
+static int
+position_compare(Position *a, Position *b)
+{
+    PyObject *obj_a, *obj_b;
+    int res = -2;
+
+    if (a->obj == NULL && b->obj == NULL) {
+        return (a->value > b->value) - (a->value < b->value);
+    }
+    obj_a = position_object(a);
+    obj_b = position_object(b);
+    if (obj_a != NULL && obj_b != NULL) {
+        res = compare(obj_a, obj_b);
+    }
+    Py_XDECREF(obj_a);
+    Py_XDECREF(obj_b);
+    return res;
+}
+
+
+/* check_order on positions, the python integers are made only to report an error */
+static int
+position_check_order(const char *what, Position *previous, Position *pos, PyObject *count)
+{
+    PyObject *previous_obj, *pos_obj;
+    int res = position_compare(pos, previous);
+
+    if (res == -2) {
+        return -1;
+    }
+    if (res >= 0) {
+        return 0;
+    }
+    previous_obj = position_object(previous);
+    pos_obj = position_object(pos);
+    res = -1;
+    if (previous_obj != NULL && pos_obj != NULL) {
+        res = check_order(what, previous_obj, pos_obj, count);
+    }
+    Py_XDECREF(previous_obj);
+    Py_XDECREF(pos_obj);
+    return res;
+}
+
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *ref_records;
+    PyObject *ref_lines;
+    LineCountObject *target_lines;
+    int invert;
+    int strict;
+    int started;
+    int ref_read;
+    int ref_end;
+    int target_read;
+    int advance_ref;   /* the target matched the reference, which is advanced after the next target record */
+    char done;
+    Position ref_pos;
+    Position target_pos;
+} BlockFilterObject;
+
+
+/* advance the reference, return 0 on success (even if exhausted) and -1 on error */
+static int
+block_filter_next_ref(BlockFilterObject *self)
+{
+    PyObject *obj = NULL, *line = NULL;
+    Position pos = {0, NULL};
+    int res = next_record(self->ref_records, &obj, &line);
+
+    if (res < 0) {
+        wrap_value_error("position file has wrong format");
+        return -1;
+    }
+    if (res == 0) {
+        self->ref_end = 1;
+        return 0;
+    }
+    Py_DECREF(line);
+    position_set(&pos, obj);
+    if (self->strict && self->ref_read &&
+            position_check_order("position file", &self->ref_pos, &pos, self->ref_lines) < 0) {
+        Py_XDECREF(pos.obj);
+        return -1;
+    }
+    Py_XDECREF(self->ref_pos.obj);
+    self->ref_pos = pos;
+    self->ref_read = 1;
+    return 0;
+}
+
+
+/* the merge of the target record pos, return 1 if its line is selected, 0 if not and -1 on error */
+static int
+block_filter_select(BlockFilterObject *self)
+{
+    int res;
+
+    if (self->advance_ref) {
+        self->advance_ref = 0;
+        if (block_filter_next_ref(self) < 0) {
+            return -1;
+        }
+    }
+    for (;;) {
+        if (self->ref_end) {
+            /* no more line can match */
+            if (!self->invert) {
+                self->done = 1;
+            }
+            return self->invert;
+        }
+        res = position_compare(&self->ref_pos, &self->target_pos);
+        if (res == -2) {
+            return -1;
+        }
+        if (res == 0) {
+            self->advance_ref = 1;
+            return !self->invert;
+        }
+        if (res > 0) {
+            return self->invert;
+        }
+        if (block_filter_next_ref(self) < 0) {
+            return -1;
+        }
+    }
+}
+
+
+static PyObject *
+block_filter_filter(BlockFilterObject *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"block", "end", NULL};
+    Py_buffer view;
+    PyObject *end_arg = Py_None, *out = NULL;
+    const char *data, *found;
+    char *dst;
+    Py_ssize_t start, stop, end, field_start, field_stop, i, size = 0;
+    Position pos = {0, NULL};
+    long long value;
+    int selected;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "y*|O:filter", kwlist, &view, &end_arg)) {
+        return NULL;
+    }
+    end = view.len;
+    if (end_arg != Py_None) {
+        end = PyNumber_AsSsize_t(end_arg, PyExc_OverflowError);
+        if (end == -1 && PyErr_Occurred()) {
+            goto error;
+        }
+        if (end > view.len) {
+            end = view.len;
+        }
+    }
+    out = PyBytes_FromStringAndSize(NULL, end > 0 ? end : 0);
+    if (out == NULL) {
+        goto error;
+    }
+    dst = PyBytes_AS_STRING(out);
+    if (!self->started) {
+        /* the reference is read first, as the merge does, even if the target is empty */
+        self->started = 1;
+        if (block_filter_next_ref(self) < 0) {
+            goto error;
+        }
+    }
+    data = (const char *)view.buf;
+    start = 0;
+    while (!self->done && start < end) {
+        found = memchr(data + start, '\n', end - start);
+        stop = found ? found - data + 1 : end;
+        if (self->target_lines != NULL) {
+            self->target_lines->number++;
+        }
+        field_start = start;
+        while (field_start < stop && is_bytes_space(data[field_start])) {
+            field_start++;
+        }
+        field_stop = field_start;
+        while (field_stop < stop && !is_bytes_space(data[field_stop])) {
+            field_stop++;
+        }
+        start = stop;
+        if (field_stop == field_start || data[field_start] == '#') {
+            continue;
+        }
+        value = 0;
+        for (i = field_start; i < field_stop; i++) {
+            if (data[i] < '0' || data[i] > '9') {
+                break;
+            }
+            value = value * 10 + (data[i] - '0');
+        }
+        if (i == field_stop && field_stop - field_start <= MAX_DIGITS) {
+            pos.value = value;
+        } else {
+            PyObject *obj = scan_slow_position(data, field_start, field_stop, stop);
+            if (obj == NULL) {
+                wrap_value_error(self->target_read ? "vcf has wrong line" : "vcf has wrong format");
+                goto error;
+            }
+            position_set(&pos, obj);
+        }
+        if (self->strict && self->target_read &&
+                position_check_order("vcf", &self->target_pos, &pos,
+                                     self->target_lines ? (PyObject *)self->target_lines : Py_None) < 0) {
+            goto error;
+        }
+        Py_XDECREF(self->target_pos.obj);
+        self->target_pos = pos;
+        pos.obj = NULL;
+        self->target_read = 1;
+        selected = block_filter_select(self);
+        if (selected < 0) {
+            goto error;
+        }
+        if (selected) {
+            memcpy(dst + size, data + field_start, stop - field_start);
+            size += stop - field_start;
+        }
+    }
+    PyBuffer_Release(&view);
+    if (_PyBytes_Resize(&out, size) < 0) {
+        return NULL;
+    }
+    return out;
+
+error:
+    Py_XDECREF(pos.obj);
+    PyBuffer_Release(&view);
+    Py_XDECREF(out);
+    return NULL;
+}
+
+
+static PyObject *
+block_filter_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"ref_records", "invert", "strict", "ref_lines", "target_lines", NULL};
+    PyObject *ref_records, *ref_lines = Py_None, *target_lines = Py_None;
+    int invert = 0, strict = 0;
+    BlockFilterObject *self;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|ppOO:BlockFilter", kwlist,
+                                     &ref_records, &invert, &strict, &ref_lines, &target_lines)) {
+        return NULL;
+    }
+    self = (BlockFilterObject *)type->tp_alloc(type, 0);
+    if (self == NULL) {
+        return NULL;
+    }
+    if (line_count_arg(target_lines, &self->target_lines) < 0) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    self->ref_records = PyObject_GetIter(ref_records);
+    if (self->ref_records == NULL) {
+        Py_DECREF(self);
+        return NULL;
+    }
+    Py_INCREF(ref_lines);
+    self->ref_lines = ref_lines;
+    self->invert = invert;
+    self->strict = strict;
+    return (PyObject *)self;
+}
+
+
+static int
+block_filter_traverse(BlockFilterObject *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->ref_records);
+    Py_VISIT(self->ref_lines);
+    Py_VISIT(self->target_lines);
+    Py_VISIT(self->ref_pos.obj);
+    Py_VISIT(self->target_pos.obj);
+    return 0;
+}
+
+
+static int
+block_filter_clear(BlockFilterObject *self)
+{
+    Py_CLEAR(self->ref_records);
+    Py_CLEAR(self->ref_lines);
+    Py_CLEAR(self->target_lines);
+    Py_CLEAR(self->ref_pos.obj);
+    Py_CLEAR(self->target_pos.obj);
+    return 0;
+}
+
+
+static void
+block_filter_dealloc(BlockFilterObject *self)
+{
+    PyObject_GC_UnTrack(self);
+    block_filter_clear(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+
+static PyMethodDef block_filter_methods[] = {
+    {"filter", (PyCFunction)(void (*)(void))block_filter_filter, METH_VARARGS | METH_KEYWORDS,
+     "filter(block, end=None)\n--\n\nThe lines of the block selected, see "
+     ":meth:`grep_vcf.grep_vcf._BlockFilter.filter`."},
+    {NULL}
+};
+
+
+static PyMemberDef block_filter_members[] = {
+    {"done", T_BOOL, offsetof(BlockFilterObject, done), READONLY,
+     "True when the next blocks cannot hold any line selected"},
+    {NULL}
+};
+
+
+PyDoc_STRVAR(block_filter_doc,
+"BlockFilter(ref_records, invert=False, strict=False, ref_lines=None, target_lines=None)\n"
+"--\n\n"
+"The compiled version of :class:`grep_vcf.grep_vcf._BlockFilter`,\n"
+"the lines of the target are selected and copied without making any python object.");
+
+static PyTypeObject BlockFilterType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "grep_vcf._speedups.BlockFilter",
+    .tp_basicsize = sizeof(BlockFilterObject),
+    .tp_dealloc = (destructor)block_filter_dealloc,
+    .tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,
+    .tp_doc = block_filter_doc,
+    .tp_traverse = (traverseproc)block_filter_traverse,
+    .tp_clear = (inquiry)block_filter_clear,
+    .tp_methods = block_filter_methods,
+    .tp_members = block_filter_members,
+    .tp_new = block_filter_new,
+};
+
+
+/* ------------------------------------------------------------------ */
+/* module                                                             */
+/* ------------------------------------------------------------------ */
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    .m_name = "grep_vcf._speedups",
+    .m_doc = "The compiled kernel of grep_vcf, see grep_vcf.grep_vcf.",
+    .m_size = -1,
+};
+
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    PyObject *module;
+
+    if (PyType_Ready(&LineCountType) < 0 || PyType_Ready(&MergeType) < 0 || PyType_Ready(&ScanType) < 0 ||
+            PyType_Ready(&TextType) < 0 || PyType_Ready(&BlockFilterType) < 0) {
+        return NULL;
+    }
+    module = PyModule_Create(&speedups_module);
+    if (module == NULL) {
+        return NULL;
+    }
+    Py_INCREF(&LineCountType);
+    Py_INCREF(&MergeType);
+    Py_INCREF(&ScanType);
+    Py_INCREF(&TextType);
+    Py_INCREF(&BlockFilterType);
+    if (PyModule_AddObject(module, "LineCount", (PyObject *)&LineCountType) < 0 ||
+        PyModule_AddObject(module, "merge", (PyObject *)&MergeType) < 0 ||
+        PyModule_AddObject(module, "scan_records", (PyObject *)&ScanType) < 0 ||
+        PyModule_AddObject(module, "text_records", (PyObject *)&TextType) < 0 ||
+        PyModule_AddObject(module, "BlockFilter", (PyObject *)&BlockFilterType) < 0) {
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
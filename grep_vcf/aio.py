@@ -0,0 +1,220 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import io
+import os
+import asyncio
+import inspect
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import grep_vcf.grep_vcf as gv
+import grep_vcf.bgzf as gv_bgzf
+
+#: the default size in bytes of the batches of lines yielded
+BATCH_SIZE = 1024 * 1024
+#: the maximum number of merges running at the same time in an event loop,
+#: the other merges wait for one of them to end before reading their files
+MAX_MERGES = os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+# the semaphore bounding the merges of each event loop
+_semaphores = weakref.WeakKeyDictionary()
+# asyncio.get_running_loop appears in python 3.7, get_event_loop returns the running loop in a coroutine
+_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+def _default_executor():
+    """
+    :return: the executor shared by the merges which are not given an executor,
+             it has a worker thread for each merge which can run at the same time (see :data:`MAX_MERGES`).
+    :rtype: :class:`concurrent.futures.ThreadPoolExecutor` object
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_MERGES, thread_name_prefix='grep_vcf')
+        return _executor
+
+
+def _semaphore(loop):
+    """
+    :param loop: the running event loop
+    :type loop: :class:`asyncio.AbstractEventLoop` object
+    :return: the semaphore which allows :data:`MAX_MERGES` merges at the same time in *loop*
+    :rtype: :class:`asyncio.Semaphore` object
+    """
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(MAX_MERGES)
+    return semaphore
+
+
+class _AsyncReader(io.RawIOBase):
+    """
+    A blocking raw reader over an asynchronous reader (an object with a coroutine *read(n)*
+    as :class:`asyncio.StreamReader`). It is read from a worker thread:
+    each read is scheduled on the event loop, and the thread waits for its result.
+    """
+
+    def __init__(self, reader, loop):
+        """
+        :param reader: the asynchronous reader
+        :param loop: the event loop running the reads
+        :type loop: :class:`asyncio.AbstractEventLoop` object
+        """
+        super().__init__()
+        self._reader = reader
+        self._loop = loop
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = asyncio.run_coroutine_threadsafe(self._reader.read(len(buffer)), self._loop).result()
+        size = len(data)
+        buffer[:size] = data
+        return size
+
+
+def _is_async(file):
+    """
+    :param file: a file
+    :return: True if *file* is an asynchronous reader
+    :rtype: bool
+    """
+    return inspect.iscoroutinefunction(getattr(file, 'read', None))
+
+
+def _open(file, loop, stack):
+    """
+    :param file: the path of a file, a file object opened in binary mode or an asynchronous reader.
+                 The objects which hold their records (as :class:`grep_vcf.index.PositionIndex`) are returned as is.
+    :param loop: the event loop
+    :param list stack: the files opened here, to be closed at the end of the merge
+    :return: the file ready to be read in binary mode from a worker thread
+    """
+    if isinstance(file, str):
+        file = gv_bgzf.open_input(file, 'rb')
+        stack.append(file)
+    elif _is_async(file):
+        file = io.BufferedReader(_AsyncReader(file, loop), buffer_size=gv_bgzf.IO_BUFFER_SIZE)
+    return file
+
+
+def _close(batches, files):
+    """
+    Close a merge and the files it read.
+
+    :param batches: the batches of lines of a merge, or None if the merge did not start
+    :type batches: generator of bytes
+    :param list files: the files opened for the merge
+    """
+    if batches is not None:
+        batches.close()
+    for file in files:
+        file.close()
+
+
+def _next_batch(batches):
+    """
+    :param batches: the batches of lines of a merge
+    :type batches: iterator of bytes
+    :return: the next batch, or None if the merge is over
+    :rtype: bytes
+    """
+    return next(batches, None)
+
+
+async def match_generator(ref_file, target_file, invert=False, batch_size=BATCH_SIZE, executor=None):
+    """
+    create an asynchronous generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    This is the asynchronous counterpart of :func:`grep_vcf.grep_vcf.block_match_generator`:
+    the files are read and merged in a worker thread of *executor*,
+    one batch of about *batch_size* bytes of selected lines at a time,
+    and the event loop runs the other tasks meanwhile.
+    The merges are CPU bound and compete with the event loop for the GIL,
+    so at most :data:`MAX_MERGES` of them run at the same time in an event loop.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    :param ref_file: the positions
+    :type ref_file: path, file object opened in binary mode, asynchronous reader
+                    or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: path, file object opened in binary mode or asynchronous reader
+                       (an object with a coroutine method *read(n)* as :class:`asyncio.StreamReader`)
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int batch_size: the number of bytes read at once, and the size of the batches yielded
+    :param executor: the executor running the batches of the merge.
+                     By default an executor shared by all merges with :data:`MAX_MERGES` worker threads.
+    :type executor: :class:`concurrent.futures.Executor` object
+    :return: an asynchronous generator on batches of selected lines
+    :rtype: async generator of bytes
+    :raise ValueError: when a position can not be parsed
+    """
+    loop = _running_loop()
+    executor = _default_executor() if executor is None else executor
+    async with _semaphore(loop):
+        opened = []
+        batches = None
+        future = None
+        try:
+            ref = _open(ref_file, loop, opened)
+            target = _open(target_file, loop, opened)
+            batches = gv.block_match_generator(ref, target, invert=invert, block_size=batch_size)
+            while True:
+                future = executor.submit(_next_batch, batches)
+                batch = await asyncio.wrap_future(future)
+                if batch is None:
+                    break
+                yield batch
+        finally:
+            if future is None:
+                _close(batches, opened)
+            else:
+                # if the consumer is cancelled while a batch is read, the merge is closed by the worker thread
+                # when it is done with the batch (the callback is run at once if the batch is already read)
+                future.add_done_callback(lambda _: _close(batches, opened))
+
+
+async def invert_match_generator(ref_file, target_file, batch_size=BATCH_SIZE, executor=None):
+    """
+    create an asynchronous generator which can iterate over the lines of target_file
+    where position not appear in reference file.
+    See :func:`match_generator` for the arguments.
+
+    :return: an asynchronous generator on batches of selected lines
+    :rtype: async generator of bytes
+    """
+    batches = match_generator(ref_file, target_file, invert=True, batch_size=batch_size, executor=executor)
+    try:
+        async for batch in batches:
+            yield batch
+    finally:
+        await batches.aclose()
@@ -0,0 +1,344 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import io
+import sys
+import gzip
+import zlib
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# the maximum size of uncompressed data in a bgzf block (as bgzip does)
+BLOCK_DATA_SIZE = 0xff00
+
+# ID1 ID2 CM FLG MTIME XFL OS XLEN
+_HEADER = struct.Struct('<2sBBIBBH')
+# ID1 ID2 CM FLG MTIME XFL OS XLEN SI1 SI2 SLEN BSIZE
+_BGZF_HEADER = struct.Struct('<2sBBIBBHBBHH')
+# CRC32 ISIZE
+_TRAILER = struct.Struct('<II')
+
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+"""The empty block which ends a bgzf file."""
+
+STDIO = '-'
+"""The path which stands for the standard input (or output)."""
+
+IO_BUFFER_SIZE = 4 * 1024 * 1024
+"""The size of the buffers of the standard input and output, so they are read and written by big blocks."""
+
+
+def _bgzf_block_size(header, extra):
+    """
+    :param bytes header: the fixed part of a gzip member header
+    :param bytes extra: the extra field of the header
+    :return: the total size of the bgzf block or None if the member is not a bgzf block
+    :rtype: int or None
+    """
+    magic, method, flags, _, _, _, _ = _HEADER.unpack(header)
+    if magic != GZIP_MAGIC or method != 8 or not flags & 4:
+        return None
+    i = 0
+    while i + 4 <= len(extra):
+        si1, si2, slen = extra[i], extra[i + 1], int.from_bytes(extra[i + 2:i + 4], 'little')
+        if (si1, si2, slen) == (66, 67, 2):  # 'B', 'C'
+            return int.from_bytes(extra[i + 4:i + 6], 'little') + 1
+        i += 4 + slen
+    return None
+
+
+def compression(path):
+    """
+    Detect the compression of a file from its first bytes.
+
+    :param str path: the path of the file
+    :return: 'bgzf', 'gzip' or None if the file is not compressed.
+    :rtype: str or None
+    """
+    with open(path, 'rb') as file:
+        header = file.read(_HEADER.size)
+        if len(header) == _HEADER.size:
+            header += file.read(_HEADER.unpack(header)[-1])
+        return _compression(header)
+
+
+def _compression(data):
+    """
+    :param bytes data: the first bytes of a file
+    :return: 'bgzf', 'gzip' or None if the file is not compressed.
+    :rtype: str or None
+    """
+    if data[:2] != GZIP_MAGIC:
+        return None
+    if len(data) >= _HEADER.size:
+        header, extra = data[:_HEADER.size], data[_HEADER.size:]
+        if _bgzf_block_size(header, extra[:_HEADER.unpack(header)[-1]]):
+            return 'bgzf'
+    return 'gzip'
+
+
+def _inflate(block):
+    """
+    Decompress a bgzf block.
+
+    :param bytes block: the whole bgzf block
+    :return: the uncompressed data
+    :rtype: bytes
+    :raise ValueError: if the block is corrupted
+    """
+    header_size = _HEADER.size + _HEADER.unpack_from(block)[-1]
+    try:
+        data = zlib.decompress(block[header_size:-_TRAILER.size], -15)
+    except zlib.error as err:
+        raise ValueError(f"bgzf block is corrupted: {err}") from None
+    crc, size = _TRAILER.unpack_from(block, len(block) - _TRAILER.size)
+    if size != len(data) or crc != zlib.crc32(data):
+        raise ValueError("bgzf block is corrupted")
+    return data
+
+
+def _deflate(data, level=6):
+    """
+    Compress data in a bgzf block.
+
+    :param bytes data: the data to compress, at most :data:`BLOCK_DATA_SIZE` bytes.
+    :param int level: the compression level
+    :return: the bgzf block
+    :rtype: bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    header = _BGZF_HEADER.pack(GZIP_MAGIC, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+                               _BGZF_HEADER.size + len(cdata) + _TRAILER.size - 1)
+    return header + cdata + _TRAILER.pack(zlib.crc32(data), len(data))
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    A raw stream which decompresses a bgzf file.
+    The blocks are read sequentially but decompressed in parallel on a pool of threads
+    (zlib releases the GIL), a few blocks ahead of the reader.
+    """
+
+    mode = 'rb'
+
+    def __init__(self, file, threads=1):
+        """
+        :param file: the compressed file
+        :type file: file object opened in binary mode
+        :param int threads: the number of threads which decompress the blocks
+        """
+        super().__init__()
+        self._file = file
+        self.name = getattr(file, 'name', None)
+        self._executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._ahead = 4 * threads
+        self._pending = deque()
+        self._data = b''
+        self._offset = 0
+        self._file_end = False
+
+    def readable(self):
+        return True
+
+    def _read_block(self):
+        """
+        :return: the next compressed block or None at the end of file
+        :rtype: bytes
+        :raise ValueError: if the file is not a valid bgzf file
+        """
+        header = self._file.read(_HEADER.size)
+        if not header:
+            return None
+        if len(header) < _HEADER.size:
+            raise ValueError(f"{self.name}: truncated bgzf file")
+        extra = self._file.read(_HEADER.unpack(header)[-1])
+        size = _bgzf_block_size(header, extra)
+        if size is None:
+            raise ValueError(f"{self.name}: not a bgzf file")
+        rest = self._file.read(size - len(header) - len(extra))
+        if len(header) + len(extra) + len(rest) != size:
+            raise ValueError(f"{self.name}: truncated bgzf file")
+        return header + extra + rest
+
+    def _next_data(self):
+        """
+        :return: the next uncompressed block, or None at the end of file
+        :rtype: bytes
+        """
+        while not self._file_end and len(self._pending) < self._ahead:
+            block = self._read_block()
+            if block is None:
+                self._file_end = True
+            elif self._executor:
+                self._pending.append(self._executor.submit(_inflate, block))
+            else:
+                self._pending.append(block)
+        if not self._pending:
+            return None
+        data = self._pending.popleft()
+        return data.result() if self._executor else _inflate(data)
+
+    def readinto(self, buffer):
+        while self._offset >= len(self._data):
+            data = self._next_data()
+            if data is None:
+                return 0
+            self._data = data
+            self._offset = 0
+        size = min(len(buffer), len(self._data) - self._offset)
+        buffer[:size] = self._data[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            if self._executor:
+                # the blocks read ahead are not needed anymore
+                # (shutdown(cancel_futures=True) needs python >= 3.9)
+                for future in self._pending:
+                    future.cancel()
+                self._pending.clear()
+                self._executor.shutdown()
+            self._file.close()
+        super().close()
+
+
+class BgzfWriter(io.RawIOBase):
+    """
+    A raw stream which compresses the data written in bgzf blocks.
+    The blocks are compressed in parallel on a pool of threads (zlib releases the GIL)
+    and written in order.
+    """
+
+    mode = 'wb'
+
+    def __init__(self, file, threads=1, level=6, close_file=True):
+        """
+        :param file: where to write the compressed data
+        :type file: file object opened in binary mode
+        :param int threads: the number of threads which compress the blocks
+        :param int level: the compression level
+        :param bool close_file: close *file* when the stream is closed.
+        """
+        super().__init__()
+        self._file = file
+        self.name = getattr(file, 'name', None)
+        self._executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self._ahead = 4 * threads
+        self._pending = deque()
+        self._data = bytearray()
+        self._level = level
+        self._close_file = close_file
+
+    def writable(self):
+        return True
+
+    def _submit(self, data):
+        if self._executor:
+            self._pending.append(self._executor.submit(_deflate, data, self._level))
+            while len(self._pending) > self._ahead:
+                self._file.write(self._pending.popleft().result())
+        else:
+            self._file.write(_deflate(data, self._level))
+
+    def write(self, data):
+        size = len(data)
+        self._data += data
+        if len(self._data) >= BLOCK_DATA_SIZE:
+            data = bytes(self._data)
+            end = len(data) - len(data) % BLOCK_DATA_SIZE
+            for start in range(0, end, BLOCK_DATA_SIZE):
+                self._submit(data[start:start + BLOCK_DATA_SIZE])
+            self._data = bytearray(data[end:])
+        return size
+
+    def close(self):
+        if not self.closed:
+            if self._data:
+                self._submit(bytes(self._data))
+            while self._pending:
+                self._file.write(self._pending.popleft().result())
+            self._file.write(EOF_BLOCK)
+            if self._executor:
+                self._executor.shutdown()
+            if self._close_file:
+                self._file.close()
+            else:
+                self._file.flush()
+        super().close()
+
+
+def open_input(path, mode='r', threads=1, newline=None):
+    """
+    Open a file for reading, which can be compressed in bgzf or gzip.
+    The compression is detected from the first bytes of the file.
+
+    :param str path: the path of the file, or '-' for the standard input
+    :param str mode: 'r' to open it in text mode, 'rb' in binary mode.
+    :param int threads: the number of threads which decompress a bgzf file
+    :param str newline: how the line ends are read in text mode, as the *newline* argument of :func:`open`
+    :return: the file opened
+    :rtype: file object
+    """
+    if path == STDIO:
+        # the standard input cannot be rewound, the compression is detected on its first bytes in the buffer.
+        # it is not closed with the file returned.
+        file = open(sys.stdin.fileno(), 'rb', buffering=IO_BUFFER_SIZE, closefd=False)
+        kind = _compression(file.peek(_HEADER.size + 64))
+        if kind is None:
+            return file if 'b' in mode else io.TextIOWrapper(file, newline=newline)
+    else:
+        kind = compression(path)
+        if kind is None:
+            return open(path, mode, newline=newline)
+        # gzip does not close a file object given
+        file = path if kind == 'gzip' else open(path, 'rb')
+    if kind == 'gzip':
+        file = gzip.open(file, 'rb')
+    else:
+        file = io.BufferedReader(BgzfReader(file, threads=threads), buffer_size=1024 * 1024)
+    return file if 'b' in mode else io.TextIOWrapper(file, newline=newline)
+
+
+def open_output(file, mode='w', threads=1, level=6, close_file=True, newline=None):
+    """
+    Compress in bgzf the data written in a file.
+
+    :param file: where to write the compressed data
+    :type file: file object opened in binary mode
+    :param str mode: 'w' to get a text stream, 'wb' to get a binary stream
+    :param int threads: the number of threads which compress the blocks
+    :param int level: the compression level
+    :param bool close_file: close *file* when the stream returned is closed.
+    :param str newline: how the line ends are written in text mode, as the *newline* argument of :func:`open`
+    :return: the stream where to write
+    :rtype: file object
+    """
+    raw = BgzfWriter(file, threads=threads, level=level, close_file=close_file)
+    buffered = io.BufferedWriter(raw, buffer_size=BLOCK_DATA_SIZE)
+    return buffered if 'b' in mode else io.TextIOWrapper(buffered, newline=newline)
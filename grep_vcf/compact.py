@@ -0,0 +1,246 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import sys
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, chain, islice, repeat
+
+import grep_vcf.grep_vcf as gv
+
+BLOCK_POSITIONS = 128
+"""The number of positions in a block of a :class:`CompactPanel`."""
+
+# the array type codes of the deltas for each width in bytes
+_TYPECODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+# the number of positions of an unsorted file sorted at once (as python integers) by CompactPanel.from_file
+_SORT_POSITIONS = 1 << 16
+
+
+class UnsortedError(ValueError):
+    """
+    Raised when the positions of a :class:`CompactPanel` are not sorted.
+    """
+
+
+def _ascending(positions, rest):
+    """
+    :param positions: the positions
+    :type positions: iterator of int
+    :param list rest: where to put the first position lower than the previous one
+    :return: the positions until the first one lower than the previous one
+    :rtype: generator of int
+    """
+    previous = 0
+    for pos in positions:
+        if pos < previous:
+            rest.append(pos)
+            return
+        yield pos
+        previous = pos
+
+
+def _width(delta):
+    """
+    :param int delta: the greatest delta of a block
+    :return: the number of bytes needed to store the delta
+    :rtype: int
+    """
+    for width in 1, 2, 4:
+        if delta < 1 << (8 * width):
+            return width
+    return 8
+
+
+class CompactPanel:
+    """
+    The sorted positions of a panel, delta encoded by blocks of :data:`BLOCK_POSITIONS` positions.
+    The first position of each block is kept in a skip index,
+    the gaps to the following positions are stored in the smallest integer type able to hold
+    the largest gap of the block (1, 2, 4 or 8 bytes).
+    A dense panel costs about 1 byte per position instead of 8 in an array
+    and 30 to 60 in a python list or set.
+
+    The blocks are decoded by :mod:`array` and :func:`itertools.accumulate`, so a block is never
+    decoded position by position in python, and the search of a position decodes only one block.
+    A CompactPanel can be used instead of the position file as reference in the generators
+    of :mod:`grep_vcf.grep_vcf`.
+    """
+
+    def __init__(self, positions):
+        """
+        :param positions: the positions of the panel sorted in ascending order
+        :type positions: iterable of int
+        :raise UnsortedError: if the positions are not sorted
+        :raise ValueError: if the positions are negative
+        """
+        self.count = 0
+        #: the first position of each block
+        self.firsts = array('Q')
+        #: the width in bytes of the deltas of each block
+        self.widths = array('B')
+        #: the offset of the deltas of each block in data, and the end of the data
+        self.offsets = array('Q', [0])
+        self._data = bytearray()
+        self._cache = (None, None)
+        block = []
+        previous = 0
+        for pos in positions:
+            if pos < 0:
+                raise ValueError(f"the positions must be positive: {pos}")
+            if pos < previous:
+                raise UnsortedError(f"the positions are not sorted: {pos} after {previous}")
+            block.append(pos)
+            previous = pos
+            if len(block) == BLOCK_POSITIONS:
+                self._add_block(block)
+                block = []
+        if block:
+            self._add_block(block)
+        self._data = bytes(self._data)
+
+    def _add_block(self, block):
+        """
+        :param block: the positions of the block
+        :type block: list of int
+        """
+        deltas = [pos - previous for previous, pos in zip(block, block[1:])]
+        width = _width(max(deltas, default=0))
+        self.firsts.append(block[0])
+        self.widths.append(width)
+        self._data += array(_TYPECODES[width], deltas).tobytes()
+        self.offsets.append(len(self._data))
+        self.count += len(block)
+
+    @classmethod
+    def from_file(cls, positions_file):
+        """
+        Parse a position file and compact its positions.
+        The positions are compacted as they are parsed, the file is read once.
+        If the file is not sorted, the positions after the sorted head of the file are cut in runs,
+        each run is sorted and compacted, then the compact runs are merged in the panel:
+        only the positions of one run are held as python integers at the same time.
+
+        :param positions_file: the position file
+        :type positions_file: file object opened in text or binary mode
+        :return: the compact panel
+        :rtype: :class:`CompactPanel` object
+        :raise ValueError: if a position cannot be parsed or is negative
+        """
+        positions = (pos for pos, _ in gv._records(positions_file))
+        try:
+            rest = []
+            runs = [cls(_ascending(positions, rest))]
+            if not rest:
+                return runs[0]
+            positions = chain(rest, positions)
+            while True:
+                run = sorted(islice(positions, _SORT_POSITIONS))
+                if not run:
+                    break
+                runs.append(cls(run))
+            return cls(heapq.merge(*runs))
+        except ValueError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+
+    def __len__(self):
+        return self.count
+
+    def _block(self, i):
+        """
+        :param int i: the index of a block
+        :return: the positions of the block *i*
+        :rtype: list of int
+        """
+        if self._cache[0] == i:
+            return self._cache[1]
+        deltas = array(_TYPECODES[self.widths[i]], self._data[self.offsets[i]:self.offsets[i + 1]])
+        block = list(accumulate(chain((self.firsts[i],), deltas)))
+        self._cache = (i, block)
+        return block
+
+    def __iter__(self):
+        for i in range(len(self.firsts)):
+            yield from self._block(i)
+
+    def records(self):
+        """
+        :return: the records of the panel, as expected by the merge engine.
+        :rtype: iterator of tuple (int, None)
+        """
+        return zip(self, repeat(None))
+
+    def __contains__(self, pos):
+        i = bisect_right(self.firsts, pos) - 1
+        if i < 0:
+            return False
+        block = self._block(i)
+        j = bisect_left(block, pos)
+        return j < len(block) and block[j] == pos
+
+    def contains(self, pos):
+        """
+        :param int pos: a position
+        :return: True if *pos* is in the panel
+        :rtype: bool
+        """
+        return pos in self
+
+    def next_geq(self, pos):
+        """
+        :param int pos: a position
+        :return: the smallest position of the panel greater or equal to *pos*, or None if there is not any.
+        :rtype: int
+        """
+        i = bisect_right(self.firsts, pos) - 1
+        if i >= 0:
+            block = self._block(i)
+            j = bisect_left(block, pos)
+            if j < len(block):
+                return block[j]
+        i += 1
+        return self.firsts[i] if i < len(self.firsts) else None
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the panel.
+        """
+        return sum(sys.getsizeof(part) for part in (self.firsts, self.widths, self.offsets, self._data))
+
+    def memory_report(self):
+        """
+        :return: the footprint of the panel: the number of positions and of blocks,
+                 the bytes used in total, by the deltas and by the skip index, and the bytes per position.
+        :rtype: dict
+        """
+        nbytes = self.nbytes
+        return {'positions': self.count,
+                'blocks': len(self.firsts),
+                'bytes': nbytes,
+                'deltas_bytes': len(self._data),
+                'index_bytes': nbytes - sys.getsizeof(self._data),
+                'bytes_per_position': nbytes / self.count if self.count else None,
+                }
@@ -0,0 +1,151 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import re
+from itertools import groupby
+from operator import itemgetter
+
+import grep_vcf.grep_vcf as gv
+from grep_vcf.bgzf import open_input
+
+_CONTIG_ID = re.compile(r'^##contig=<(?:.*,)?ID=([^,>]+)')
+
+
+def read_contigs(vcf_path):
+    """
+    Read the order of the contigs from the '##contig' lines of a vcf header.
+
+    :param str vcf_path: the path of the vcf (it can be compressed)
+    :return: the names of the contigs in the order of the header
+    :rtype: list of str
+    """
+    contigs = []
+    with open_input(vcf_path) as vcf:
+        for line in vcf:
+            if not line.startswith('##'):
+                break
+            match = _CONTIG_ID.match(line)
+            if match:
+                contigs.append(match.group(1))
+    return contigs
+
+
+def read_fai(fai_path):
+    """
+    Read the order of the contigs from a fasta index (.fai).
+
+    :param str fai_path: the path of the fasta index
+    :return: the names of the contigs in the order of the index
+    :rtype: list of str
+    """
+    with open(fai_path) as fai:
+        return [line.split('\t', 1)[0].strip() for line in fai if line.strip()]
+
+
+def _contig_records(file):
+    """
+    Iterate over the data lines of a file which starts with a contig and a position columns (as a vcf).
+    As :func:`grep_vcf.grep_vcf._parse_line` does, the comments and the empty lines are skipped
+    and the leading whitespaces are removed from the lines.
+
+    :param file: the file to iterate over
+    :type file: file object opened in text or binary mode
+    :return: the contig, the position and the line of each data line
+    :rtype: tuple (str or bytes, int, str or bytes)
+    :raise ValueError: when the second column can not be cast in an integer
+    """
+    comment = b'#' if gv._is_binary(file) else '#'
+    for line in file:
+        line = line.lstrip()
+        if not line or line.startswith(comment):
+            continue
+        fields = line.split(None, 2)
+        try:
+            yield fields[0], int(fields[1]), line
+        except (ValueError, IndexError):
+            line = line.decode(errors='replace') if isinstance(line, bytes) else line
+            raise ValueError(f"{line.rstrip()}: the 2 first columns must be a contig and a position") from None
+
+
+def segments(file, ranks, what='file'):
+    """
+    Split the records of a file in segments, one per contig.
+    Each segment can be merged independently of the others.
+
+    :param file: the file to split
+    :type file: file object opened in text or binary mode
+    :param ranks: the rank of each contig
+    :type ranks: dict {str: int}
+    :param str what: the kind of file, used in the error messages
+    :return: the rank of the contig and the records (position, line) of each segment
+    :rtype: generator of tuple (int, iterator)
+    :raise ValueError: if a contig is unknown or if the contigs are not in the order of the ranks
+    """
+    previous = -1
+    for contig, group in groupby(_contig_records(file), key=itemgetter(0)):
+        name = contig.decode() if isinstance(contig, bytes) else contig
+        rank = ranks.get(name)
+        if rank is None:
+            raise ValueError(f"{what} has wrong format: the contig {name} is not declared")
+        if rank <= previous:
+            raise ValueError(f"{what} is not sorted: the contig {name} is not in the order of the contigs declared")
+        previous = rank
+        yield rank, ((pos, line) for _, pos, line in group)
+
+
+def contig_match_generator(ref_file, target_file, contigs, invert=False):
+    """
+    create a generator which can iterate over the lines of target_file
+    where the (contig, position) appear (or not if *invert* is True) in reference file.
+    The 2 first columns of both files must be the contig and the position (as in a vcf).
+    The files are merged contig by contig, each contig is an independent segment
+    merged as :func:`grep_vcf.grep_vcf.match_generator` does.
+
+    .. _warning:
+        the contigs must be in the order given by *contigs* and within a contig
+        the positions must be sorted (ascending).
+
+    :param ref_file: the text file to extract
+    :type ref_file: file object opened in text or binary mode
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in text or binary mode
+    :param contigs: the names of the contigs in the order of the files,
+                    see :func:`read_contigs` and :func:`read_fai`.
+    :type contigs: list of str
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :return: a generator on the selected lines
+    :rtype: generator
+    :raise ValueError: if a contig is unknown or if the contigs are not in the right order
+    """
+    ranks = {name: rank for rank, name in enumerate(contigs)}
+    ref_segments = segments(ref_file, ranks, what='position file')
+    ref_rank, ref_records = next(ref_segments, (len(ranks), None))
+    for rank, target_records in segments(target_file, ranks, what='vcf'):
+        while ref_rank < rank:
+            ref_rank, ref_records = next(ref_segments, (len(ranks), None))
+        if ref_rank == rank:
+            yield from gv._merge(ref_records, target_records, invert=invert)
+        elif invert:
+            for _, line in target_records:
+                yield line
@@ -22,12 +22,47 @@
 # If not, see <https://www.gnu.org/licenses/>.                          #
 #########################################################################
 
+import io
+import os
+import re
+import mmap
+import stat
+from itertools import chain, islice
+
+try:
+    import numpy as np
+except ImportError:
+    # the numpy engine falls back on the pure python merge
+    np = None
+
+if os.environ.get('GREP_VCF_PURE_PYTHON'):
+    _speedups = None
+else:
+    try:
+        from grep_vcf import _speedups
+    except ImportError:
+        # the compiled kernel is optional
+        _speedups = None
+
 __version__ = 0.1
 
+BLOCK_SIZE = 8 * 1024 * 1024
+"""The default size (in bytes) of the buffers of lines yielded by the block engine."""
+
+# the size of the blocks of the target read at once by the block engine: a small buffer stays in the cache,
+# a new big buffer for each block costs more in page faults than the scan of its lines
+_READ_SIZE = 256 * 1024
+
+_FIRST_FIELD = re.compile(rb'\s*(\S*)')
+
+# the first field of a line without leading whitespaces, the rest of the line is not tokenized
+_LEADING_FIELD = re.compile(r'\S+')
+
 
 def _parse_line(file):
     """
     Go to next line and parse it, extract the first field and transform it in int.
+    Only the first field is scanned, the other columns of the line are never split.
     Ignore comments (line starting with #)
 
     :param file: the file to parse.
@@ -43,7 +78,7 @@ def _parse_line(file):
         line = next(file).lstrip()
     else:
         try:
-            current_pos = int(line.split()[0])
+            current_pos = int(_LEADING_FIELD.match(line).group())
         except ValueError as err:
             line = line.rstrip('\n')
             raise ValueError(f"{line}: {err}")
@@ -67,69 +102,811 @@ def _until_the_end(file):
             break
 
 
-def match_generator(ref_file, target_file):
+def _text_records(file, count=None):
     """
-    create a generator which can iterate over line in target_file
-    where position not appear in reference file
-    the position are extract from the first column of ref_file and target_file.
+    Iterate over the data lines of a file opened in text mode.
+
+    :param file: the file to iterate over
+    :type file: a file object
+    :param count: where to count the lines read (the comments and the blank lines too), or None
+    :type count: :class:`_LineCount` object
+    :return: the position and the line of each data line
+    :rtype: tuple (int, str)
+    :raise ValueError: when first column can not be cast in an integer
+    """
+    if count is not None:
+        file = _numbered_lines(count, file)
+    while True:
+        try:
+            yield _parse_line(file)
+        except StopIteration:
+            return
+
+
+def _is_binary(file):
+    """
+    :param file: a file object or any iterable of lines
+    :return: True if *file* is a stream of bytes, False if it gives str (a text file, a list of lines ...)
+    :rtype: bool
+    """
+    if isinstance(file, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    mode = getattr(file, 'mode', '')
+    return isinstance(mode, str) and 'b' in mode
+
+
+def _records(file, parser=None, **kwargs):
+    """
+    :param file: the file to parse,
+                 or an object which already holds the records as :class:`grep_vcf.index.PositionIndex`
+    :param parser: the function to get the records from *file*,
+                   by default :func:`_block_records` for a binary file and :func:`_text_records` otherwise
+                   (a text file or any iterator of lines).
+    :param kwargs: the extra arguments of parser
+    :return: the records of *file*
+    :rtype: iterator of tuple (position, line)
+    """
+    if hasattr(file, 'records'):
+        return file.records()
+    if parser is None:
+        parser = _block_records if _is_binary(file) else _text_records
+    return parser(file, **kwargs)
+
+
+def _mapped_records(file, scan=None, count=None):
+    """
+    :param file: the file to parse
+    :type file: a file object opened in binary mode
+    :param scan: the function which scans the map, :func:`_scan_records` by default
+    :type scan: callable
+    :param count: where to count the lines read, or None
+    :type count: :class:`_LineCount` object
+    :return: the records of *file* mapped in memory
+    :rtype: iterator of tuple (int, bytes)
+    """
+    return (scan or _scan_records)(_map(file), count=count)
+
+
+def _view_records(buf, scan=None, count=None):
+    """
+    :param buf: a file mapped in memory
+    :type buf: :class:`mmap.mmap` object
+    :param scan: the function which scans the map, :func:`_scan_records` by default
+    :type scan: callable
+    :param count: where to count the lines read, or None
+    :type count: :class:`_LineCount` object
+    :return: the records of *buf*, the lines are :class:`memoryview` slices of *buf*, they are not copied
+    :rtype: iterator of tuple (int, memoryview)
+    """
+    return (scan or _scan_records)(buf, view=memoryview(buf), count=count)
+
+
+def _scan_records(buf, start=0, end=None, view=None, count=None):
+    """
+    Iterate over the data lines of a bytes-like object (bytes, mmap, ...).
+    The line boundaries and the first field are found directly on the raw bytes, nothing is decoded.
+    As :func:`_parse_line` does, the comments and the empty lines are skipped
+    and the leading whitespaces are removed from the lines.
+
+    :param buf: the buffer to scan
+    :type buf: bytes-like object
+    :param int start: the offset of the first line to scan
+    :param int end: the offset where to stop the scan, by default the end of the buffer
+    :param view: the object to slice to get the lines, by default *buf* itself.
+                 Use a :class:`memoryview` on *buf* to get the lines without copy.
+    :param count: where to count the lines scanned (the comments and the blank lines too), or None
+    :type count: :class:`_LineCount` object
+    :return: the position and the line of each data line
+    :rtype: tuple (int, bytes)
+    :raise ValueError: when first column can not be cast in an integer
+    """
+    if end is None:
+        end = len(buf)
+    if view is None:
+        view = buf
+    find = buf.find
+    match = _FIRST_FIELD.match
+    while start < end:
+        stop = find(b'\n', start, end) + 1 or end
+        if count is not None:
+            count.number += 1
+        field_match = match(buf, start, stop)
+        field = field_match.group(1)
+        if field and field[0] != 35:  # 35 is ord('#')
+            line_start = field_match.start(1)
+            try:
+                pos = int(field)
+            except ValueError:
+                line = bytes(buf[line_start:stop]).decode(errors='replace').rstrip('\n')
+                raise ValueError(f"{line}: invalid literal for int() with base 10: "
+                                 f"{field.decode(errors='replace')!r}") from None
+            yield pos, view[line_start:stop]
+        start = stop
+
+
+class _Offsets:
+    """
+    A fake view to use with :func:`_scan_records` to get the offsets (start, stop)
+    of the lines in the buffer instead of the lines themselves.
+    """
+
+    def __getitem__(self, item):
+        return item.start, item.stop
+
+
+def _next_record(buf, start, end=None):
+    """
+    :param buf: the buffer to scan
+    :type buf: bytes-like object
+    :param int start: the offset where to start the search, it must be a line start.
+    :param int end: the offset where to stop the search, by default the end of the buffer
+    :return: the position, the start and the stop offsets of the first data line after *start*
+             or None if there is no data line between *start* and *end*.
+    :rtype: tuple (int, int, int) or None
+    """
+    for pos, (line_start, line_stop) in _scan_records(buf, start, end, view=_Offsets()):
+        return pos, line_start, line_stop
+    return None
+
+
+def _previous_record(buf, end):
+    """
+    :param buf: the buffer to scan
+    :type buf: bytes-like object
+    :param int end: the offset where to start the search backward, it must be a line start.
+    :return: the position, the start and the stop offsets of the last data line before *end*
+             or None if there is no data line before *end*.
+    :rtype: tuple (int, int, int) or None
+    """
+    while end > 0:
+        start = buf.rfind(b'\n', 0, end - 1) + 1
+        record = _next_record(buf, start, end)
+        if record is not None:
+            return record
+        end = start
+    return None
+
+
+def _line_start(buf, offset):
+    """
+    :param buf: the buffer to scan
+    :type buf: bytes-like object
+    :param int offset: an offset in the buffer
+    :return: the offset of the first line starting at or after *offset*
+    :rtype: int
+    """
+    if offset <= 0:
+        return 0
+    return buf.find(b'\n', offset - 1) + 1 or len(buf)
+
+
+def _bisect_records(buf, pos, lo=0, hi=None):
+    """
+    Search by dichotomy on the byte offsets of a sorted buffer,
+    the first line from which all data lines have a position greater or equal to *pos*.
+
+    :param buf: the buffer to search in.
+    :type buf: bytes-like object
+    :param int pos: the position to search
+    :param int lo: the lower offset of the search, it must be a line start
+    :param int hi: the higher offset of the search, it must be a line start. By default the end of the buffer.
+    :return: the offset of the line found or *hi* if all data lines before *hi* are lower than *pos*.
+    :rtype: int
+    """
+    if hi is None:
+        hi = len(buf)
+    end = hi
+    while lo < hi:
+        mid = (lo + hi) // 2
+        record = _next_record(buf, _line_start(buf, mid), end)
+        if record is None or record[0] >= pos:
+            hi = mid
+        else:
+            lo = min(record[1] + 1, hi)
+    return _line_start(buf, lo)
+
+
+def _gallop(buf, pos, lo, step=256):
+    """
+    Search forward from *lo* the first line from which all data lines have a position greater or equal to *pos*.
+    The search probes the buffer at exponentially growing distances from *lo* to bracket the line,
+    then searches it by dichotomy. So the cost is logarithmic in the distance to the line found,
+    instead of linear as reading all lines in between.
+
+    :param buf: the buffer to search in.
+    :type buf: bytes-like object
+    :param int pos: the position to search
+    :param int lo: the offset where to start the search, it must be a line start.
+    :param int step: the distance of the first probe
+    :return: the offset of the line found or the size of the buffer if all data lines are lower than *pos*.
+    :rtype: int
+    """
+    size = len(buf)
+    record = _next_record(buf, lo)
+    if record is None or record[0] >= pos:
+        return lo
+    lo = record[2]
+    while True:
+        hi = _line_start(buf, lo + step)
+        if hi >= size:
+            hi = size
+            break
+        record = _next_record(buf, hi)
+        if record is None or record[0] >= pos:
+            break
+        lo = record[2]
+        step *= 2
+    return _bisect_records(buf, pos, lo, hi)
+
+
+def _block_records(file, block_size=BLOCK_SIZE, scan=None, count=None):
+    """
+    Iterate over the data lines of a file opened in binary mode.
+    The file is read by blocks of *block_size* bytes,
+    the line overlapping two blocks is carried over to the next block.
+
+    :param file: the file to iterate over
+    :type file: a file object opened in binary mode
+    :param int block_size: the number of bytes to read at once
+    :param scan: the function which scans the blocks, :func:`_scan_records` by default
+    :type scan: callable
+    :param count: where to count the lines read, or None
+    :type count: :class:`_LineCount` object
+    :return: the position and the line of each data line
+    :rtype: iterator of tuple (int, bytes)
+    :raise ValueError: when first column can not be cast in an integer
+    """
+    # the records of each block are chained in C, so they do not go through a python generator one by one
+    return chain.from_iterable(_block_scans(file, block_size, scan or _scan_records, count))
+
+
+def _block_scans(file, block_size, scan, count):
+    """
+    :param file: the file to iterate over
+    :type file: a file object opened in binary mode
+    :param int block_size: the number of bytes to read at once
+    :param scan: the function which scans the blocks
+    :type scan: callable
+    :param count: where to count the lines read, or None
+    :type count: :class:`_LineCount` object
+    :return: the scan of each block of complete lines (see :func:`_block_records`)
+    :rtype: generator of iterator of tuple (int, bytes)
+    """
+    tail = b''
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        if tail:
+            block = tail + block
+        end = block.rfind(b'\n') + 1
+        yield scan(block, end=end, count=count)
+        tail = block[end:]
+    if tail:
+        yield scan(tail, count=count)
+
+
+def _map(file):
+    """
+    Map a file in memory in read only mode.
+
+    :param file: the file to map
+    :type file: a file object opened in binary mode
+    :return: the memory map of the file, or an empty bytes if the file is empty
+             (an empty file cannot be mapped).
+    :rtype: :class:`mmap.mmap` object
+    """
+    if not os.fstat(file.fileno()).st_size:
+        return b''
+    buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        # the kernel can read ahead and drop the pages already read
+        buf.madvise(mmap.MADV_SEQUENTIAL)
+    return buf
+
+
+def _binary_writer(out):
+    """
+    :param out: the output where to write bytes
+    :type out: file object
+    :return: a function to write bytes on *out*.
+             If *out* is a text stream (sys.stdout for instance) the bytes are written on the underlying buffer.
+    :rtype: callable
+    """
+    if _is_binary(out):
+        return out.write
+    buffer = getattr(out, 'buffer', None)
+    if buffer is not None:
+        out.flush()
+        return buffer.write
+    return lambda data: out.write(bytes(data).decode())
+
+
+def _header_size(buf):
+    """
+    :param buf: the content of a file
+    :type buf: bytes-like object
+    :return: the size of the header of the file, the leading lines starting with '#'
+    :rtype: int
+    """
+    offset = 0
+    size = len(buf)
+    while offset < size and buf[offset] == 35:  # 35 is ord('#')
+        offset = buf.find(b'\n', offset) + 1 or size
+    return offset
+
+
+def _sendfile(in_fd, out, size):
+    """
+    Copy the *size* first bytes of a file in *out* within the kernel.
+
+    :param int in_fd: the file descriptor of the file to copy, it must be a regular file.
+    :param out: where to write
+    :type out: file object
+    :param int size: the number of bytes to copy
+    :return: True if the bytes are copied, False if *out* is not a real file or the system cannot do it.
+    :rtype: bool
+    """
+    if not hasattr(os, 'sendfile'):
+        return False
+    try:
+        out_fd = out.fileno()
+    except (AttributeError, OSError):
+        return False
+    # the data already buffered must be written before
+    out.flush()
+    offset = 0
+    try:
+        while offset < size:
+            sent = os.sendfile(out_fd, in_fd, offset, size - offset)
+            if not sent:
+                break
+            offset += sent
+    except OSError:
+        if offset:
+            raise
+        return False
+    return offset == size
+
+
+def read_header(file):
+    """
+    Read the header of a file, the leading lines starting with '#' (the '##' meta lines and the '#CHROM' line
+    of a vcf). The file is left on its first data line.
+
+    :param file: the file to read, it must not be read yet.
+    :type file: file object opened in text or binary mode
+    :return: the header
+    :rtype: bytes
+    """
+    file = getattr(file, 'buffer', file)  # the binary stream under a text file
+    lines = []
+    if hasattr(file, 'peek'):
+        while file.peek(1)[:1] == b'#':
+            lines.append(file.readline())
+    else:
+        while True:
+            offset = file.tell()
+            line = file.readline()
+            if not line.startswith(b'#'):
+                file.seek(offset)
+                break
+            lines.append(line)
+    return b''.join(lines)
+
+
+def copy_header(file, out):
+    """
+    Copy the header of a file, the leading lines starting with '#', in *out* in one bulk copy,
+    so the output of a filter is a valid vcf. If *file* is a regular file which is not compressed,
+    the header is copied by the kernel (:func:`os.sendfile`) without going through python.
+    The file is left on its first data line, so the merge which follows does not read the header again.
+
+    :param file: the file to copy the header from, it must not be read yet.
+    :type file: file object opened in text or binary mode
+    :param out: where to write the header
+    :type out: file object opened in text or binary mode
+    :return: the size of the header in bytes
+    :rtype: int
+    """
+    raw = getattr(file, 'buffer', file)  # the binary stream under a text file
+    # the tell() is done last, it fails on a pipe
+    if isinstance(raw, io.BufferedReader) and isinstance(raw.raw, io.FileIO) and \
+            stat.S_ISREG(os.fstat(raw.fileno()).st_mode) and raw.tell() == 0:
+        buf = _map(raw)
+        size = _header_size(buf)
+        if size and not _sendfile(raw.fileno(), out, size):
+            _binary_writer(out)(memoryview(buf)[:size])
+        raw.seek(size)
+        return size
+    header = read_header(raw)
+    if header:
+        _binary_writer(out)(header)
+    return len(header)
+
+
+class _LineCount:
+    """
+    The number of the physical lines read from an input in strict mode (the data lines, the comments
+    and the blank lines), to report the number of a line out of order.
+    The lines are counted by the parser as it reads them (see :func:`_scan_records`),
+    the input is never read again.
+    """
+
+    __slots__ = ('number',)
+
+    def __init__(self):
+        #: the number of the last line read
+        self.number = 0
+
+
+def _numbered_lines(count, lines):
+    """
+    :param count: where to count the lines
+    :type count: :class:`_LineCount` object
+    :param lines: the lines of a text input
+    :type lines: iterable of str
+    :return: the same lines, counted in *count*
+    :rtype: generator of str
+    """
+    for line in lines:
+        count.number += 1
+        yield line
+
+
+def _parsed(stats, name, file, parser=None, count=None, **kwargs):
+    """
+    :param stats: where to count the records and the lines skipped by the parser, or None
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param str name: the name of the input in *stats* ('ref' or 'target')
+    :param file: the file to parse, see :func:`_records`
+    :param parser: the function to get the records from *file*, see :func:`_records`.
+                   Except :func:`_text_records`, it must accept a *scan* argument as :func:`_block_records` does.
+    :param count: where to count the lines read by the parser, or None.
+                  The parser must then accept a *count* argument as :func:`_block_records` does.
+    :type count: :class:`_LineCount` object
+    :param kwargs: the extra arguments of parser
+    :return: the records of *file* counted by *stats*, or not counted if *stats* is None
+    :rtype: iterator of tuple (position, line)
+    """
+    if count is not None:
+        kwargs['count'] = count
+    if stats is None:
+        return _records(file, parser, **kwargs)
+    if not hasattr(file, 'records'):
+        if parser is None:
+            parser = _block_records if _is_binary(file) else _text_records
+        if parser is _text_records:
+            file = stats.text_lines(name, file)
+        else:
+            kwargs['scan'] = stats.scanner(name)
+    return stats.records(name, _records(file, parser, **kwargs))
+
+
+def _strict_counts(strict, *files):
+    """
+    :param bool strict: the order of the inputs is checked
+    :param files: the inputs
+    :return: where to count the lines read in each input to report a line out of order,
+             None if the order is not checked or if the input holds records without line
+             (as :class:`grep_vcf.index.PositionIndex`)
+    :rtype: list of :class:`_LineCount` or None
+    """
+    return [_LineCount() if strict and not hasattr(file, 'records') else None for file in files]
+
+
+def _emitted(stats, lines):
+    """
+    :param stats: where to count the lines, or None
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param lines: the lines selected by a merge
+    :return: the lines counted by *stats*, or unchanged if *stats* is None
+    :rtype: iterator
+    """
+    return lines if stats is None else stats.lines(lines)
+
+
+def _check_order(what, previous, pos, count):
+    """
+    :param str what: the name of the stream
+    :param int previous: the previous position of the stream
+    :param int pos: the position just read
+    :param count: the lines read in the stream, or None if they are not counted
+    :type count: :class:`_LineCount` object
+    :raise ValueError: if *pos* is lower than *previous*
+    """
+    if pos < previous:
+        if count is None:
+            raise ValueError(f"{what} is not sorted: the position {pos} comes after the position {previous}")
+        raise ValueError(f"{what} is not sorted: the line {count.number} (position {pos}) "
+                         f"comes after the position {previous}")
+
+
+def _merge(ref_records, target_records, invert=False, strict=False, ref_lines=None, target_lines=None):
+    """
+    The merge engine shared by all generators.
+    Walk through the two streams of records at the same time and yield the lines of the target
+    which position appear (or not if *invert* is True) in the reference.
 
     .. _warning:
-        the position in the text_file and target_file must be sorted (ascending)
+        the records of both streams must be sorted by position (ascending)
 
-    :param ref_file: the text file to extract
-    :type ref_file: file object
-    :param target_file: the vcf to compare
-    :type target_file: file object
-    :return: a generator
+    In *strict* mode each position read is compared to the previous one of its stream,
+    and the first record out of order raises a ValueError with the number of its line.
+    Only the records read by the merge are checked: when a stream is exhausted, the rest of the other one
+    is not read (except the rest of the target with *invert*, as its lines are yielded).
+
+    :param ref_records: the records of the reference
+    :type ref_records: iterator of tuple (position, line)
+    :param target_records: the records of the target
+    :type target_records: iterator of tuple (position, line)
+    :param bool invert: yield the lines which do not match instead of the matching ones.
+    :param bool strict: check that both streams are sorted.
+    :param ref_lines: the lines read in the reference, to report the number of a line out of order
+    :type ref_lines: :class:`_LineCount` object
+    :param target_lines: the lines read in the target, to report the number of a line out of order
+    :type target_lines: :class:`_LineCount` object
+    :return: a generator on the selected lines of the target
     :rtype: generator
+    :raise ValueError: when a record can not be parsed, or in strict mode when a stream is not sorted
     """
     try:
-        ref_pos, _ = _parse_line(ref_file)
+        ref_pos, _ = next(ref_records)
         ref_end = False
     except StopIteration:
         ref_end = True
     except ValueError as err:
         raise ValueError(f"position file has wrong format: {err}") from None
     try:
-        target_pos, line = _parse_line(target_file)
-        target_end = False
+        target_pos, line = next(target_records)
     except StopIteration:
-        target_end = True
+        return
     except ValueError as err:
         raise ValueError(f"vcf has wrong format: {err}") from None
 
-    # treat limit cases
-    # when a file or both are empty
-    if target_end or ref_end:
-        return
-    else:
-        while True:
+    while not ref_end:
+        if ref_pos == target_pos:
+            if not invert:
+                yield line
+            previous = target_pos
+            try:
+                target_pos, line = next(target_records)
+            except StopIteration:
+                return
+            except ValueError as err:
+                raise ValueError(f"vcf has wrong line: {err}") from None
+            if strict:
+                _check_order('vcf', previous, target_pos, target_lines)
+            try:
+                ref_pos, _ = next(ref_records)
+            except StopIteration:
+                ref_end = True
+            except ValueError as err:
+                raise ValueError(f"position file has wrong format: {err}") from None
+            if strict and not ref_end:
+                _check_order('position file', previous, ref_pos, ref_lines)
+        elif ref_pos > target_pos:
+            if invert:
+                yield line
+            previous = target_pos
+            try:
+                target_pos, line = next(target_records)
+            except StopIteration:
+                return
+            except ValueError as err:
+                raise ValueError(f"vcf has wrong line: {err}") from None
+            if strict:
+                _check_order('vcf', previous, target_pos, target_lines)
+        else:  # ref_pos < target_pos
+            previous = ref_pos
+            try:
+                ref_pos, _ = next(ref_records)
+            except StopIteration:
+                ref_end = True
+            except ValueError as err:
+                raise ValueError(f"position file has wrong format: {err}") from None
+            if strict and not ref_end:
+                _check_order('position file', previous, ref_pos, ref_lines)
+
+    # the reference is exhausted
+    # no more line can match
+    if invert:
+        yield line
+        if strict:
+            previous = target_pos
             try:
-                if ref_pos == target_pos:
+                for target_pos, line in target_records:
+                    _check_order('vcf', previous, target_pos, target_lines)
+                    previous = target_pos
                     yield line
-                    try:
-                        target_pos, line = _parse_line(target_file)
-                    except ValueError as err:
-                        raise ValueError(f"vcf has wrong line: {err}") from None
-                    try:
-                        ref_pos, _ = _parse_line(ref_file)
-                    except ValueError as err:
-                        raise ValueError(f"position file has wrong format: {err}") from None
-                elif ref_pos > target_pos:
-                    try:
-                        target_pos, line = _parse_line(target_file)
-                    except ValueError as err:
-                        raise ValueError(f"vcf has wrong line: {err}") from None
-                else:  # ref_pos < target_pos
-                    try:
-                        ref_pos, _ = _parse_line(ref_file)
-                    except ValueError as err:
-                        raise ValueError(f"position file has wrong format: {err}") from None
+            except ValueError as err:
+                if str(err).startswith('vcf is not sorted'):
+                    raise
+                raise ValueError(f"vcf has wrong line: {err}") from None
+            return
+        try:
+            for _, line in target_records:
+                yield line
+        except ValueError as err:
+            raise ValueError(f"vcf has wrong line: {err}") from None
+
+
+class _BlockFilter:
+    """
+    The merge of :func:`_merge` on a target given block by block: each block of complete lines
+    is filtered at once and the lines selected are returned joined.
+    The lines selected, the order checks and the errors are the ones of :func:`_merge`
+    on the records of the blocks. The compiled version does not make any python object
+    for the lines of the target.
+    """
+
+    def __init__(self, ref_records, invert=False, strict=False, ref_lines=None, target_lines=None):
+        """
+        :param ref_records: the records of the reference
+        :type ref_records: iterator of tuple (position, line)
+        :param bool invert: select the lines which do not match instead of the matching ones.
+        :param bool strict: check that the reference and the target are sorted.
+        :param ref_lines: the lines read in the reference, to report the number of a line out of order
+        :type ref_lines: :class:`_LineCount` object
+        :param target_lines: where to count the lines of the target, to report the number of a line out of order
+        :type target_lines: :class:`_LineCount` object
+        """
+        self._ref_records = iter(ref_records)
+        self._invert = invert
+        self._strict = strict
+        self._ref_lines = ref_lines
+        self._target_lines = target_lines
+        self._started = False
+        self._ref_end = False
+        self._ref_pos = None
+        self._target_pos = None
+        # the target matched the reference, which is advanced after the next target record
+        self._advance_ref = False
+        #: True when the next blocks cannot hold any line selected, they do not need to be read
+        self.done = False
+
+    def _next_ref(self):
+        """
+        Advance the reference.
+
+        :raise ValueError: when the reference can not be parsed or is not sorted in strict mode
+        """
+        try:
+            pos, _ = next(self._ref_records)
+        except StopIteration:
+            self._ref_end = True
+            return
+        except ValueError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+        if self._strict and self._ref_pos is not None:
+            _check_order('position file', self._ref_pos, pos, self._ref_lines)
+        self._ref_pos = pos
+
+    def filter(self, block, end=None):
+        """
+        :param bytes block: the next block of the target
+        :param int end: the end of the lines of *block* to filter, by default the end of *block*
+        :return: the lines of the block selected
+        :rtype: bytes
+        :raise ValueError: when a position can not be parsed, or in strict mode when a file is not sorted
+        """
+        if not self._started:
+            # the reference is read first, as the merge does, even if the target is empty
+            self._started = True
+            self._next_ref()
+        selected = []
+        # the pure python scanner, the compiled filter replaces both
+        records = _py_scan_records(block, end=end, count=self._target_lines)
+        while not self.done:
+            try:
+                pos, line = next(records)
             except StopIteration:
                 break
+            except ValueError as err:
+                what = 'wrong format' if self._target_pos is None else 'wrong line'
+                raise ValueError(f"vcf has {what}: {err}") from None
+            if self._strict and self._target_pos is not None:
+                _check_order('vcf', self._target_pos, pos, self._target_lines)
+            self._target_pos = pos
+            if self._advance_ref:
+                self._advance_ref = False
+                self._next_ref()
+            while True:
+                if self._ref_end:
+                    # no more line can match
+                    if self._invert:
+                        selected.append(line)
+                    else:
+                        self.done = True
+                    break
+                if self._ref_pos == pos:
+                    if not self._invert:
+                        selected.append(line)
+                    self._advance_ref = True
+                    break
+                if self._ref_pos > pos:
+                    if self._invert:
+                        selected.append(line)
+                    break
+                self._next_ref()
+        return b''.join(selected)
+
+
+def _filtered_blocks(block_filter, file, read_size=_READ_SIZE):
+    """
+    :param block_filter: the filter of the target
+    :type block_filter: :class:`_BlockFilter` object
+    :param file: the target
+    :type file: file object opened in binary mode
+    :param int read_size: the number of bytes read at once
+    :return: the lines selected in each block of *file*, the line overlapping two blocks is carried over
+             to the next block. The blocks are not read anymore when no more line can be selected.
+    :rtype: generator of bytes
+    """
+    tail = b''
+    while not block_filter.done:
+        block = file.read(read_size)
+        if not block:
+            break
+        if tail:
+            block = tail + block
+        end = block.rfind(b'\n') + 1
+        yield block_filter.filter(block, end)
+        tail = block[end:]
+    if not block_filter.done:
+        # the last line without newline, or an empty target which starts the merge
+        yield block_filter.filter(tail)
+
+
+def _joined(chunks, size):
+    """
+    :param chunks: chunks of lines
+    :type chunks: iterable of bytes
+    :param int size: the size of the buffers
+    :return: the chunks joined in buffers of about *size* bytes
+    :rtype: generator of bytes
+    """
+    batch = []
+    batch_size = 0
+    for chunk in chunks:
+        if chunk:
+            batch.append(chunk)
+            batch_size += len(chunk)
+            if batch_size >= size:
+                yield b''.join(batch)
+                batch = []
+                batch_size = 0
+    if batch:
+        yield b''.join(batch)
+
+
+def match_generator(ref_file, target_file, stats=None, strict=False):
+    """
+    create a generator which can iterate over line in target_file
+    where position appear in reference file
+    the position are extract from the first column of ref_file and target_file.
+
+    .. _warning:
+        the position in the text_file and target_file must be sorted (ascending)
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object
+    :param stats: where to count the records, the lines selected and the time spent
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param bool strict: check that both files are sorted while they are merged (see :func:`_merge`)
+    :return: a generator
+    :rtype: generator
+    """
+    ref_lines, target_lines = _strict_counts(strict, ref_file, target_file)
+    ref_records = _parsed(stats, 'ref', ref_file, count=ref_lines)
+    target_records = _parsed(stats, 'target', target_file, _text_records, count=target_lines)
+    yield from _emitted(stats, _merge(ref_records, target_records, strict=strict,
+                                      ref_lines=ref_lines, target_lines=target_lines))
 
 
-def invert_match_generator(ref_file, target_file):
+def invert_match_generator(ref_file, target_file, stats=None, strict=False):
     """
     create a generator which can iterate over line in target_file
     where position not appear in reference file
@@ -138,71 +915,377 @@ def invert_match_generator(ref_file, target_file):
     .. _warning:
         the position in the text_file and target_file must be sorted (ascending)
 
-    :param ref_file: the text file to extract
-    :type ref_file: file object
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object or :class:`grep_vcf.index.PositionIndex` object
     :param target_file: the vcf to compare
     :type target_file: file object
+    :param stats: where to count the records, the lines selected and the time spent
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param bool strict: check that both files are sorted while they are merged (see :func:`_merge`)
     :return: a generator
     :rtype: generator
     """
+    ref_lines, target_lines = _strict_counts(strict, ref_file, target_file)
+    ref_records = _parsed(stats, 'ref', ref_file, count=ref_lines)
+    target_records = _parsed(stats, 'target', target_file, _text_records, count=target_lines)
+    yield from _emitted(stats, _merge(ref_records, target_records, invert=True, strict=strict,
+                                      ref_lines=ref_lines, target_lines=target_lines))
+
+
+def block_match_generator(ref_file, target_file, invert=False, block_size=BLOCK_SIZE,
+                          stats=None, strict=False):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    This is the byte level counterpart of :func:`match_generator` and :func:`invert_match_generator`:
+    the files are read by blocks of bytes, the lines are never decoded, each block of the target
+    is filtered at once (see :class:`_BlockFilter`), and the selected lines are joined in buffers
+    of about *block_size* bytes ready to be written at once.
+    The line ends are kept as they are in the file ('\\r\\n' too), so the lines selected are the ones
+    of :func:`match_generator` on the files opened in text mode with ``newline=''``.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int block_size: the size of the buffers yielded
+    :param stats: where to count the records, the lines selected and the time spent
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param bool strict: check that both files are sorted while they are merged (see :func:`_merge`)
+    :return: a generator on chunks of selected lines
+    :rtype: generator of bytes
+    """
+    ref_lines, target_lines = _strict_counts(strict, ref_file, target_file)
+    read_size = min(block_size, _READ_SIZE)
+    ref_records = _parsed(stats, 'ref', ref_file, _block_records, count=ref_lines, block_size=read_size)
+    if stats is None:
+        # the blocks of the target are filtered at once, its lines are not handled one by one
+        block_filter = _BlockFilter(ref_records, invert=invert, strict=strict,
+                                    ref_lines=ref_lines, target_lines=target_lines)
+        yield from _joined(_filtered_blocks(block_filter, target_file, read_size), block_size)
+        return
+    target_records = _parsed(stats, 'target', target_file, _block_records, count=target_lines,
+                             block_size=read_size)
+    lines = _emitted(stats, _merge(ref_records, target_records, invert=invert, strict=strict,
+                                   ref_lines=ref_lines, target_lines=target_lines))
+    for batch in _batches(lines, block_size):
+        yield b''.join(batch)
+
+
+def _batches(lines, batch_bytes):
+    """
+    Group lines in batches of about *batch_bytes* bytes.
+    The batches are cut by number of lines, which is adjusted after each batch to the mean size of its lines,
+    so the lines are never handled one by one in python.
+    The number of lines grows at most 8 times from one batch to the next,
+    so a batch cannot be much bigger than expected if the lines become wider.
+
+    :param lines: the lines to group
+    :type lines: iterator of str or bytes
+    :param int batch_bytes: the size of the batches
+    :return: the batches of lines
+    :rtype: generator of list
+    """
+    lines = iter(lines)
+    count = 1
+    while True:
+        batch = list(islice(lines, count))
+        if not batch:
+            return
+        yield batch
+        size = sum(map(len, batch))
+        count = max(1, min(batch_bytes * len(batch) // max(size, 1), 8 * len(batch)))
+
+
+def match_batches(ref_file, target_file, invert=False, batch_bytes=BLOCK_SIZE, stats=None, strict=False):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file,
+    by batches of about *batch_bytes* bytes of lines,
+    ready to be written at once with :meth:`writelines`.
+    The files can be opened in text mode (the lines are str) or in binary mode (the lines are bytes).
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int batch_bytes: the size of the batches
+    :param stats: where to count the records, the lines selected and the time spent
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param bool strict: check that both files are sorted while they are merged (see :func:`_merge`)
+    :return: a generator on the batches of selected lines
+    :rtype: generator of list of str or bytes
+    """
+    ref_lines, target_lines = _strict_counts(strict, ref_file, target_file)
+    ref_records = _parsed(stats, 'ref', ref_file, count=ref_lines)
+    target_records = _parsed(stats, 'target', target_file, count=target_lines)
+    lines = _emitted(stats, _merge(ref_records, target_records, invert=invert, strict=strict,
+                                   ref_lines=ref_lines, target_lines=target_lines))
+    yield from _batches(lines, batch_bytes)
+
+
+def mmap_match_generator(ref_file, target_file, invert=False, stats=None, strict=False):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    Both files are mapped in memory, the merge is performed directly on the mapped buffers,
+    and the selected lines are yielded as :class:`memoryview` slices of the target map,
+    so the lines are never copied nor decoded.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    .. note::
+        the maps are released when the last line yielded is garbage collected.
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param stats: where to count the records, the lines selected and the time spent
+    :type stats: :class:`grep_vcf.stats.Stats` object
+    :param bool strict: check that both files are sorted while they are merged (see :func:`_merge`)
+    :return: a generator on the selected lines
+    :rtype: generator of :class:`memoryview`
+    """
+    target_buf = _map(target_file)
+    ref_lines, target_lines = _strict_counts(strict, ref_file, target_file)
+    ref_records = _parsed(stats, 'ref', ref_file, _mapped_records, count=ref_lines)
+    target_records = _parsed(stats, 'target', target_buf, _view_records, count=target_lines)
+    yield from _emitted(stats, _merge(ref_records, target_records, invert=invert, strict=strict,
+                                      ref_lines=ref_lines, target_lines=target_lines))
+
+
+def skip_match_generator(ref_file, target_file, invert=False):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear in reference file.
+    The target is mapped in memory and, for each position of the reference,
+    the lines of the target with a lower position are skipped by an exponential search
+    on byte offsets (see :func:`_gallop`) instead of being parsed one by one.
+    This is much faster than the linear merge when the reference is sparse compared to the target.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    .. note::
+        With *invert* all the lines skipped must be yielded, so nothing can be skipped
+        and the linear merge of :func:`mmap_match_generator` is used.
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :return: a generator on the selected lines
+    :rtype: generator of :class:`memoryview`
+    """
+    if invert:
+        yield from mmap_match_generator(ref_file, target_file, invert=True)
+        return
+    target_buf = _map(target_file)
+    view = memoryview(target_buf)
+    offset = 0
+    ref_records = _records(ref_file, _mapped_records)
+    while True:
+        try:
+            ref_pos, _ = next(ref_records)
+        except StopIteration:
+            return
+        except ValueError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+        try:
+            offset = _gallop(target_buf, ref_pos, offset)
+            record = _next_record(target_buf, offset)
+        except ValueError as err:
+            raise ValueError(f"vcf has wrong format: {err}") from None
+        if record is None:
+            return
+        target_pos, start, stop = record
+        if target_pos == ref_pos:
+            yield view[start:stop]
+            offset = stop
+
+
+# the bytes which can end the first field of a line, as whitespaces for _FIRST_FIELD
+_FIELD_ENDS = b' \t\n\r\x0b\x0c'
+
+# the longest position parsed by the numpy engine, longer ones may overflow an int64
+_MAX_DIGITS = 18
+
+
+def _ref_array(ref_file):
+    """
+    :param ref_file: the reference, a file or an object which holds its positions
+                     as :class:`grep_vcf.index.PositionIndex`
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :return: the positions of the reference
+    :rtype: :class:`numpy.ndarray` of int64
+    :raise ValueError: when a position of the reference can not be parsed
+    """
+    positions = getattr(ref_file, 'positions', None)
+    if positions is not None:
+        return np.asarray(positions, dtype=np.int64)
     try:
-        ref_pos, _ = _parse_line(ref_file)
-        ref_end = False
-    except StopIteration:
-        ref_end = True
-    except ValueError as err:
-        raise ValueError(f"position file has wrong format: {err}")
-    try:
-        target_pos, line = _parse_line(target_file)
-        target_end = False
-    except StopIteration:
-        target_end = True
+        return np.fromiter((pos for pos, _ in _records(ref_file, _mapped_records)), dtype=np.int64)
     except ValueError as err:
-        raise ValueError(f"vcf has wrong format: {err}")
+        raise ValueError(f"position file has wrong format: {err}") from None
+
+
+def _array_records(data):
+    """
+    Parse all the lines of a chunk at once.
+    Only the regular lines are handled: a line must start with a digit, a '#' or be empty,
+    and the position must be ended by a whitespace. The irregular chunks are parsed by :func:`_scan_records`.
 
-    # treat limit cases
-    # when a file or both are empty
-    if target_end:
+    :param data: the chunk to parse, it must end at a line end or at the end of the file.
+    :type data: :class:`numpy.ndarray` of uint8
+    :return: the start and the stop offsets of each line, the mask of the data lines and their positions,
+             or None if the chunk is not regular.
+    :rtype: tuple (:class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`, :class:`numpy.ndarray`)
+    """
+    size = len(data)
+    stops = np.flatnonzero(data == 10) + 1
+    if not len(stops) or stops[-1] != size:
+        stops = np.append(stops, size)
+    starts = np.empty_like(stops)
+    starts[0] = 0
+    starts[1:] = stops[:-1]
+    first = data[starts]
+    is_data = (first - 48) < 10  # uint8 wrap around, so only the digits are lower than 10
+    if not np.all(is_data | (first == 35) | (first == 10)):
+        return None
+    offsets = starts[is_data]
+    positions = np.zeros(len(offsets), dtype=np.int64)
+    active = np.ones(len(offsets), dtype=bool)
+    ends = np.frombuffer(_FIELD_ENDS, dtype=np.uint8)
+    for _ in range(_MAX_DIGITS + 1):
+        in_chunk = offsets < size
+        chars = data[np.minimum(offsets, size - 1)]
+        digits = chars - 48
+        is_digit = active & in_chunk & (digits < 10)
+        ended = active & ~is_digit
+        if np.any(ended & in_chunk & ~np.isin(chars, ends)):
+            # as 12a or 1_000
+            return None
+        positions[is_digit] = positions[is_digit] * 10 + digits[is_digit]
+        active = is_digit
+        if not np.any(active):
+            return starts, stops, is_data, positions
+        offsets = offsets + 1
+    # a position too long
+    return None
+
+
+def _chunk_end(buf, start, chunk_size):
+    """
+    :param buf: the buffer to split in chunks
+    :type buf: bytes-like object
+    :param int start: the start of the chunk
+    :param int chunk_size: the size of the chunk
+    :return: the end of the first line which ends after *start* + *chunk_size*, or the end of the buffer.
+    :rtype: int
+    """
+    end = start + chunk_size
+    if end >= len(buf):
+        return len(buf)
+    return buf.find(b'\n', end - 1) + 1 or len(buf)
+
+
+def numpy_match_generator(ref_file, target_file, invert=False, chunk_size=BLOCK_SIZE):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    The target is mapped in memory and cut in chunks of about *chunk_size* bytes.
+    All the lines of a chunk are parsed at once and matched against the positions of the reference
+    with :func:`numpy.searchsorted`, the lines selected are the lines of a boolean mask over the line offsets.
+    The consecutive selected lines are yielded in one :class:`memoryview` slice of the target map.
+    As in the merge of the other generators, if a position is *n* times in the reference,
+    it matches the *n* first lines of the target with this position.
+
+    If numpy is not installed, it falls back on :func:`mmap_match_generator`.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int chunk_size: the size in bytes of the chunks parsed at once.
+    :return: a generator on the selected lines
+    :rtype: generator of :class:`memoryview`
+    """
+    if np is None:
+        yield from mmap_match_generator(ref_file, target_file, invert=invert)
         return
-    elif ref_end and not target_end:
-        yield line
-        for line in _until_the_end(target_file):
-            yield line
-    else:
-        while True:
-            if ref_pos == target_pos:
-                try:
-                    target_pos, line = _parse_line(target_file)
-                except StopIteration:
-                    target_end = True
-                except ValueError as err:
-                    raise ValueError(f"vcf has wrong line: {err}") from None
-                try:
-                    ref_pos, _ = _parse_line(ref_file)
-                except StopIteration:
-                    ref_end = True
-                except ValueError as err:
-                    raise ValueError(f"position file has wrong format: {err}") from None
-            elif ref_pos > target_pos:
-                yield line
-                try:
-                    target_pos, line = _parse_line(target_file)
-                except StopIteration:
-                    target_end = True
-                except ValueError as err:
-                    raise ValueError(f"vcf has wrong line: {err}") from None
-            else:  # ref_pos < target_pos
-                try:
-                    ref_pos, _ = _parse_line(ref_file)
-                except StopIteration:
-                    ref_end = True
-                except ValueError as err:
-                    raise ValueError(f"position file has wrong format: {err}") from None
-            if target_end:
-                break
-            elif ref_end:  # and not target_end
-                yield line
-                for line in _until_the_end(target_file):
-                    yield line
-                break
+    ref = _ref_array(ref_file)
+    target_buf = _map(target_file)
+    view = memoryview(target_buf)
+    # the last position of the previous chunk and the number of lines with this position
+    last_pos, last_count = None, 0
+    start = 0
+    while start < len(target_buf):
+        if not invert and (not len(ref) or (last_pos is not None and last_pos > ref[-1])):
+            # no more line can match
+            return
+        end = _chunk_end(target_buf, start, chunk_size)
+        records = _array_records(np.frombuffer(view[start:end], dtype=np.uint8))
+        if records is None:
+            # let the pure python parser deal with this chunk, and raise the right error
+            try:
+                chunk = list(_scan_records(target_buf, start, end, view=_Offsets()))
+            except ValueError as err:
+                raise ValueError(f"vcf has wrong line: {err}") from None
+            for pos, (line_start, line_stop) in chunk:
+                last_count = last_count + 1 if pos == last_pos else 1
+                last_pos = pos
+                count = np.searchsorted(ref, pos, 'right') - np.searchsorted(ref, pos, 'left')
+                if (last_count <= count) != invert:
+                    yield view[line_start:line_stop]
+            start = end
+            continue
+        starts, stops, is_data, positions = records
+        if len(positions):
+            counts = np.searchsorted(ref, positions, 'right') - np.searchsorted(ref, positions, 'left')
+            # the rank of each line among the lines with the same position
+            ranks = np.arange(len(positions)) - np.searchsorted(positions, positions, 'left')
+            if positions[0] == last_pos:
+                ranks[positions == last_pos] += last_count
+            selected = (ranks < counts) != invert
+            lines = np.zeros(len(starts), dtype=bool)
+            lines[is_data] = selected
+            # the runs of consecutive lines selected
+            edges = np.diff(lines.astype(np.int8), prepend=0, append=0)
+            first_lines = np.flatnonzero(edges == 1)
+            last_lines = np.flatnonzero(edges == -1) - 1
+            for line_start, line_stop in zip(starts[first_lines].tolist(), stops[last_lines].tolist()):
+                yield view[start + line_start:start + line_stop]
+            if positions[-1] != last_pos:
+                # the run of the previous chunk is over
+                last_pos, last_count = positions[-1], 0
+            last_count += int(np.count_nonzero(positions == last_pos))
+        start = end
+
+
+# the pure python kernel, always available
+_py_merge, _py_scan_records, _py_text_records, _PyLineCount = _merge, _scan_records, _text_records, _LineCount
+_PyBlockFilter = _BlockFilter
 
+if _speedups is not None:
+    # the compiled kernel replaces the pure python one in all generators
+    _merge = _speedups.merge
+    _scan_records = _speedups.scan_records
+    _text_records = _speedups.text_records
+    _LineCount = _speedups.LineCount
+    _BlockFilter = _speedups.BlockFilter
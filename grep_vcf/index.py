@@ -0,0 +1,154 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import sys
+import zlib
+import struct
+from array import array
+from itertools import repeat
+
+import grep_vcf.grep_vcf as gv
+from grep_vcf.bgzf import open_input
+
+INDEX_SUFFIX = '.gvi'
+"""The suffix of the index file, added to the path of the position file."""
+
+_MAGIC = b'GVCFIDX1'
+# magic, number of positions, size and mtime (in ns) of the position file, crc32 of the positions
+_HEADER = struct.Struct('<8sQQqI4x')
+
+
+class PositionIndex:
+    """
+    The positions of a position file, compiled in a sorted array of unsigned 64 bits integers.
+    A PositionIndex can be used instead of the position file as reference in the generators
+    of :mod:`grep_vcf.grep_vcf`.
+    """
+
+    def __init__(self, positions):
+        """
+        :param positions: the sorted positions
+        :type positions: sequence of int (:class:`array.array` or :class:`memoryview` of 'Q')
+        """
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def records(self):
+        """
+        :return: the records of the index, as expected by the merge engine.
+                 The lines of the position file are not kept so the line of each record is None.
+        :rtype: iterator of tuple (int, None)
+        """
+        return zip(self.positions, repeat(None))
+
+
+def index_path(positions_path):
+    """
+    :param str positions_path: the path of the position file
+    :return: the path of the index of the position file
+    :rtype: str
+    """
+    return positions_path + INDEX_SUFFIX
+
+
+def compile_index(positions_path, path=None):
+    """
+    Parse a sorted position file and save its positions in a binary index.
+    The index is made of a header followed by the positions, in the order of the file,
+    stored as little endian unsigned 64 bits integers.
+    The header keep the size and the modification time of the position file,
+    to detect if the index is out of date, and a checksum of the positions.
+    An unsorted position file is rejected, so the index gives the same result than the file.
+
+    :param str positions_path: the path of the position file to compile
+    :param str path: the path of the index, by default the positions_path + '.gvi'
+    :return: the path of the index
+    :rtype: str
+    :raise ValueError: if a position cannot be parsed, is negative or if the positions are not sorted
+    """
+    path = index_path(positions_path) if path is None else path
+    stat = os.stat(positions_path)
+    positions = array('Q')
+    count = gv._LineCount()
+    previous = 0
+    with open_input(positions_path, 'rb') as positions_file:
+        try:
+            for pos, _ in gv._block_records(positions_file, count=count):
+                gv._check_order(positions_path, previous, pos, count)
+                positions.append(pos)
+                previous = pos
+        except OverflowError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+    if sys.byteorder != 'little':
+        positions.byteswap()
+    data = positions.tobytes()
+    header = _HEADER.pack(_MAGIC, len(positions), stat.st_size, stat.st_mtime_ns, zlib.crc32(data))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as index_file:
+        index_file.write(header)
+        index_file.write(data)
+    # the index appear atomically
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_index(positions_path, path=None, verify=False):
+    """
+    Load the index of a position file without parsing anything.
+    The positions are mapped in memory from the index file.
+
+    :param str positions_path: the path of the position file
+    :param str path: the path of the index, by default the positions_path + '.gvi'
+    :param bool verify: check the positions against the checksum of the index,
+                        this reads the whole index so it is not done by default.
+    :return: the index, or None if the index does not exist,
+             is out of date compared to the position file or is corrupted.
+    :rtype: :class:`PositionIndex` object or None
+    """
+    path = index_path(positions_path) if path is None else path
+    try:
+        stat = os.stat(positions_path)
+        with open(path, 'rb') as index_file:
+            buf = gv._map(index_file)
+    except OSError:
+        return None
+    if len(buf) < _HEADER.size:
+        return None
+    magic, count, size, mtime_ns, checksum = _HEADER.unpack_from(buf)
+    data = memoryview(buf)[_HEADER.size:]
+    if (magic != _MAGIC or
+            (size, mtime_ns) != (stat.st_size, stat.st_mtime_ns) or
+            len(data) != count * 8 or
+            (verify and zlib.crc32(data) != checksum)):
+        return None
+    if sys.byteorder == 'little':
+        positions = data.cast('Q')
+    else:
+        positions = array('Q')
+        positions.frombytes(data)
+        positions.byteswap()
+    return PositionIndex(positions)
@@ -0,0 +1,151 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import sys
+from array import array
+from bisect import bisect_left
+
+import grep_vcf.grep_vcf as gv
+
+
+class IntervalPanel:
+    """
+    A panel of regions. The intervals are sorted and merged when they overlap or touch,
+    so they are held in two compact arrays of starts and ends
+    and any position is in at most one of them.
+    """
+
+    def __init__(self, intervals):
+        """
+        :param intervals: the intervals of the panel, the start and the end are both included.
+                          They can be in any order and overlap.
+        :type intervals: iterable of tuple (int start, int end)
+        :raise ValueError: if the end of an interval is lower than its start
+        """
+        self.starts = array('q')
+        self.ends = array('q')
+        for start, end in sorted(intervals):
+            if end < start:
+                raise ValueError(f"the interval {start} {end} ends before its start")
+            if self.ends and start <= self.ends[-1] + 1:
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def from_file(cls, intervals_file):
+        """
+        Parse a file of intervals: the two first columns of each line are the start and the end
+        of the interval (both included), a line with a single column is an interval of one position.
+        Lines starting with '#' are comments.
+
+        :param intervals_file: the file to parse
+        :type intervals_file: file object opened in text or binary mode
+        :return: the panel
+        :rtype: :class:`IntervalPanel` object
+        :raise ValueError: if an interval cannot be parsed
+        """
+        try:
+            return cls(_parse_interval(pos, line) for pos, line in gv._records(intervals_file))
+        except ValueError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, pos):
+        i = bisect_left(self.ends, pos)
+        return i < len(self.ends) and self.starts[i] <= pos
+
+    @property
+    def nbytes(self):
+        """
+        The memory used by the intervals.
+        """
+        return sys.getsizeof(self.starts) + sys.getsizeof(self.ends)
+
+
+def _parse_interval(start, line):
+    """
+    :param int start: the first column of the line already parsed
+    :param line: the line
+    :type line: str or bytes
+    :return: the start and the end of the interval
+    :rtype: tuple (int, int)
+    :raise ValueError: if the second column is not an integer
+    """
+    fields = line.split(None, 2)
+    if len(fields) < 2:
+        return start, start
+    try:
+        return start, int(fields[1])
+    except ValueError as err:
+        if isinstance(line, bytes):
+            # the message of a binary line is the one of a text line, as _parse_line does
+            line = line.decode(errors='replace')
+            err = f"invalid literal for int() with base 10: {fields[1].decode(errors='replace')!r}"
+        line = line.rstrip()
+        raise ValueError(f"{line}: {err}") from None
+
+
+def interval_match_generator(ref_file, target_file, invert=False, panel=None):
+    """
+    create a generator which can iterate over the lines of target_file
+    which position is in (or not if *invert* is True) an interval of the reference.
+    The target is swept with a cursor on the intervals which only moves forward while the positions
+    are ascending, so each line is tested in constant amortized time.
+    A position lower than the previous one is located by a binary search,
+    so the target does not need to be sorted.
+
+    :param ref_file: the intervals
+    :type ref_file: file object opened in text or binary mode
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in text or binary mode
+    :param bool invert: select the lines which are out of the intervals instead of the ones inside.
+    :param panel: the intervals if they are already loaded, in this case ref_file is not read.
+    :type panel: :class:`IntervalPanel` object
+    :return: a generator on the selected lines
+    :rtype: generator
+    :raise ValueError: if an interval or a position of the target cannot be parsed
+    """
+    if panel is None:
+        panel = IntervalPanel.from_file(ref_file)
+    starts, ends = panel.starts, panel.ends
+    size = len(ends)
+    i = 0
+    previous = None
+    try:
+        for pos, line in gv._records(target_file):
+            if previous is not None and pos < previous:
+                i = bisect_left(ends, pos)
+            else:
+                while i < size and ends[i] < pos:
+                    i += 1
+            previous = pos
+            if (i < size and starts[i] <= pos) is not invert:
+                yield line
+    except ValueError as err:
+        raise ValueError(f"vcf has wrong format: {err}") from None
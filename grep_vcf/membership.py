@@ -0,0 +1,141 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import sys
+from array import array
+
+import grep_vcf.grep_vcf as gv
+
+
+class PositionSet:
+    """
+    A membership structure on positions which does not require any order.
+    The positions are stored in a bitset over the range of the positions when it is dense enough,
+    otherwise in a python set. The most compact of the two is chosen.
+    """
+
+    def __init__(self, positions):
+        """
+        :param positions: the positions to store
+        :type positions: sequence of int
+        """
+        self.count = len(positions)
+        self.low = min(positions) if positions else 0
+        high = max(positions) if positions else -1
+        bitset_size = (high - self.low) // 8 + 1
+        # in a set each position costs about 2 hash table entries of 16 bytes plus an int object
+        set_size = self.count * (2 * 16 + 28)
+        if bitset_size <= set_size:
+            self.kind = 'bitset'
+            self._bits = bytearray(bitset_size)
+            bits = self._bits
+            low = self.low
+            for pos in positions:
+                offset = pos - low
+                bits[offset >> 3] |= 1 << (offset & 7)
+            self.nbytes = sys.getsizeof(self._bits)
+        else:
+            self.kind = 'set'
+            self._set = set(positions)
+            self.nbytes = sys.getsizeof(self._set) + sum(sys.getsizeof(pos) for pos in self._set)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, pos):
+        if self.kind == 'set':
+            return pos in self._set
+        offset = pos - self.low
+        if offset < 0 or offset >> 3 >= len(self._bits):
+            return False
+        return bool(self._bits[offset >> 3] & (1 << (offset & 7)))
+
+
+def load_position_set(ref_file):
+    """
+    Parse the reference and load all its positions in a :class:`PositionSet`.
+
+    :param ref_file: the reference file
+    :type ref_file: file object opened in text or binary mode,
+                    or :class:`grep_vcf.index.PositionIndex` object
+    :return: the positions of the reference
+    :rtype: :class:`PositionSet` object
+    :raise ValueError: if a position cannot be parsed
+    """
+    try:
+        positions = array('q', (pos for pos, _ in gv._records(ref_file)))
+    except ValueError as err:
+        raise ValueError(f"position file has wrong format: {err}") from None
+    return PositionSet(positions)
+
+
+def is_sorted(file):
+    """
+    :param file: the file to check
+    :type file: file object opened in text or binary mode
+    :return: True if the positions of the file are sorted in ascending order, False otherwise.
+    :rtype: bool
+    :raise ValueError: if a position cannot be parsed
+    """
+    previous = None
+    for pos, _ in gv._records(file):
+        if previous is not None and pos < previous:
+            return False
+        previous = pos
+    return True
+
+
+def membership_match_generator(ref_file, target_file, invert=False, positions=None):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    Unlike :func:`grep_vcf.grep_vcf.match_generator` the files do not need to be sorted:
+    the positions of the reference are loaded in memory and the target is streamed in one pass.
+
+    .. note::
+        Each line of the target is tested independently, so all lines of the target
+        sharing a position of the reference are selected,
+        whereas the sorted merge pairs them one to one with the lines of the reference.
+
+    :param ref_file: the text file to extract
+    :type ref_file: file object opened in text or binary mode,
+                    or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in text or binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param positions: the positions of the reference if they are already loaded,
+                      in this case ref_file is not read.
+    :type positions: :class:`PositionSet` object
+    :return: a generator on the selected lines
+    :rtype: generator
+    """
+    if positions is None:
+        positions = load_position_set(ref_file)
+    contains = positions.__contains__
+    try:
+        for pos, line in gv._records(target_file):
+            if contains(pos) is not invert:
+                yield line
+    except ValueError as err:
+        raise ValueError(f"vcf has wrong format: {err}") from None
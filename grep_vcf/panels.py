@@ -0,0 +1,152 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import heapq
+
+import grep_vcf.grep_vcf as gv
+
+
+def _next_position(records):
+    """
+    :param records: the records of a panel
+    :type records: iterator of tuple (position, line)
+    :return: the next position of the panel or None if the panel is exhausted.
+    :rtype: int
+    :raise ValueError: when a position of the panel can not be parsed
+    """
+    try:
+        pos, _ = next(records)
+    except StopIteration:
+        return None
+    except ValueError as err:
+        raise ValueError(f"position file has wrong format: {err}") from None
+    return pos
+
+
+def fan_out_generator(ref_files, target_file, invert=False):
+    """
+    Merge the target with several references at the same time, so the target is read only once
+    whatever the number of references.
+    The cursors of the references are held in a heap ordered by their current position,
+    so a target line is compared only to the references which can match it.
+
+    .. _warning:
+        the target and all the references must be sorted by position (ascending)
+
+    :param ref_files: the references (the panels)
+    :type ref_files: list of file objects opened in text or binary mode or of :class:`PositionFilter` objects
+    :param target_file: the file to filter
+    :type target_file: file object opened in text or binary mode
+    :param bool invert: select for each reference the lines which do not match instead of the matching ones.
+    :return: each selected line of the target and the indices in *ref_files* of the references which select it.
+    :rtype: generator of tuple (line, tuple of int)
+    :raise ValueError: when a record can not be parsed
+    """
+    refs = [gv._records(ref_file) for ref_file in ref_files]
+    all_refs = tuple(range(len(refs)))
+    heap = []
+    for i, records in enumerate(refs):
+        pos = _next_position(records)
+        if pos is not None:
+            heap.append((pos, i))
+    heapq.heapify(heap)
+    target_records = gv._records(target_file)
+
+    while True:
+        try:
+            target_pos, line = next(target_records)
+        except StopIteration:
+            return
+        except ValueError as err:
+            raise ValueError(f"vcf has wrong line: {err}") from None
+        if not heap:
+            # all the references are exhausted
+            # no more line can match
+            if invert:
+                yield line, all_refs
+                try:
+                    for _, line in target_records:
+                        yield line, all_refs
+                except ValueError as err:
+                    raise ValueError(f"vcf has wrong line: {err}") from None
+            return
+        # the references behind the target cannot match this line
+        while heap and heap[0][0] < target_pos:
+            i = heap[0][1]
+            pos = _next_position(refs[i])
+            if pos is None:
+                heapq.heappop(heap)
+            else:
+                heapq.heapreplace(heap, (pos, i))
+        if heap and heap[0][0] == target_pos:
+            matched = []
+            while heap and heap[0][0] == target_pos:
+                matched.append(heapq.heappop(heap)[1])
+            # as in the merge of two files, a matching position of a reference is consumed by the line
+            for i in matched:
+                pos = _next_position(refs[i])
+                if pos is not None:
+                    heapq.heappush(heap, (pos, i))
+            if invert:
+                selected = tuple(i for i in all_refs if i not in matched)
+                if selected:
+                    yield line, selected
+            else:
+                matched.sort()
+                yield line, tuple(matched)
+        elif invert:
+            yield line, all_refs
+
+
+def fan_out(ref_files, target_file, outs, invert=False, header=False):
+    """
+    Filter the target with several references in one pass,
+    and write the lines selected by each reference in its own output.
+
+    :param ref_files: the references (the panels)
+    :type ref_files: list of file objects opened in text or binary mode or of :class:`PositionFilter` objects
+    :param target_file: the file to filter
+    :type target_file: file object opened in text or binary mode
+    :param outs: the output of each reference
+    :type outs: list of file objects
+    :param bool invert: select for each reference the lines which do not match instead of the matching ones.
+    :param bool header: copy the header of the target in each output before the lines selected
+                        (see :func:`grep_vcf.grep_vcf.read_header`).
+    :return: the number of lines selected in each output (the header is not counted)
+    :rtype: list of int
+    """
+    if header:
+        data = gv.read_header(target_file)
+        if data:
+            for out in outs:
+                gv._binary_writer(out)(data)
+    counts = [0] * len(outs)
+    writes = None
+    for line, selected in fan_out_generator(ref_files, target_file, invert=invert):
+        if writes is None:
+            writes = [out.write if isinstance(line, str) else gv._binary_writer(out) for out in outs]
+        for i in selected:
+            writes[i](line)
+            counts[i] += 1
+    return counts
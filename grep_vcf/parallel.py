@@ -0,0 +1,126 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import multiprocessing
+from functools import partial
+
+import grep_vcf.grep_vcf as gv
+
+CHUNK_SIZE = 64 * 1024 * 1024
+"""The default size (in bytes) of the chunks of the target file dispatched to the workers."""
+
+# the maps of the files, one per worker process
+_ref_buf = None
+_target_buf = None
+
+
+def _chunk_bounds(buf, chunk_size=CHUNK_SIZE):
+    """
+    Split a buffer in chunks of about *chunk_size* bytes.
+    The chunks are aligned on line boundaries and never split a run of lines with the same position,
+    so that each chunk can be merged independently of the others.
+
+    :param buf: the buffer to split
+    :type buf: bytes-like object
+    :param int chunk_size: the size of the chunks
+    :return: the start and stop offsets of each chunk
+    :rtype: list of tuple (int, int)
+    """
+    bounds = []
+    start = 0
+    size = len(buf)
+    while start < size:
+        end = gv._line_start(buf, start + chunk_size)
+        previous = gv._previous_record(buf, end)
+        if previous is not None:
+            record = gv._next_record(buf, end)
+            while record is not None and record[0] == previous[0]:
+                end = record[2]
+                record = gv._next_record(buf, end)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _init_worker(ref_path, target_path):
+    """
+    Map the files once in each worker process.
+
+    :param str ref_path: the path to the reference file
+    :param str target_path: the path to the target file
+    """
+    global _ref_buf, _target_buf
+    with open(ref_path, 'rb') as ref_file, open(target_path, 'rb') as target_file:
+        _ref_buf = gv._map(ref_file)
+        _target_buf = gv._map(target_file)
+
+
+def _filter_chunk(bounds, invert=False):
+    """
+    Merge a chunk of the target against the part of the reference which can match it.
+    The reference is searched by dichotomy for the first position of the chunk.
+
+    :param bounds: the start and stop offsets of the chunk in the target
+    :type bounds: tuple (int, int)
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :return: the lines selected in this chunk
+    :rtype: bytes
+    """
+    start, end = bounds
+    first = gv._next_record(_target_buf, start, end)
+    if first is None:
+        return b''
+    ref_start = gv._bisect_records(_ref_buf, first[0])
+    lines = gv._merge(gv._scan_records(_ref_buf, ref_start),
+                      gv._scan_records(_target_buf, first[1], end, view=memoryview(_target_buf)),
+                      invert=invert)
+    return b''.join(lines)
+
+
+def parallel_match_generator(ref_path, target_path, invert=False, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    create a generator which can iterate over the lines of target file
+    where position appear (or not if *invert* is True) in reference file.
+    The target is split in chunks aligned on line boundaries which are merged in parallel
+    by a pool of worker processes. The results are yielded in the order of the target,
+    so the output is the same as the one of :func:`grep_vcf.grep_vcf.match_generator`
+    or :func:`grep_vcf.grep_vcf.invert_match_generator`.
+
+    .. _warning:
+        the position in the reference and target files must be sorted (ascending)
+
+    :param str ref_path: the path to the text file to extract
+    :param str target_path: the path to the vcf to compare
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int processes: the number of worker processes, by default the number of cpus.
+    :param int chunk_size: the size in bytes of the chunks of target
+    :return: a generator on the selected lines of each chunk
+    :rtype: generator of bytes
+    """
+    with open(target_path, 'rb') as target_file:
+        bounds = _chunk_bounds(gv._map(target_file), chunk_size=chunk_size)
+    if not bounds:
+        return
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(ref_path, target_path)) as pool:
+        yield from pool.imap(partial(_filter_chunk, invert=invert), bounds)
@@ -0,0 +1,190 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+from array import array
+from functools import partial
+from itertools import repeat
+from multiprocessing import Pool
+
+import grep_vcf.grep_vcf as gv
+from grep_vcf.bgzf import open_input
+from grep_vcf.index import load_index
+
+
+class PositionFilter:
+    """
+    A position panel loaded and compiled once, to filter many vcf in the same process.
+    The positions are held in a compact array, so filtering a new vcf does not parse the panel again::
+
+        panel = PositionFilter.from_file('panel.txt')
+        for vcf_path in vcf_paths:
+            with open(vcf_path + '.filtered', 'wb') as out:
+                panel.filter(vcf_path, out)
+
+    A PositionFilter can also be used as reference in the generators of :mod:`grep_vcf.grep_vcf`.
+    """
+
+    def __init__(self, positions):
+        """
+        :param positions: the positions of the panel sorted in ascending order
+        :type positions: iterable of int
+        """
+        self.positions = positions if isinstance(positions, (array, memoryview)) else array('q', positions)
+
+    @classmethod
+    def from_file(cls, positions_file):
+        """
+        Load a position panel. If an up to date index of the panel exists (see :mod:`grep_vcf.index`)
+        it is loaded without any parsing.
+
+        :param positions_file: the position file (it can be compressed) or its path
+        :type positions_file: str or file object
+        :return: the compiled panel
+        :rtype: :class:`PositionFilter` object
+        :raise ValueError: if a position cannot be parsed
+        """
+        if isinstance(positions_file, (str, os.PathLike)):
+            index = load_index(os.fspath(positions_file))
+            if index is not None:
+                return cls(index.positions)
+            with open_input(positions_file, 'rb') as positions:
+                return cls.from_file(positions)
+        try:
+            return cls(pos for pos, _ in gv._records(positions_file))
+        except ValueError as err:
+            raise ValueError(f"position file has wrong format: {err}") from None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def records(self):
+        """
+        :return: the records of the panel, as expected by the merge engine.
+        :rtype: iterator of tuple (int, None)
+        """
+        return zip(self.positions, repeat(None))
+
+    def lines(self, vcf, invert=False):
+        """
+        Iterate over the lines of a vcf which position appear (or not if *invert* is True) in the panel.
+
+        :param vcf: the vcf to filter (it can be compressed) or its path.
+        :type vcf: str or file object opened in text or binary mode
+        :param bool invert: select the lines which do not match instead of the matching ones.
+        :return: the lines selected, str if vcf is a file opened in text mode, bytes otherwise.
+        :rtype: generator
+        """
+        if isinstance(vcf, (str, os.PathLike)):
+            with open_input(vcf, 'rb') as vcf_file:
+                yield from self.lines(vcf_file, invert=invert)
+            return
+        yield from gv._merge(self.records(), gv._records(vcf), invert=invert)
+
+    def filter(self, vcf, out, invert=False, header=False):
+        """
+        Write the lines of a vcf which position appear (or not if *invert* is True) in the panel.
+
+        :param vcf: the vcf to filter (it can be compressed) or its path.
+        :type vcf: str or file object opened in text or binary mode
+        :param out: where to write the lines selected, a path or a file opened in text or binary mode.
+        :type out: str or file object
+        :param bool invert: select the lines which do not match instead of the matching ones.
+        :param bool header: copy the header of the vcf before the lines selected
+                            (see :func:`grep_vcf.grep_vcf.copy_header`).
+        :return: the number of lines selected (the header is not counted)
+        :rtype: int
+        """
+        if isinstance(out, (str, os.PathLike)):
+            with open(out, 'wb') as out_file:
+                return self.filter(vcf, out_file, invert=invert, header=header)
+        if isinstance(vcf, (str, os.PathLike)):
+            with open_input(vcf, 'rb') as vcf_file:
+                return self.filter(vcf_file, out, invert=invert, header=header)
+        if header:
+            gv.copy_header(vcf, out)
+        count = 0
+        write = None
+        for line in self.lines(vcf, invert=invert):
+            if write is None:
+                write = out.write if isinstance(line, str) else gv._binary_writer(out)
+            write(line)
+            count += 1
+        return count
+
+
+# the panel of a worker of batch_filter, set once by the pool initializer
+_worker_panel = None
+
+
+def _init_worker(positions):
+    """
+    Initialize a worker of :func:`batch_filter`, the panel is received once by worker and not once by vcf.
+
+    :param positions: the positions of the panel
+    :type positions: :class:`array.array` object
+    """
+    global _worker_panel
+    _worker_panel = PositionFilter(positions)
+
+
+def _filter_file(paths, invert=False, header=False):
+    """
+    Filter one vcf in a worker of :func:`batch_filter`.
+
+    :param paths: the path of the vcf to filter and the path of the output.
+    :type paths: tuple (str, str)
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param bool header: copy the header of the vcf before the lines selected.
+    :return: the path of the vcf, the path of the output and the number of lines selected.
+    :rtype: tuple (str, str, int)
+    """
+    vcf_path, out_path = paths
+    return vcf_path, out_path, _worker_panel.filter(vcf_path, out_path, invert=invert, header=header)
+
+
+def batch_filter(panel, paths, invert=False, processes=1, header=False):
+    """
+    Filter many vcf with the same panel. The vcf are filtered concurrently by a pool of *processes* workers,
+    so at most *processes* files are in flight at the same time.
+
+    :param panel: the panel used to filter all the vcf.
+    :type panel: :class:`PositionFilter` object
+    :param paths: the path of each vcf to filter and the path of its output.
+    :type paths: iterable of tuple (str, str)
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int processes: the number of worker processes.
+    :param bool header: copy the header of each vcf before the lines selected.
+    :return: the path of the vcf, the path of the output and the number of lines selected,
+             in the order the vcf are done.
+    :rtype: generator of tuple (str, str, int)
+    """
+    if processes == 1:
+        for vcf_path, out_path in paths:
+            yield vcf_path, out_path, panel.filter(vcf_path, out_path, invert=invert, header=header)
+        return
+    # a memoryview on a mapped index cannot be pickled
+    positions = panel.positions if isinstance(panel.positions, array) else array('q', panel.positions)
+    with Pool(processes, initializer=_init_worker, initargs=(positions,)) as pool:
+        yield from pool.imap_unordered(partial(_filter_file, invert=invert, header=header), paths)
@@ -25,8 +25,20 @@
 import sys
 import os
 import argparse
+from contextlib import ExitStack
 import grep_vcf
 import grep_vcf.grep_vcf as gv
+import grep_vcf.parallel as gv_parallel
+import grep_vcf.index as gv_index
+import grep_vcf.membership as gv_membership
+import grep_vcf.bgzf as gv_bgzf
+import grep_vcf.tabix as gv_tabix
+import grep_vcf.contigs as gv_contigs
+import grep_vcf.intervals as gv_intervals
+import grep_vcf.sort as gv_sort
+import grep_vcf.position_filter as gv_position_filter
+import grep_vcf.panels as gv_panels
+import grep_vcf.stats as gv_stats
 
 
 def get_version_message():
@@ -69,17 +81,37 @@ grep_vcf is a tiny tool to filter vcf file based on position file and vice et ve
 """)
 
     parser.add_argument("positions",
-                        help="The text file with the positions looking for in vcf file. "
+                        help="The text file with the positions looking for in vcf file "
+                             "('-' to read it on the standard input). "
                              "It must be a tsv file (https://en.wikipedia.org/wiki/Tab-separated_values)."
                              "where position are in first column."
                              "Lines starting with '#' are considering as comments.")
     parser.add_argument("--vcf",
-                        help="The path to the vcf file. By default grep_vcf search for the same path as position file"
-                             " but with '.vcf' as extension."
+                        action='append',
+                        help="The path to the vcf file ('-' to read it on the standard input). "
+                             "By default grep_vcf search for the same path as position file"
+                             " but with '.vcf' as extension. "
+                             "This option can be repeated to filter several vcf in batch in --out-dir."
                         )
+    parser.add_argument("--vcf-list",
+                        help="A file with the paths of the vcf to filter, one by line. "
+                             "The vcf are filtered in batch in --out-dir.")
+    parser.add_argument("--out-dir",
+                        help="Filter the vcf in batch: the position file is loaded once and each vcf is filtered "
+                             "in a file with the same name in this directory.")
+    parser.add_argument("--panel",
+                        action='append',
+                        help="An other position file. This option can be repeated. "
+                             "The vcf is read once and filtered with the position file and all the panels "
+                             "at the same time, the lines selected by each of them are written in --out-dir, "
+                             "in a file named after the position file or the panel with '.vcf' as extension.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="The number of vcf filtered at the same time in batch mode. default is 1.")
     parser.add_argument("--out",
                         default=sys.stdout,
-                        help="The path to an output file, default is stdout. "
+                        help="The path to an output file, default is stdout ('-'). "
                              "If the file exists, it will be replaced.")
     parser.add_argument("--invert", "-v",
                         action='store_true',
@@ -89,23 +121,368 @@ grep_vcf is a tiny tool to filter vcf file based on position file and vice et ve
                         action='store_true',
                         default=False,
                         help="Filter position file to keep lines that position match in vcf")
+    parser.add_argument("--header",
+                        action='store_true',
+                        default=False,
+                        help="Copy the header of the filtered file (the leading lines starting with '#') "
+                             "before the lines selected, so the output is a valid vcf.")
+    parser.add_argument("--stats",
+                        action='store_true',
+                        default=False,
+                        help="Report on the standard error, in JSON, the lines read on each input, "
+                             "the comment lines skipped, the lines selected, the size of the inputs and the bytes "
+                             "written, the time spent in parsing, merging and writing, the throughput and the peak "
+                             "memory.")
+    parser.add_argument("--strict",
+                        action='store_true',
+                        default=False,
+                        help="Check that the position and vcf files are sorted while they are merged, "
+                             "and stop on the first data line out of order, which is reported by its number. "
+                             "The merge stops when a file is exhausted, the rest of the other file is not checked.")
+    parser.add_argument("--engine",
+                        choices=('line', 'block', 'numpy'),
+                        default='line',
+                        help="The engine used to merge the files. "
+                             "'line' parses the files line by line in text mode, "
+                             "'block' reads the files by blocks of bytes and filters each block at once, "
+                             "it never decodes the lines (faster than 'line' with the compiled kernel). "
+                             "'numpy' maps the vcf in memory and parses and matches big chunks of lines at once "
+                             "with numpy (the fastest without the compiled kernel, "
+                             "it falls back on --mmap if numpy is not installed). "
+                             "default is 'line'.")
+    parser.add_argument("--mmap",
+                        action='store_true',
+                        default=False,
+                        help="Map the position and vcf files in memory and merge them directly on the mapped bytes."
+                             " The selected lines are written without any copy.")
+    parser.add_argument("--skip",
+                        action='store_true',
+                        default=False,
+                        help="Map the vcf in memory and jump over the vcf lines which cannot match "
+                             "by an exponential search instead of reading them. "
+                             "Much faster when there are few positions compared to the vcf lines. "
+                             "Not effective with --invert.")
+    parser.add_argument("--processes",
+                        type=int,
+                        default=1,
+                        help="The number of worker processes. If greater than 1, the vcf is split in chunks "
+                             "which are filtered in parallel. With --sort, it is the number of processes "
+                             "which sort the runs. default is 1.")
     parser.add_argument("--version", "-V",
                         action='version',
                         version=get_version_message(),
                         help="Display version information and quit."
                         )
+    parser.add_argument("--make-index",
+                        action='store_true',
+                        default=False,
+                        help="Compile the position file in a binary index (position file path + '.gvi'). "
+                             "The position file must be sorted. "
+                             "When an up to date index exists, it is loaded instead of parsing the position file.")
+    parser.add_argument("--unsorted",
+                        action='store_true',
+                        default=False,
+                        help="The files are not sorted by position. The positions of the position file are loaded "
+                             "in memory and the vcf is read in one pass. "
+                             "The order of the files is not checked without this option, use --strict to check it.")
+    parser.add_argument("--sort",
+                        action='store_true',
+                        default=False,
+                        help="Sort the position and vcf files by an external merge sort before merging them, "
+                             "for unsorted files bigger than the memory. Sorted runs are written in a temporary "
+                             "directory by --processes worker processes and their merge is streamed into the filter. "
+                             "The lines are written in the order of the positions.")
+    parser.add_argument("--sort-memory",
+                        type=int,
+                        help="The memory budget of --sort in MiB, shared by the worker processes. default is 1024.")
+    parser.add_argument("--tmpdir",
+                        help="The directory where --sort writes its runs. "
+                             "default is the temporary directory of the system.")
+    parser.add_argument("--intervals",
+                        action='store_true',
+                        default=False,
+                        help="The position file holds intervals: the two first columns are the start and the end "
+                             "(both included) of a region, a line with a single column is a single position. "
+                             "The intervals can overlap and do not need to be sorted, "
+                             "the vcf lines which position is in an interval are selected.")
+    parser.add_argument("--chrom",
+                        action='store_true',
+                        default=False,
+                        help="The two first columns of the position and vcf files are the contig and the position "
+                             "(as in a real vcf). The files are merged contig by contig, in the order of the "
+                             "'##contig' lines of the vcf header or of the --fai file.")
+    parser.add_argument("--fai",
+                        help="A fasta index (.fai) giving the order of the contigs for --chrom.")
+    parser.add_argument("--tabix",
+                        action='store_true',
+                        default=False,
+                        help="Use the tabix (.tbi) or csi index of the bgzf compressed vcf to decompress only "
+                             "the blocks which can hold the positions. The positions are read in the column "
+                             "given by the index (POS, the second column, for a real vcf) of its only sequence. "
+                             "Without --tabix, the index is not used.")
+    parser.add_argument("--threads",
+                        type=int,
+                        default=1,
+                        help="The number of threads which decompress the bgzf input files "
+                             "and compress the output with --bgzip. default is 1.")
+    parser.add_argument("--bgzip",
+                        action='store_true',
+                        default=False,
+                        help="Compress the output in bgzf format (as bgzip does).")
     parsed_args = parser.parse_args(args)
 
-    if parsed_args.vcf is None:
-        parsed_args.vcf = os.path.splitext(parsed_args.positions)[0] + '.vcf'
+    if parsed_args.processes < 1:
+        parser.error("--processes must be greater than 0")
+    if parsed_args.threads < 1:
+        parser.error("--threads must be greater than 0")
+    if parsed_args.jobs < 1:
+        parser.error("--jobs must be greater than 0")
+    if parsed_args.sort_memory is not None and parsed_args.sort_memory < 1:
+        parser.error("--sort-memory must be greater than 0")
 
-    for path in parsed_args.positions, parsed_args.vcf:
-        if not os.path.exists(path):
+    vcfs = parsed_args.vcf or []
+    if parsed_args.vcf_list:
+        with open(parsed_args.vcf_list) as vcf_list:
+            vcfs.extend(line.strip() for line in vcf_list if line.strip() and not line.startswith('#'))
+    if not vcfs:
+        if parsed_args.positions == gv_bgzf.STDIO:
+            parser.error("--vcf is required when the positions are read on the standard input.")
+        vcfs = [os.path.splitext(parsed_args.positions)[0] + '.vcf']
+    parsed_args.vcfs = vcfs
+    parsed_args.vcf = vcfs[0]
+    if parsed_args.out == gv_bgzf.STDIO:
+        parsed_args.out = sys.stdout
+
+    parsed_args.panels = [parsed_args.positions] + (parsed_args.panel or [])
+    for path in *parsed_args.panels, *parsed_args.vcfs:
+        if path != gv_bgzf.STDIO and not os.path.exists(path):
             raise FileNotFoundError(f"The file {path} does not exists.")
 
+    stdin = [path for path in (*parsed_args.panels, *parsed_args.vcfs) if path == gv_bgzf.STDIO]
+    if stdin:
+        if len(stdin) > 1:
+            parser.error("only one file can be read on the standard input.")
+        if parsed_args.mmap or parsed_args.skip or (parsed_args.processes > 1 and not parsed_args.sort) or \
+                parsed_args.engine == 'numpy':
+            parser.error("the standard input cannot be used with --mmap, --skip, --processes or --engine numpy.")
+        if parsed_args.positions == gv_bgzf.STDIO and parsed_args.make_index:
+            parser.error("the standard input cannot be indexed.")
+        if gv_bgzf.STDIO in parsed_args.panels and parsed_args.out_dir:
+            parser.error("the position files cannot be read on the standard input with --out-dir.")
+        if parsed_args.out_dir and not parsed_args.panel:
+            parser.error("the vcf cannot be read on the standard input with --out-dir, except with --panel.")
+        if parsed_args.vcf == gv_bgzf.STDIO and parsed_args.chrom and not parsed_args.fai:
+            parser.error("--chrom needs --fai when the vcf is read on the standard input.")
+
+    if len(parsed_args.vcfs) > 1 and not parsed_args.out_dir:
+        parser.error("several vcf need --out-dir.")
+    if parsed_args.panel:
+        if not parsed_args.out_dir:
+            parser.error("--panel needs --out-dir.")
+        if len(parsed_args.vcfs) > 1:
+            parser.error("--panel cannot be used with several vcf.")
+        names = [_panel_name(path) for path in parsed_args.panels]
+        if len(set(names)) != len(names):
+            parser.error("the position file and the panels must have different names.")
+    if parsed_args.out_dir:
+        if parsed_args.switch or parsed_args.chrom or parsed_args.mmap or parsed_args.skip or \
+                parsed_args.processes > 1 or parsed_args.unsorted or parsed_args.bgzip or \
+                parsed_args.out is not sys.stdout:
+            parser.error("--out-dir cannot be used with --switch, --chrom, --mmap, --skip, --processes, "
+                         "--unsorted, --bgzip or --out.")
+        names = [_batch_name(path) for path in parsed_args.vcfs]
+        if len(set(names)) != len(names):
+            parser.error("the vcf filtered in batch must have different names.")
+
+    if parsed_args.strict and (parsed_args.skip or parsed_args.processes > 1 or parsed_args.engine == 'numpy' or
+                               parsed_args.chrom or parsed_args.unsorted or parsed_args.intervals or
+                               parsed_args.out_dir):
+        parser.error("--strict cannot be used with --skip, --processes, --engine numpy, --chrom, --unsorted, "
+                     "--intervals or --out-dir.")
+    if parsed_args.sort and (parsed_args.mmap or parsed_args.skip or parsed_args.engine == 'numpy' or
+                             parsed_args.chrom or parsed_args.unsorted or parsed_args.intervals or
+                             parsed_args.strict or parsed_args.out_dir):
+        parser.error("--sort cannot be used with --mmap, --skip, --engine numpy, --chrom, --unsorted, "
+                     "--intervals, --strict or --out-dir.")
+    if (parsed_args.sort_memory is not None or parsed_args.tmpdir) and not parsed_args.sort:
+        parser.error("--sort-memory and --tmpdir need --sort.")
+    if parsed_args.stats and parsed_args.out_dir:
+        parser.error("--stats cannot be used with --out-dir.")
+
+    if parsed_args.chrom and (parsed_args.mmap or parsed_args.skip or parsed_args.processes > 1 or
+                              parsed_args.unsorted or parsed_args.make_index):
+        parser.error("--chrom cannot be used with --mmap, --skip, --processes, --unsorted or --make-index.")
+    if parsed_args.intervals and (parsed_args.switch or parsed_args.chrom or parsed_args.mmap or parsed_args.skip or
+                                  parsed_args.processes > 1 or parsed_args.unsorted or parsed_args.make_index or
+                                  parsed_args.out_dir or parsed_args.engine == 'numpy'):
+        parser.error("--intervals cannot be used with --switch, --chrom, --mmap, --skip, --processes, --unsorted, "
+                     "--make-index, --out-dir or --engine numpy.")
+    if parsed_args.tabix:
+        if parsed_args.invert or parsed_args.switch or parsed_args.chrom or parsed_args.intervals or \
+                parsed_args.strict or parsed_args.sort or parsed_args.unsorted or parsed_args.mmap or \
+                parsed_args.skip or parsed_args.processes > 1 or parsed_args.engine == 'numpy' or \
+                parsed_args.out_dir:
+            parser.error("--tabix cannot be used with --invert, --switch, --chrom, --intervals, --strict, --sort, "
+                         "--unsorted, --mmap, --skip, --processes, --engine numpy or --out-dir.")
+        if parsed_args.vcf == gv_bgzf.STDIO or gv_bgzf.compression(parsed_args.vcf) != 'bgzf' or \
+                not gv_tabix.find_index(parsed_args.vcf):
+            parser.error("--tabix needs a bgzf compressed vcf with a .tbi or .csi index next to it.")
+    if parsed_args.fai and not parsed_args.chrom:
+        parser.error("--fai needs --chrom.")
+    if parsed_args.unsorted and parsed_args.switch:
+        parser.error("--unsorted loads the position file in memory, it cannot be used with --switch.")
+
+    if parsed_args.mmap or parsed_args.skip or (parsed_args.processes > 1 and not parsed_args.sort) or \
+            parsed_args.engine == 'numpy':
+        for path in parsed_args.positions, parsed_args.vcf:
+            if gv_bgzf.compression(path):
+                parser.error(f"{path} is compressed, it cannot be used with --mmap, --skip, --processes "
+                             f"or --engine numpy.")
+
     return parsed_args
 
 
+def _batch_name(vcf_path):
+    """
+    :param str vcf_path: the path of a vcf filtered in batch
+    :return: the name of the output of this vcf in the output directory, the output is never compressed.
+    :rtype: str
+    """
+    name = os.path.basename(vcf_path)
+    root, ext = os.path.splitext(name)
+    return root if ext in ('.gz', '.bgz') else name
+
+
+def _panel_name(panel_path):
+    """
+    :param str panel_path: the path of a position file used with --panel
+    :return: the name of the output of this position file in the output directory.
+    :rtype: str
+    """
+    name = _batch_name(panel_path)
+    return os.path.splitext(name)[0] + '.vcf'
+
+
+def _fan_out(parsed_args):
+    """
+    Filter the vcf with the position file and all the panels in one pass.
+
+    :param parsed_args: the arguments parsed
+    :type parsed_args: :class:`aprgparse.Namespace` object.
+    """
+    threads = parsed_args.threads
+    if parsed_args.make_index:
+        for panel_path in parsed_args.panels:
+            gv_index.compile_index(panel_path)
+    os.makedirs(parsed_args.out_dir, exist_ok=True)
+    with ExitStack() as stack:
+        panels = []
+        for panel_path in parsed_args.panels:
+            panel = gv_index.load_index(panel_path)
+            if panel is None:
+                with gv_bgzf.open_input(panel_path, 'rb', threads=threads) as positions:
+                    if not gv_membership.is_sorted(positions):
+                        raise ValueError(f"{panel_path} is not sorted, it cannot be used with --panel.")
+                panel = stack.enter_context(gv_bgzf.open_input(panel_path, 'rb', threads=threads))
+            panels.append(panel)
+        vcf = stack.enter_context(gv_bgzf.open_input(parsed_args.vcf, 'rb', threads=threads))
+        outs = [stack.enter_context(open(os.path.join(parsed_args.out_dir, _panel_name(panel_path)), 'wb'))
+                for panel_path in parsed_args.panels]
+        gv_panels.fan_out(panels, vcf, outs, invert=parsed_args.invert, header=parsed_args.header)
+
+
+def _batch(parsed_args):
+    """
+    Filter all the vcf with the same position file, which is loaded only once.
+
+    :param parsed_args: the arguments parsed
+    :type parsed_args: :class:`aprgparse.Namespace` object.
+    """
+    if parsed_args.make_index:
+        gv_index.compile_index(parsed_args.positions)
+    panel = gv_position_filter.PositionFilter.from_file(parsed_args.positions)
+    positions = panel.positions
+    if any(prev > pos for prev, pos in zip(positions, positions[1:])):
+        raise ValueError(f"{parsed_args.positions} is not sorted, it cannot be used with --out-dir.")
+    os.makedirs(parsed_args.out_dir, exist_ok=True)
+    paths = [(vcf_path, os.path.join(parsed_args.out_dir, _batch_name(vcf_path))) for vcf_path in parsed_args.vcfs]
+    for _ in gv_position_filter.batch_filter(panel, paths, invert=parsed_args.invert, processes=parsed_args.jobs,
+                                             header=parsed_args.header):
+        pass
+
+
+def _open_output(parsed_args, binary, stack):
+    """
+    :param parsed_args: the arguments parsed
+    :type parsed_args: :class:`aprgparse.Namespace` object.
+    :param bool binary: open the output in binary mode
+    :param stack: the stack which closes the output at the end
+    :type stack: :class:`contextlib.ExitStack` object
+    :return: the stream where to write the selected lines
+    :rtype: file object
+    """
+    mode = 'wb' if binary else 'w'
+    if parsed_args.out is sys.stdout:
+        out = _stdout('wb' if parsed_args.bgzip else mode, stack)
+        if parsed_args.bgzip:
+            if out is sys.stdout:
+                out.flush()
+                out = out.buffer
+            out = stack.enter_context(gv_bgzf.open_output(out, mode,
+                                                          threads=parsed_args.threads,
+                                                          close_file=False,
+                                                          newline=_newline(mode)))
+    elif parsed_args.bgzip:
+        out = stack.enter_context(gv_bgzf.open_output(open(parsed_args.out, 'wb'), mode,
+                                                      threads=parsed_args.threads,
+                                                      newline=_newline(mode)))
+    else:
+        out = stack.enter_context(open(parsed_args.out, mode, buffering=gv_bgzf.IO_BUFFER_SIZE,
+                                       newline=_newline(mode)))
+    return out
+
+
+def _newline(mode):
+    """
+    :param str mode: the mode of a file, 'r' or 'w' for a text file, 'rb' or 'wb' for a binary file
+    :return: the *newline* argument to open the file, so the line ends are read and written unchanged in text mode,
+             and the text engine writes the same bytes as the engines which never decode the lines.
+    :rtype: str or None
+    """
+    return None if 'b' in mode else ''
+
+
+def _open_input(path, mode, threads):
+    """
+    :param str path: the path of the file to open, or '-' for the standard input
+    :param str mode: 'r' to open it in text mode, 'rb' in binary mode.
+    :param int threads: the number of threads which decompress a bgzf file
+    :return: the file opened
+    :rtype: file object
+    """
+    return gv_bgzf.open_input(path, mode, threads=threads, newline=_newline(mode))
+
+
+def _stdout(mode, stack):
+    """
+    :param str mode: 'w' to get a text stream, 'wb' to get a binary stream
+    :param stack: the stack which flushes the output at the end
+    :type stack: :class:`contextlib.ExitStack` object
+    :return: the standard output with a large buffer, so it is written by big blocks instead of line by line.
+             If the standard output is a terminal or is not a real file, it is returned as is.
+    :rtype: file object
+    """
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, OSError):
+        return sys.stdout
+    if sys.stdout.isatty():
+        return sys.stdout
+    sys.stdout.flush()
+    return stack.enter_context(open(fileno, mode, buffering=gv_bgzf.IO_BUFFER_SIZE, closefd=False,
+                                    newline=_newline(mode)))
+
+
 def main(args=None):
     """
 
@@ -114,28 +491,129 @@ def main(args=None):
     """
     args = sys.argv[1:] if args is None else args
     parsed_args = parse_args(args)
+    stats = gv_stats.Stats() if parsed_args.stats else None
+    if parsed_args.panel:
+        _fan_out(parsed_args)
+        return
+    if parsed_args.out_dir:
+        _batch(parsed_args)
+        return
 
     positions_path = parsed_args.positions
     vcf_path = parsed_args.vcf
+    threads = parsed_args.threads
 
-    if parsed_args.out is not sys.stdout:
-        out = open(parsed_args.out, 'w')
-    else:
-        out = sys.stdout
+    if parsed_args.make_index:
+        gv_index.compile_index(positions_path)
+    index = None
+    if not (parsed_args.switch or parsed_args.chrom or parsed_args.intervals) and \
+            (parsed_args.processes == 1 or parsed_args.sort):
+        index = gv_index.load_index(positions_path)
+    unsorted = parsed_args.unsorted
 
-    try:
-        with open(positions_path) as positions, open(vcf_path) as vcf:
-            ref, target = (positions, vcf) if not parsed_args.switch else (vcf, positions)
-            if parsed_args.invert:
-                gen = gv.invert_match_generator(ref, target)
+    tabix_index = None
+    if parsed_args.tabix:
+        tabix_index = gv_tabix.read_index(gv_tabix.find_index(vcf_path))
+        if len(tabix_index.names) != 1:
+            raise ValueError(f"--tabix needs an index with a single sequence, "
+                             f"the index of {vcf_path} has {len(tabix_index.names)} sequences.")
+
+    binary = parsed_args.mmap or parsed_args.skip or parsed_args.engine != 'line' or \
+        parsed_args.processes > 1 or parsed_args.sort or tabix_index is not None
+    mode = 'b' if binary else ''
+
+    with ExitStack() as stack:
+        out = _open_output(parsed_args, binary, stack)
+        positions = stack.enter_context(_open_input(positions_path, 'r' + mode, threads))
+        if tabix_index is not None:
+            # the blocks needed are decompressed on demand
+            vcf = stack.enter_context(open(vcf_path, 'rb'))
+        else:
+            vcf = stack.enter_context(gv_bgzf.open_input(vcf_path, 'r' + mode, threads=threads,
+                                                         newline=_newline(mode)))
+        ref, target = (positions, vcf) if not parsed_args.switch else (vcf, positions)
+        if index is not None:
+            ref = index
+        single_lines = parsed_args.intervals or parsed_args.chrom or unsorted
+        # the engines which do not expose their records, only their output is counted
+        untracked = single_lines or parsed_args.sort or tabix_index is not None or parsed_args.processes > 1 or \
+            parsed_args.skip or (parsed_args.engine == 'numpy' and not parsed_args.mmap)
+        if parsed_args.header:
+            target_path = vcf_path if not parsed_args.switch else positions_path
+            if tabix_index is not None or (parsed_args.processes > 1 and not parsed_args.sort) or \
+                    (parsed_args.strict and target_path != gv_bgzf.STDIO):
+                # the target is read by the generator from its path or in compressed blocks,
+                # or in strict mode it is left on its first line, so the merge numbers the lines of the header
+                with _open_input(target_path, 'rb', threads) as header_file:
+                    gv.copy_header(header_file, out)
+            elif stats is not None and not untracked:
+                # the lines of the header are counted with the lines skipped by the parser
+                header = gv.read_header(target)
+                gv._binary_writer(out)(header)
+                stats.header('target', header)
             else:
-                gen = gv.match_generator(ref, target)
+                gv.copy_header(target, out)
+        if parsed_args.intervals:
+            gen = gv_intervals.interval_match_generator(ref, target, invert=parsed_args.invert)
+        elif parsed_args.chrom:
+            if parsed_args.fai:
+                contigs = gv_contigs.read_fai(parsed_args.fai)
+            else:
+                contigs = gv_contigs.read_contigs(vcf_path)
+            if not contigs:
+                raise ValueError(f"{vcf_path} does not declare any '##contig', use --fai to give the contigs order.")
+            gen = gv_contigs.contig_match_generator(ref, target, contigs, invert=parsed_args.invert)
+        elif unsorted:
+            position_set = gv_membership.load_position_set(ref)
+            sys.stderr.write(f"grep_vcf: unsorted mode, {len(position_set)} positions "
+                             f"held in a {position_set.kind} of {position_set.nbytes} bytes.\n")
+            gen = gv_membership.membership_match_generator(ref, target,
+                                                           invert=parsed_args.invert,
+                                                           positions=position_set)
+        elif parsed_args.sort:
+            memory = (parsed_args.sort_memory or gv_sort.MEMORY // (1024 * 1024)) * 1024 * 1024
+            gen = gv_sort.sort_match_generator(ref, target, invert=parsed_args.invert, memory=memory,
+                                               tmpdir=parsed_args.tmpdir, processes=parsed_args.processes)
+        elif tabix_index is not None:
+            gen = gv_tabix.tabix_match_generator(ref, target, tabix_index)
+        elif parsed_args.processes > 1:
+            ref_path, target_path = (positions_path, vcf_path) if not parsed_args.switch \
+                else (vcf_path, positions_path)
+            gen = gv_parallel.parallel_match_generator(ref_path, target_path,
+                                                       invert=parsed_args.invert,
+                                                       processes=parsed_args.processes)
+        elif parsed_args.skip:
+            gen = gv.skip_match_generator(ref, target, invert=parsed_args.invert)
+        elif parsed_args.mmap:
+            gen = gv.mmap_match_generator(ref, target, invert=parsed_args.invert, stats=stats,
+                                          strict=parsed_args.strict)
+        elif parsed_args.engine == 'numpy':
+            gen = gv.numpy_match_generator(ref, target, invert=parsed_args.invert)
+        elif binary:
+            gen = gv.block_match_generator(ref, target, invert=parsed_args.invert, stats=stats,
+                                           strict=parsed_args.strict)
+        else:
+            gen = gv.match_batches(ref, target, invert=parsed_args.invert, stats=stats,
+                                   strict=parsed_args.strict)
+
+        if stats is not None and untracked:
+            gen = stats.lines(gen)
+        if single_lines and not binary:
+            # the lines are written by batches, not one by one
+            gen = gv._batches(gen, gv.BLOCK_SIZE)
+        write = gv._binary_writer(out) if binary else out.writelines
+        if stats is not None:
+            write = stats.writer(write)
+        for chunk in gen:
+            write(chunk)
 
-            for line in gen:
-                out.write(line)
-    finally:
-        if not out.closed and out.name != '<stdout>':
-            out.close()
+    if stats is not None:
+        stats.finish()
+        ref_path, target_path = (positions_path, vcf_path) if not parsed_args.switch \
+            else (vcf_path, positions_path)
+        stats.file_size('ref', ref_path)
+        stats.file_size('target', target_path)
+        stats.dump()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,371 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import io
+import os
+import re
+import heapq
+import itertools
+import tempfile
+import multiprocessing
+from collections import deque
+from contextlib import ExitStack
+from operator import itemgetter
+
+import grep_vcf.grep_vcf as gv
+
+MEMORY = 1024 * 1024 * 1024
+"""The default memory budget (in bytes) of a sort."""
+
+MAX_FAN_IN = 256
+"""The maximum number of runs merged at once, more runs are merged in several passes."""
+
+# the memory needed to sort a run compared to its size: the run read by the main process,
+# its copy sent to a worker and the records (python objects) sorted by the worker
+_RUN_OVERHEAD = 6
+_MIN_RUN_SIZE = 1024 * 1024
+# the position of the comments at the end of the file, after all data lines
+_END = float('inf')
+_BLANK_LINE = re.compile(rb'(?:^|\n)\s*?\n')
+
+
+def _run_size(memory, processes):
+    """
+    :param int memory: the memory budget of the sort
+    :param int processes: the number of processes sorting the runs at the same time
+    :return: the size in bytes of the runs
+    :rtype: int
+    """
+    return max(_MIN_RUN_SIZE, memory // (processes * _RUN_OVERHEAD))
+
+
+def _chunks(file, size):
+    """
+    Read a file by chunks of about *size* bytes aligned on line boundaries.
+    The comments at the end of a chunk are moved to the next one, with the data line which follows them,
+    so only the last chunk can end by comments.
+
+    :param file: the file to read
+    :type file: file object opened in binary mode
+    :param int size: the size of the chunks
+    :return: the chunks, each ending by a newline except the last one if the file does not end by a newline
+    :rtype: generator of bytes
+    """
+    tail = b''
+    while True:
+        block = file.read(size)
+        if not block:
+            break
+        if tail:
+            block = tail + block
+        end = block.rfind(b'\n') + 1
+        while end:
+            start = block.rfind(b'\n', 0, end - 1) + 1
+            line = block[start:end].lstrip()
+            if line and not line.startswith(b'#'):
+                break
+            end = start
+        tail = block[end:]
+        if end:
+            yield block[:end]
+    if tail:
+        yield tail
+
+
+def _parse_position(line):
+    """
+    :param bytes line: a data line
+    :return: the position of the line, its first field (as :func:`grep_vcf.grep_vcf._parse_line` does)
+    :rtype: int
+    :raise ValueError: when the first field can not be cast in an integer
+    """
+    field = line.split(None, 1)[0]
+    try:
+        return int(field)
+    except ValueError:
+        line = line.rstrip(b'\n').decode(errors='replace')
+        raise ValueError(f"{line}: invalid literal for int() with base 10: "
+                         f"{field.decode(errors='replace')!r}") from None
+
+
+def _entries(lines):
+    """
+    Group the comment lines with the data lines.
+
+    :param lines: the lines to group, split on newlines only
+    :type lines: iterable of bytes
+    :return: the position of each data line, and the data line preceded by the comments
+             (and the blank lines) which are just before it. The comments after the last data line
+             are grouped in an entry which position is after all the others.
+    :rtype: list of tuple (int, bytes)
+    :raise ValueError: when the position of a data line can not be parsed
+    """
+    entries = []
+    comments = []
+    for line in lines:
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith(b'#'):
+            comments.append(line)
+            continue
+        if comments:
+            comments.append(line)
+            line = b''.join(comments)
+            comments = []
+        entries.append((_parse_position(stripped), line))
+    if comments:
+        entries.append((_END, b''.join(comments)))
+    return entries
+
+
+def _sort_run(data, path):
+    """
+    Sort the lines of a chunk by position and write them in a run.
+    The sort is stable, the lines with the same position keep their order.
+    The lines are written as they are read, except the last line of the file if it has no newline:
+    it gets one when the sort moves it before other lines.
+
+    :param bytes data: the chunk
+    :param str path: where to write the run
+    :return: the path of the run
+    :rtype: str
+    :raise ValueError: when the position of a data line can not be parsed
+    """
+    if b'#' in data or _BLANK_LINE.search(data):
+        # the lines are split on newlines only, as the compiled scanner does
+        entries = _entries(io.BytesIO(data))
+    else:
+        # no comment nor blank line to keep with the lines, the compiled scanner can be used
+        entries = list(gv._scan_records(data))
+    unterminated = entries[-1] if not data.endswith(b'\n') else None
+    entries.sort(key=itemgetter(0))
+    if unterminated is not None and entries[-1] is not unterminated:
+        # the lines are concatenated in the run
+        i = entries.index(unterminated)
+        entries[i] = unterminated[0], unterminated[1] + b'\n'
+    with open(path, 'wb') as run:
+        run.writelines(line for _, line in entries)
+    return path
+
+
+def _make_runs(file, workdir, run_size, processes):
+    """
+    Split a file in sorted runs. The runs are sorted by *processes* worker processes,
+    at most one run per process is waiting to be sorted, so the memory used is bounded.
+
+    :param file: the file to sort
+    :type file: file object opened in binary mode
+    :param str workdir: the directory of the runs
+    :param int run_size: the size of the runs
+    :param int processes: the number of worker processes, 1 to sort in the current process
+    :return: the paths of the runs, in the order of the file
+    :rtype: list of str
+    """
+    chunks = _chunks(file, run_size)
+    run_paths = (os.path.join(workdir, f"run_{i}") for i in itertools.count())
+    if processes == 1:
+        return [_sort_run(chunk, path) for chunk, path in zip(chunks, run_paths)]
+    paths = []
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+        for chunk, path in zip(chunks, run_paths):
+            if len(pending) >= processes:
+                paths.append(pending.popleft().get())
+            pending.append(pool.apply_async(_sort_run, (chunk, path)))
+        paths.extend(result.get() for result in pending)
+    return paths
+
+
+def _run_entries(run):
+    """
+    :param run: a run
+    :type run: file object opened in binary mode
+    :return: the entries of the run, the data lines with the comments before them (see :func:`_entries`)
+    :rtype: generator of tuple (int, bytes)
+    """
+    comments = []
+    for line in run:
+        stripped = line.lstrip()
+        if not stripped or stripped.startswith(b'#'):
+            comments.append(line)
+            continue
+        if comments:
+            comments.append(line)
+            line = b''.join(comments)
+            comments = []
+        yield _parse_position(stripped), line
+    if comments:
+        yield _END, b''.join(comments)
+
+
+def _unterminated(run):
+    """
+    :param run: a run
+    :type run: file object opened in binary mode
+    :return: True if the run does not end by a newline
+    :rtype: bool
+    """
+    run.seek(0, os.SEEK_END)
+    if not run.tell():
+        return False
+    run.seek(-1, os.SEEK_END)
+    last = run.read(1)
+    run.seek(0)
+    return last != b'\n'
+
+
+def _terminated(records):
+    """
+    Add a newline to the line without newline (the last line of the file) if other lines follow it.
+
+    :param records: the records of a merge
+    :type records: iterator of tuple (int, bytes)
+    :return: the records, with a newline at the end of each line except the last one
+    :rtype: generator of tuple (int, bytes)
+    """
+    previous = None
+    for record in records:
+        if previous is not None:
+            yield previous if previous[1].endswith(b'\n') else (previous[0], previous[1] + b'\n')
+        previous = record
+    if previous is not None:
+        yield previous
+
+
+def _merge_runs(paths, stack, block_size, comments=False):
+    """
+    :param paths: the paths of the runs
+    :type paths: list of str
+    :param stack: where to register the runs opened, to close them
+    :type stack: :class:`contextlib.ExitStack` object
+    :param int block_size: the size of the buffer of each run
+    :param bool comments: keep the comments in the lines
+    :return: the k-way merge of the runs, the lines with the same position are yielded in the order of the runs.
+    :rtype: iterator of tuple (int, bytes)
+    """
+    runs = [stack.enter_context(open(path, 'rb', buffering=block_size)) for path in paths]
+    if comments:
+        records = [_run_entries(run) for run in runs]
+    else:
+        records = [gv._block_records(run, block_size) for run in runs]
+    merge = heapq.merge(*records, key=itemgetter(0))
+    if len(runs) > 1 and _unterminated(runs[-1]):
+        # only the run of the end of the file can end without newline, its last line can be merged before others
+        merge = _terminated(merge)
+    return merge
+
+
+def sorted_records(file, memory=MEMORY, tmpdir=None, processes=1, comments=False):
+    """
+    Sort the records of a file by position, with an external merge sort: the file is split in runs
+    which are sorted in memory by *processes* worker processes and saved in a temporary directory,
+    then the runs are merged (in several passes if there are more than :data:`MAX_FAN_IN` runs).
+    The sorted records are streamed from the merge, the sorted file is never written.
+    The sort is stable, the lines with the same position keep their order.
+
+    :param file: the file to sort
+    :type file: file object opened in binary mode
+    :param int memory: the memory budget in bytes, shared by the workers
+    :param str tmpdir: the directory where the runs are written, by default the temporary directory of the system
+    :param int processes: the number of worker processes which sort the runs, 1 to sort them in the current process
+    :param bool comments: keep the comments, each data line is yielded with the comments
+                          (and the blank lines) just before it.
+    :return: the records of the file sorted by position
+    :rtype: generator of tuple (int, bytes)
+    :raise ValueError: when the position of a data line can not be parsed
+    """
+    file = getattr(file, 'buffer', file)  # the binary stream under a text file
+    with tempfile.TemporaryDirectory(prefix='grep_vcf_sort_', dir=tmpdir) as workdir:
+        paths = _make_runs(file, workdir, _run_size(memory, processes), processes)
+        passes = 0
+        while len(paths) > MAX_FAN_IN:
+            # the runs are merged by groups in bigger runs until they can be merged at once
+            passes += 1
+            merged = []
+            for i in range(0, len(paths), MAX_FAN_IN):
+                path = os.path.join(workdir, f"pass_{passes}_{i}")
+                with ExitStack() as stack, open(path, 'wb') as run:
+                    block_size = max(64 * 1024, memory // (2 * MAX_FAN_IN))
+                    run.writelines(line for _, line in _merge_runs(paths[i:i + MAX_FAN_IN], stack, block_size,
+                                                                  comments=True))
+                for old in paths[i:i + MAX_FAN_IN]:
+                    os.remove(old)
+                merged.append(path)
+            paths = merged
+        with ExitStack() as stack:
+            block_size = max(64 * 1024, min(gv.BLOCK_SIZE, memory // (2 * max(len(paths), 1))))
+            yield from _merge_runs(paths, stack, block_size, comments=comments)
+
+
+def sort_file(file, out, memory=MEMORY, tmpdir=None, processes=1):
+    """
+    Sort a file by position (see :func:`sorted_records`).
+    The header (the leading lines starting with '#') stays on the top,
+    the other comments stay just before the data line which follows them.
+
+    :param file: the file to sort
+    :type file: file object opened in binary mode
+    :param out: where to write the sorted file
+    :type out: file object opened in binary mode
+    :param int memory: the memory budget in bytes
+    :param str tmpdir: the directory of the runs
+    :param int processes: the number of worker processes which sort the runs
+    :raise ValueError: when the position of a data line can not be parsed
+    """
+    file = getattr(file, 'buffer', file)
+    out.write(gv.read_header(file))
+    out.writelines(line for _, line in sorted_records(file, memory=memory, tmpdir=tmpdir,
+                                                      processes=processes, comments=True))
+
+
+def sort_match_generator(ref_file, target_file, invert=False, memory=MEMORY, tmpdir=None, processes=1,
+                         block_size=gv.BLOCK_SIZE):
+    """
+    create a generator which can iterate over the lines of target_file
+    where position appear (or not if *invert* is True) in reference file.
+    The files do not need to be sorted: they are sorted by :func:`sorted_records`
+    and the merges of their runs are streamed into the filter.
+    The lines are yielded in the order of the positions.
+
+    :param ref_file: the text file to extract, or an object which holds its sorted records
+                     as :class:`grep_vcf.index.PositionIndex`
+    :type ref_file: file object opened in binary mode or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the vcf to compare
+    :type target_file: file object opened in binary mode
+    :param bool invert: select the lines which do not match instead of the matching ones.
+    :param int memory: the memory budget in bytes of each sort
+    :param str tmpdir: the directory of the runs
+    :param int processes: the number of worker processes which sort the runs
+    :param int block_size: the size of the buffers yielded
+    :return: a generator on chunks of selected lines
+    :rtype: generator of bytes
+    :raise ValueError: when a position can not be parsed
+    """
+    sort = dict(memory=memory, tmpdir=tmpdir, processes=processes)
+    if hasattr(ref_file, 'records'):
+        ref_records = ref_file.records()
+    else:
+        ref_records = sorted_records(ref_file, **sort)
+    lines = gv._merge(ref_records, sorted_records(target_file, **sort), invert=invert)
+    for batch in gv._batches(lines, block_size):
+        yield b''.join(batch)
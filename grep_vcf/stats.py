@@ -0,0 +1,359 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import sys
+import json
+from time import perf_counter
+
+import grep_vcf.grep_vcf as gv
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def _count_lines(data):
+    """
+    :param data: one or several lines
+    :type data: str, bytes or :class:`memoryview`
+    :return: the number of lines in *data*, a last line without newline counts
+    :rtype: int
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    if not data:
+        return 0
+    newline = '\n' if isinstance(data, str) else b'\n'
+    return data.count(newline) + (not data.endswith(newline))
+
+
+def _count_newlines(buf, start, end):
+    """
+    :param buf: the buffer to scan
+    :type buf: bytes-like object with a *find* method (bytes or :class:`mmap.mmap`)
+    :param int start: the offset where to start
+    :param int end: the offset where to stop
+    :return: the number of newlines between *start* and *end*
+    :rtype: int
+    """
+    count = 0
+    newline = buf.find(b'\n', start, end)
+    while newline != -1:
+        count += 1
+        newline = buf.find(b'\n', newline + 1, end)
+    return count
+
+
+class _SkipCounter:
+    """
+    A view given to :func:`grep_vcf.grep_vcf._scan_records`: it gives the data lines as the view it wraps,
+    and counts the lines between them (the comments and the blank lines skipped by the scanner).
+    Only the bytes skipped are searched, the data lines are not read again.
+    """
+
+    __slots__ = ('counters', 'buf', 'view', 'stop')
+
+    def __init__(self, counters, buf, start, view):
+        self.counters = counters
+        self.buf = buf
+        self.view = buf if view is None else view
+        self.stop = start
+
+    def __getitem__(self, line):
+        if line.start > self.stop:
+            self.counters.comments += _count_newlines(self.buf, self.stop, line.start)
+        self.stop = line.stop
+        return self.view[line]
+
+    def finish(self, end):
+        """
+        Count the lines after the last data line.
+
+        :param int end: the offset where the scan stopped
+        """
+        if end > self.stop:
+            self.counters.comments += _count_newlines(self.buf, self.stop, end)
+            # a last line without newline
+            self.counters.comments += self.buf[end - 1:end] != b'\n'
+
+
+def peak_memory():
+    """
+    :return: the peak resident memory of the process in bytes, or None if it cannot be measured.
+    :rtype: int
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on linux but in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class InputStats:
+    """
+    The counters of one input of a run.
+    """
+
+    __slots__ = ('records', 'comments', 'bytes')
+
+    def __init__(self):
+        #: the data lines parsed (None if the engine does not expose its records)
+        self.records = None
+        #: the lines skipped by the parser: the comments and the blank lines (None if they were not counted)
+        self.comments = None
+        #: the size of the input on disk (None if it is not a regular file)
+        self.bytes = None
+
+    @property
+    def lines(self):
+        """
+        The lines read: the data lines and the lines skipped. When the merge stops before the end
+        of the input (the other input is exhausted), the lines which follow are not counted.
+        """
+        if self.records is None or self.comments is None:
+            return None
+        return self.records + self.comments
+
+    def as_dict(self):
+        """
+        :return: the counters of the input
+        :rtype: dict
+        """
+        return {'lines': self.lines, 'records': self.records, 'comments': self.comments, 'bytes': self.bytes}
+
+
+class Stats:
+    """
+    Collect the statistics of a run: the lines read on each input, the matches emitted, the bytes written,
+    and the time spent in parsing, merging and writing.
+
+    The counters are plugged by wrapping the iterators and the write function of the run,
+    so nothing is counted, and nothing costs, when no :class:`Stats` is given.
+    The generators of :mod:`grep_vcf.grep_vcf` which merge records accept a *stats* argument
+    and report the records parsed on their inputs and the lines skipped by their parsers,
+    the output of any other generator can be counted with :meth:`lines`
+    (its parsing time is then accounted in the merge time).
+    The inputs are never read again to be counted.
+    The time spent in the wrappers themselves is accounted in the times they measure.
+    """
+
+    def __init__(self):
+        self.inputs = {}
+        self.matches = 0
+        self.bytes_out = 0
+        self.parse_time = None
+        self.generator_time = 0.0
+        self.write_time = 0.0
+        self._start = perf_counter()
+        self._end = None
+
+    def input(self, name):
+        """
+        :param str name: the name of the input
+        :return: the counters of the input *name*, created on the first call
+        :rtype: :class:`InputStats` object
+        """
+        try:
+            return self.inputs[name]
+        except KeyError:
+            counters = self.inputs[name] = InputStats()
+            return counters
+
+    def records(self, name, records):
+        """
+        Count the records of the input *name* and the time spent to parse them.
+
+        :param str name: the name of the input
+        :param records: the records of the input
+        :type records: iterator of tuple (position, line)
+        :return: the same records
+        :rtype: generator of tuple (position, line)
+        """
+        counters = self.input(name)
+        counters.records = 0
+        if self.parse_time is None:
+            self.parse_time = 0.0
+        records = iter(records)
+        clock = perf_counter
+        while True:
+            start = clock()
+            try:
+                record = next(records)
+            except StopIteration:
+                self.parse_time += clock() - start
+                return
+            self.parse_time += clock() - start
+            counters.records += 1
+            yield record
+
+    def _skipped(self, name):
+        """
+        :param str name: the name of the input
+        :return: the counters of the input *name*, ready to count the lines skipped
+        :rtype: :class:`InputStats` object
+        """
+        counters = self.input(name)
+        if counters.comments is None:
+            counters.comments = 0
+        return counters
+
+    def scanner(self, name):
+        """
+        :param str name: the name of the input
+        :return: a function which scans a buffer as :func:`grep_vcf.grep_vcf._scan_records`
+                 and counts the comments and the blank lines skipped in the input *name*
+        :rtype: callable
+        """
+        counters = self._skipped(name)
+
+        def scan(buf, start=0, end=None, view=None, count=None):
+            counter = _SkipCounter(counters, buf, start, view)
+            yield from gv._scan_records(buf, start, end, view=counter, count=count)
+            counter.finish(len(buf) if end is None else end)
+        return scan
+
+    def text_lines(self, name, lines):
+        """
+        Count the comments and the blank lines of the input *name* read by the text parser.
+
+        :param str name: the name of the input
+        :param lines: the lines of the input
+        :type lines: iterable of str
+        :return: the same lines
+        :rtype: generator of str
+        """
+        counters = self._skipped(name)
+        for line in lines:
+            stripped = line.lstrip()
+            if not stripped or stripped[0] == '#':
+                counters.comments += 1
+            yield line
+
+    def header(self, name, header):
+        """
+        Count the lines of a header read before the records of the input *name*
+        (see :func:`grep_vcf.grep_vcf.read_header`).
+
+        :param str name: the name of the input
+        :param bytes header: the header
+        """
+        self._skipped(name).comments += _count_lines(header)
+
+    def lines(self, lines):
+        """
+        Count the lines emitted by a generator and the time spent inside it.
+
+        :param lines: the selected lines, or chunks of lines, of a run
+        :type lines: iterator of str, bytes or :class:`memoryview`
+        :return: the same lines
+        :rtype: generator
+        """
+        lines = iter(lines)
+        clock = perf_counter
+        while True:
+            start = clock()
+            try:
+                line = next(lines)
+            except StopIteration:
+                self.generator_time += clock() - start
+                return
+            self.generator_time += clock() - start
+            self.matches += _count_lines(line)
+            self.bytes_out += line.nbytes if isinstance(line, memoryview) else len(line)
+            yield line
+
+    def writer(self, write):
+        """
+        :param write: the function writing the output
+        :type write: callable
+        :return: the same function which also measures the time spent in writing
+        :rtype: callable
+        """
+        clock = perf_counter
+
+        def timed_write(data):
+            start = clock()
+            write(data)
+            self.write_time += clock() - start
+        return timed_write
+
+    def file_size(self, name, path):
+        """
+        Set the size of the input *name* from the metadata of its file, the file is not read.
+
+        :param str name: the name of the input
+        :param str path: the path of the file
+        """
+        try:
+            if os.path.isfile(path):
+                self.input(name).bytes = os.path.getsize(path)
+        except OSError:
+            pass
+
+    def finish(self):
+        """
+        Stop the clock of the run.
+        """
+        self._end = perf_counter()
+
+    def report(self):
+        """
+        :return: the statistics of the run, the times are in seconds, the throughput in lines and bytes per second
+                 of the target (the last input registered if there is no input named 'target').
+        :rtype: dict
+        """
+        wall = (self._end if self._end is not None else perf_counter()) - self._start
+        merge_time = self.generator_time - (self.parse_time or 0.0)
+        target = self.inputs.get('target')
+        if target is None and self.inputs:
+            target = list(self.inputs.values())[-1]
+        lines = bytes_in = None
+        if target is not None:
+            lines = target.lines if target.lines is not None else target.records
+            bytes_in = target.bytes
+        return {
+            'inputs': {name: counters.as_dict() for name, counters in self.inputs.items()},
+            'matches': self.matches,
+            'bytes_out': self.bytes_out,
+            'time': {'wall': wall,
+                     'parse': self.parse_time,
+                     'merge': merge_time,
+                     'write': self.write_time},
+            'throughput': {'lines_per_second': lines / wall if lines is not None and wall else None,
+                           'bytes_per_second': bytes_in / wall if bytes_in is not None and wall else None},
+            'peak_memory': peak_memory(),
+        }
+
+    def dump(self, out=None):
+        """
+        Write the report as JSON.
+
+        :param out: where to write the report (the standard error by default)
+        :type out: file object opened in text mode
+        """
+        out = sys.stderr if out is None else out
+        json.dump(self.report(), out, indent=2)
+        out.write('\n')
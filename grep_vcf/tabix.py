@@ -0,0 +1,352 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import gzip
+import struct
+from array import array
+from itertools import repeat
+
+import grep_vcf.grep_vcf as gv
+from grep_vcf.bgzf import _HEADER, _bgzf_block_size, _inflate
+
+_INT = struct.Struct('<i')
+_TBI_HEADER = struct.Struct('<8i')
+_CSI_HEADER = struct.Struct('<3i')
+_CONF = struct.Struct('<7i')
+_BIN = struct.Struct('<Ii')
+_CSI_BIN = struct.Struct('<IQi')
+
+
+class _Reader:
+    """
+    A cursor on the uncompressed content of an index.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def read(self, size):
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def chunks(self, n_chunk):
+        chunks = array('Q')
+        chunks.frombytes(self.read(16 * n_chunk))
+        # (begin, end) virtual offsets
+        return list(zip(chunks[::2], chunks[1::2]))
+
+
+def _reg2bins(beg, end, min_shift, depth):
+    """
+    :param int beg: the start of the region (0-based)
+    :param int end: the end of the region (0-based, exclusive)
+    :param int min_shift: the size of the smallest bins (log 2)
+    :param int depth: the number of levels of bins
+    :return: the bins which can contain records overlapping the region
+    :rtype: list of int
+    """
+    bins = []
+    shift = min_shift + depth * 3
+    end = min(end, 1 << shift) - 1
+    first = 0
+    for level in range(depth + 1):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << (level * 3)
+    return bins
+
+
+class TabixIndex:
+    """
+    The content of a tabix (.tbi) or csi (.csi) index of a bgzf compressed file,
+    needed to find the blocks holding the records at given positions.
+    """
+
+    def __init__(self, names, bins, linear, min_shift=14, depth=5, col_seq=1, col_beg=2, meta=b'#'):
+        """
+        :param names: the names of the sequences
+        :type names: list of str
+        :param bins: for each sequence the chunks of virtual offsets of each bin
+        :type bins: list of dict {int: list of tuple (int, int)}
+        :param linear: for each sequence the minimal virtual offset of the records in each window of
+                       2^min_shift bases (tabix), or the minimal offset of each bin (csi)
+        :type linear: list of list of int (tabix) or list of dict {int: int} (csi)
+        :param int min_shift: the size of the smallest bins (log 2)
+        :param int depth: the number of levels of bins
+        :param int col_seq: the column of the sequence names (1-based)
+        :param int col_beg: the column of the positions (1-based)
+        :param bytes meta: the character starting the comment lines
+        """
+        self.names = names
+        self.bins = bins
+        self.linear = linear
+        self.min_shift = min_shift
+        self.depth = depth
+        self.col_seq = col_seq
+        self.col_beg = col_beg
+        self.meta = meta
+
+    def chunks(self, name, positions):
+        """
+        :param str name: the name of the sequence
+        :param positions: the positions (1-based) to look for
+        :type positions: iterable of int
+        :return: the sorted and disjoint ranges of virtual offsets which hold
+                 all the records of the sequence at these positions
+        :rtype: list of tuple (int, int)
+        :raise KeyError: if the sequence is not in the index
+        """
+        if name not in self.names:
+            raise KeyError(f"sequence {name} is not in the index")
+        ref_id = self.names.index(name)
+        bins = self.bins[ref_id]
+        linear = self.linear[ref_id]
+        chunks = set()
+        for pos in positions:
+            beg = max(pos - 1, 0)
+            if isinstance(linear, list):
+                window = beg >> self.min_shift
+                min_offset = linear[min(window, len(linear) - 1)] if linear else 0
+            else:
+                min_offset = 0
+            for bin_id in _reg2bins(beg, beg + 1, self.min_shift, self.depth):
+                if bin_id not in bins:
+                    continue
+                if isinstance(linear, dict):
+                    min_offset = max(min_offset, linear.get(bin_id, 0))
+                chunks.update(chunk for chunk in bins[bin_id] if chunk[1] > min_offset)
+        merged = []
+        for beg, end in sorted(chunks):
+            if merged and beg <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+            else:
+                merged.append((beg, end))
+        return merged
+
+
+def _parse_conf(reader):
+    """
+    :return: col_seq, col_beg, meta and the names of the sequences of a tabix header
+    """
+    _, col_seq, col_beg, _, meta, _, l_nm = reader.unpack(_CONF)
+    names = [name.decode() for name in reader.read(l_nm).split(b'\0')[:-1]]
+    return col_seq, col_beg, bytes([meta]), names
+
+
+def read_index(path):
+    """
+    Read a tabix (.tbi) or csi (.csi) index.
+
+    :param str path: the path of the index
+    :return: the index
+    :rtype: :class:`TabixIndex` object
+    :raise ValueError: if the file is not a tabix or csi index
+    """
+    with gzip.open(path, 'rb') as index_file:
+        reader = _Reader(index_file.read())
+    magic = reader.read(4)
+    if magic == b'TBI\1':
+        n_ref = reader.unpack(_INT)[0]
+        col_seq, col_beg, meta, names = _parse_conf(reader)
+        min_shift, depth = 14, 5
+        bins, linear = [], []
+        for _ in range(n_ref):
+            ref_bins = {}
+            for _ in range(reader.unpack(_INT)[0]):
+                bin_id, n_chunk = reader.unpack(_BIN)
+                ref_bins[bin_id] = reader.chunks(n_chunk)
+            n_intv = reader.unpack(_INT)[0]
+            intervals = array('Q')
+            intervals.frombytes(reader.read(8 * n_intv))
+            bins.append(ref_bins)
+            linear.append(intervals.tolist())
+    elif magic == b'CSI\1':
+        min_shift, depth, l_aux = reader.unpack(_CSI_HEADER)
+        aux = _Reader(reader.read(l_aux))
+        if l_aux >= _CONF.size:
+            col_seq, col_beg, meta, names = _parse_conf(aux)
+        else:
+            col_seq, col_beg, meta, names = 1, 2, b'#', []
+        n_ref = reader.unpack(_INT)[0]
+        bins, linear = [], []
+        for _ in range(n_ref):
+            ref_bins = {}
+            ref_offsets = {}
+            for _ in range(reader.unpack(_INT)[0]):
+                bin_id, loffset, n_chunk = reader.unpack(_CSI_BIN)
+                ref_bins[bin_id] = reader.chunks(n_chunk)
+                ref_offsets[bin_id] = loffset
+            bins.append(ref_bins)
+            linear.append(ref_offsets)
+    else:
+        raise ValueError(f"{path} is not a tabix or csi index")
+    return TabixIndex(names, bins, linear, min_shift=min_shift, depth=depth,
+                      col_seq=col_seq, col_beg=col_beg, meta=meta)
+
+
+def find_index(path):
+    """
+    :param str path: the path of a bgzf compressed file
+    :return: the path of the tabix or csi index next to the file or None
+    :rtype: str
+    """
+    for suffix in '.tbi', '.csi':
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+
+def _read_block(file, coffset):
+    """
+    :param file: the bgzf file
+    :param int coffset: the offset of the block in the compressed file
+    :return: the uncompressed data of the block and the offset of the next block
+    :rtype: tuple (bytes, int)
+    :raise ValueError: if there is no valid bgzf block at this offset
+    """
+    file.seek(coffset)
+    header = file.read(_HEADER.size)
+    if not header:
+        return b'', coffset
+    extra = file.read(_HEADER.unpack(header)[-1])
+    size = _bgzf_block_size(header, extra)
+    if size is None:
+        raise ValueError(f"{getattr(file, 'name', '')}: not a bgzf block at offset {coffset}")
+    return _inflate(header + extra + file.read(size - len(header) - len(extra))), coffset + size
+
+
+def read_ranges(file, ranges):
+    """
+    Decompress only the blocks needed to read some ranges of a bgzf file.
+
+    :param file: the bgzf file
+    :type file: file object opened in binary mode
+    :param ranges: the sorted ranges of virtual offsets to read
+    :type ranges: list of tuple (int, int)
+    :return: the uncompressed content of each range
+    :rtype: generator of bytes
+    """
+    cached = (None, b'', 0)
+    for vbeg, vend in ranges:
+        coffset, uoffset = vbeg >> 16, vbeg & 0xffff
+        end_coffset, end_uoffset = vend >> 16, vend & 0xffff
+        parts = []
+        while coffset <= end_coffset:
+            if cached[0] != coffset:
+                cached = (coffset, *_read_block(file, coffset))
+            _, data, next_coffset = cached
+            if coffset == end_coffset:
+                parts.append(data[uoffset:end_uoffset])
+                break
+            parts.append(data[uoffset:])
+            if next_coffset == coffset:
+                # end of file
+                break
+            coffset, uoffset = next_coffset, 0
+        yield b''.join(parts)
+
+
+def _column_records(data, column, meta=b'#'):
+    """
+    :param bytes data: some complete lines
+    :param int column: the column of the positions (1-based)
+    :param bytes meta: the character starting the comment lines
+    :return: the position and the line of each data line
+    :rtype: tuple (int, bytes)
+    :raise ValueError: when the column can not be cast in an integer
+    """
+    if column == 1:
+        yield from gv._scan_records(data)
+        return
+    lines = data.split(b'\n')
+    last = lines.pop()
+    for line in lines:
+        if line and not line.startswith(meta):
+            yield _column_position(line, column), line + b'\n'
+    if last and not last.startswith(meta):
+        yield _column_position(last, column), last
+
+
+def _column_position(line, column):
+    """
+    :param bytes line: a data line
+    :param int column: the column of the position (1-based)
+    :return: the position
+    :rtype: int
+    :raise ValueError: when the column can not be cast in an integer
+    """
+    fields = line.split(b'\t', column)
+    try:
+        return int(fields[column - 1])
+    except (ValueError, IndexError):
+        raise ValueError(f"{line.decode(errors='replace')}: no position in column {column}") from None
+
+
+def tabix_match_generator(ref_file, target_file, index, contig=None):
+    """
+    create a generator which can iterate over the lines of a bgzf compressed target_file
+    where position appear in reference file.
+    The index of the target is used to decompress only the blocks which can hold the positions
+    of the reference, so the time depends on the number of positions and not on the size of the target.
+    The positions of the target are read in the column of the index (``index.col_beg``),
+    which is not the first one, as :func:`grep_vcf.grep_vcf._parse_line` reads it, for a real vcf.
+
+    .. _warning:
+        the position in the ref_file and target_file must be sorted (ascending)
+
+    :param ref_file: the text file to extract, or its compiled index
+    :type ref_file: file object or :class:`grep_vcf.index.PositionIndex` object
+    :param target_file: the bgzf compressed vcf to compare
+    :type target_file: file object opened in binary mode
+    :param index: the tabix index of target_file
+    :type index: :class:`TabixIndex` object
+    :param str contig: the sequence where to look for the positions,
+                       it can be omitted if the index contains only one sequence.
+    :return: a generator on the selected lines
+    :rtype: generator of bytes
+    :raise ValueError: when the contig is needed or unknown
+    """
+    if contig is None:
+        if len(index.names) != 1:
+            raise ValueError(f"the index contains {len(index.names)} sequences, the contig must be specified.")
+        contig = index.names[0]
+    elif contig not in index.names:
+        raise ValueError(f"the sequence {contig} is not in the index.")
+    try:
+        positions = [pos for pos, _ in gv._records(ref_file)]
+    except ValueError as err:
+        raise ValueError(f"position file has wrong format: {err}") from None
+    ranges = index.chunks(contig, positions)
+    target_records = (record
+                      for data in read_ranges(target_file, ranges)
+                      for record in _column_records(data, index.col_beg, index.meta))
+    yield from gv._merge(zip(positions, repeat(None)), target_records)
@@ -22,7 +22,7 @@
 # If not, see <https://www.gnu.org/licenses/>.                          #
 #########################################################################
 
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 from setuptools.dist import Distribution
 
 from grep_vcf import __version__ as gv_version
@@ -70,9 +70,12 @@ setup(name='grep_vcf',
           'Topic :: Scientific/Engineering :: Bio-Informatics'
           ],
       python_requires='>=3.6',
-      extras_require={'dev': open("requirements_dev.txt").read().split()},
+      extras_require={'dev': open("requirements_dev.txt").read().split(),
+                      'numpy': ['numpy']},
       test_suite='tests.run_tests.discover',
       packages=[p for p in find_packages() if p != 'tests'],
+      # the compiled kernel is optional, grep_vcf falls back on pure python if it cannot be built
+      ext_modules=[Extension('grep_vcf._speedups', ['grep_vcf/_speedups.c'], optional=True)],
       entry_points={
           'console_scripts': [
               'grep_vcf=grep_vcf.scripts.grep_vcf:main',
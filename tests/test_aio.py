@@ -0,0 +1,153 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import asyncio
+from io import BytesIO
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+
+from tests import GrepVcfTest
+from grep_vcf import aio, grep_vcf
+
+
+class AsyncReader:
+    """
+    An asynchronous reader which returns at most *chunk* bytes at once.
+    """
+
+    def __init__(self, data, chunk=3):
+        self.data = data
+        self.chunk = chunk
+
+    async def read(self, n=-1):
+        await asyncio.sleep(0)
+        size = min(n, self.chunk) if n >= 0 else len(self.data)
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def collect(gen):
+    return [batch async for batch in gen]
+
+
+class GrepVcfTestAio(GrepVcfTest):
+
+    ref = b"# bla\n7\n8\n12\n"
+    vcf = b"# vcf\n7\tvcf ligne 1\n8\tvcf ligne 2\n9\tvcf ligne 3\n12\tvcf ligne 4\n13\tvcf ligne 5\n"
+    expected = b"7\tvcf ligne 1\n8\tvcf ligne 2\n12\tvcf ligne 4\n"
+    expected_invert = b"9\tvcf ligne 3\n13\tvcf ligne 5\n"
+
+    def test_match_generator(self):
+        for make in (BytesIO, AsyncReader):
+            with self.subTest(reader=make.__name__):
+                batches = run(collect(aio.match_generator(make(self.ref), make(self.vcf))))
+                self.assertEqual(b''.join(batches), self.expected)
+                batches = run(collect(aio.invert_match_generator(make(self.ref), make(self.vcf))))
+                self.assertEqual(b''.join(batches), self.expected_invert)
+
+    def test_paths(self):
+        pos_file_name = self.find_data('data.txt')
+        data_file_name = self.find_data('data.vcf')
+        with open(pos_file_name, 'rb') as ref, open(data_file_name, 'rb') as target:
+            expected = b''.join(grep_vcf.block_match_generator(ref, target))
+        batches = run(collect(aio.match_generator(pos_file_name, data_file_name)))
+        self.assertEqual(b''.join(batches), expected)
+
+    def test_batches(self):
+        # small batches give back the control to the loop between each of them
+        batches = run(collect(aio.match_generator(BytesIO(self.ref), BytesIO(self.vcf), batch_size=8)))
+        self.assertEqual(b''.join(batches), self.expected)
+        self.assertGreater(len(batches), 1)
+
+    def test_concurrent_jobs(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        async def jobs():
+            return await asyncio.gather(*[collect(aio.match_generator(AsyncReader(self.ref), AsyncReader(self.vcf),
+                                                                      invert=i % 2 == 1, batch_size=8,
+                                                                      executor=executor))
+                                          for i in range(6)])
+        try:
+            results = run(jobs())
+        finally:
+            executor.shutdown()
+        for i, batches in enumerate(results):
+            self.assertEqual(b''.join(batches), self.expected_invert if i % 2 else self.expected)
+
+    def test_max_merges(self):
+        merge = grep_vcf.block_match_generator
+        running = []
+        merges = []
+
+        def block_match_generator(*args, **kwargs):
+            running.append(None)
+            merges.append(len(running))
+            try:
+                yield from merge(*args, **kwargs)
+            finally:
+                running.pop()
+
+        async def jobs():
+            return await asyncio.gather(*[collect(aio.match_generator(AsyncReader(self.ref), AsyncReader(self.vcf),
+                                                                      batch_size=8))
+                                          for _ in range(4)])
+        with patch.object(aio, 'MAX_MERGES', 2), patch.object(aio.gv, 'block_match_generator', block_match_generator):
+            results = run(jobs())
+        self.assertEqual(len(merges), 4)
+        self.assertLessEqual(max(merges), 2)
+        for batches in results:
+            self.assertEqual(b''.join(batches), self.expected)
+
+    def test_early_break(self):
+        merge = grep_vcf.block_match_generator
+        closed = []
+
+        def block_match_generator(*args, **kwargs):
+            try:
+                yield from merge(*args, **kwargs)
+            finally:
+                closed.append(True)
+
+        async def first():
+            gen = aio.match_generator(BytesIO(self.ref), BytesIO(self.vcf), batch_size=8)
+            async for batch in gen:
+                break
+            await gen.aclose()
+            return batch
+        with patch.object(aio.gv, 'block_match_generator', block_match_generator):
+            self.assertEqual(run(first()), b"7\tvcf ligne 1\n")
+        self.assertEqual(closed, [True])
+
+    def test_wrong_format(self):
+        with self.assertRaises(ValueError) as ctx:
+            run(collect(aio.match_generator(BytesIO(self.ref), BytesIO(b"7\tfoo\nbar\tfoo\n"))))
+        self.assertTrue(str(ctx.exception).startswith("vcf has wrong line"))
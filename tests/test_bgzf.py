@@ -0,0 +1,136 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import sys
+import gzip
+import tempfile
+
+from tests import GrepVcfTest
+from grep_vcf import bgzf
+
+
+class GrepVcfTestBgzf(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.data = b''.join(b"%d\tvcf line %d\n" % (i, i) for i in range(30000))
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='test_grep_vcf')
+        self.path = os.path.join(self.tmpdir.name, 'data.vcf.gz')
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def write_bgzf(self, threads=1):
+        with bgzf.open_output(open(self.path, 'wb'), 'wb', threads=threads) as out:
+            out.write(self.data[:100])
+            out.write(self.data[100:])
+
+    def test_write(self):
+        for threads in (1, 3):
+            with self.subTest(threads=threads):
+                self.write_bgzf(threads=threads)
+                with gzip.open(self.path) as compressed:
+                    self.assertEqual(compressed.read(), self.data)
+                with open(self.path, 'rb') as compressed:
+                    content = compressed.read()
+                self.assertTrue(content.endswith(bgzf.EOF_BLOCK))
+                # several blocks
+                self.assertGreater(content.count(b'\x1f\x8b\x08\x04'), 2)
+
+    def test_write_text(self):
+        with bgzf.open_output(open(self.path, 'wb'), 'w') as out:
+            out.write(self.data.decode())
+        with gzip.open(self.path) as compressed:
+            self.assertEqual(compressed.read(), self.data)
+
+    def test_compression(self):
+        self.write_bgzf()
+        self.assertEqual(bgzf.compression(self.path), 'bgzf')
+        gzip_path = os.path.join(self.tmpdir.name, 'data.gz')
+        with gzip.open(gzip_path, 'wb') as compressed:
+            compressed.write(self.data)
+        self.assertEqual(bgzf.compression(gzip_path), 'gzip')
+        self.assertIsNone(bgzf.compression(self.find_data('data.vcf')))
+        self.assertIsNone(bgzf.compression(self.find_data('empty.vcf')))
+
+    def test_open_input(self):
+        self.write_bgzf()
+        for threads in (1, 4):
+            with self.subTest(threads=threads):
+                with bgzf.open_input(self.path, 'rb', threads=threads) as compressed:
+                    self.assertEqual(compressed.read(), self.data)
+                with bgzf.open_input(self.path, 'r', threads=threads) as compressed:
+                    self.assertListEqual(list(compressed), self.data.decode().splitlines(keepends=True))
+        gzip_path = os.path.join(self.tmpdir.name, 'data.gz')
+        with gzip.open(gzip_path, 'wb') as compressed:
+            compressed.write(self.data)
+        with bgzf.open_input(gzip_path, 'rb') as compressed:
+            self.assertEqual(compressed.read(), self.data)
+        with bgzf.open_input(self.find_data('data.vcf')) as plain:
+            self.assertTrue(plain.read().startswith('# bla'))
+
+    def test_close_early(self):
+        self.write_bgzf()
+        # the blocks decompressed ahead by the threads are dropped
+        with bgzf.open_input(self.path, 'rb', threads=4) as compressed:
+            self.assertEqual(compressed.read(10), self.data[:10])
+            reader = compressed.raw
+        self.assertTrue(reader.closed)
+        self.assertEqual(len(reader._pending), 0)
+
+    def test_open_stdin(self):
+        self.write_bgzf()
+        gzip_path = os.path.join(self.tmpdir.name, 'data.gz')
+        with gzip.open(gzip_path, 'wb') as compressed:
+            compressed.write(self.data)
+        stdin = sys.stdin
+        try:
+            for path in self.path, gzip_path, self.find_data('data.vcf'):
+                with self.subTest(path=path):
+                    with open(path, 'rb') as sys.stdin:
+                        with bgzf.open_input(bgzf.STDIO, 'rb') as file:
+                            data = file.read()
+                        # the standard input is not closed
+                        self.assertFalse(sys.stdin.closed)
+                    with bgzf.open_input(path, 'rb') as file:
+                        self.assertEqual(data, file.read())
+            with open(self.find_data('data.vcf'), 'rb') as sys.stdin:
+                with bgzf.open_input(bgzf.STDIO) as file:
+                    self.assertTrue(file.read().startswith('# bla'))
+        finally:
+            sys.stdin = stdin
+
+    def test_corrupted(self):
+        self.write_bgzf()
+        with open(self.path, 'r+b') as compressed:
+            compressed.seek(100)
+            compressed.write(b'\x00' * 10)
+        with self.assertRaises(ValueError):
+            with bgzf.open_input(self.path, 'rb') as compressed:
+                compressed.read()
+        with open(self.path, 'r+b') as compressed:
+            compressed.truncate(1000)
+        with self.assertRaises(ValueError):
+            with bgzf.open_input(self.path, 'rb') as compressed:
+                compressed.read()
@@ -0,0 +1,109 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+from io import StringIO, BytesIO
+from bisect import bisect_left
+from unittest.mock import patch
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf, compact
+from grep_vcf.compact import CompactPanel
+
+
+class GrepVcfTestCompact(GrepVcfTest):
+
+    # gaps of 1, 2, 4 and 8 bytes and duplicates
+    positions = [0, 1, 1, 5, 300, 70000, 70000, 70003, 2 ** 40, 2 ** 40 + 3, 2 ** 40 + 3]
+
+    def test_panel(self):
+        for block_positions in (1, 2, 3, 128):
+            with self.subTest(block_positions=block_positions):
+                with patch.object(compact, 'BLOCK_POSITIONS', block_positions):
+                    panel = CompactPanel(self.positions)
+                self.assertEqual(len(panel), len(self.positions))
+                self.assertEqual(list(panel), self.positions)
+                self.assertEqual(list(panel.records()), [(pos, None) for pos in self.positions])
+                for pos in (0, 1, 2, 5, 6, 300, 69999, 70000, 70004, 2 ** 40 + 3, 2 ** 40 + 4):
+                    self.assertEqual(panel.contains(pos), pos in self.positions)
+                    i = bisect_left(self.positions, pos)
+                    self.assertEqual(panel.next_geq(pos), self.positions[i] if i < len(self.positions) else None)
+        panel = CompactPanel([])
+        self.assertEqual(list(panel), [])
+        self.assertNotIn(0, panel)
+        self.assertIsNone(panel.next_geq(0))
+        self.assertIsNone(panel.memory_report()['bytes_per_position'])
+
+    def test_memory_report(self):
+        panel = CompactPanel(range(0, 30000, 3))
+        report = panel.memory_report()
+        self.assertEqual(report['positions'], 10000)
+        self.assertEqual(report['blocks'], 79)
+        # the gaps are stored on 1 byte
+        self.assertEqual(report['deltas_bytes'], 10000 - 79)
+        self.assertEqual(report['bytes'], panel.nbytes)
+        self.assertLess(report['bytes_per_position'], 2)
+
+    def test_unsorted(self):
+        with self.assertRaises(compact.UnsortedError) as ctx:
+            CompactPanel([1, 5, 3])
+        self.assertEqual(str(ctx.exception), "the positions are not sorted: 3 after 5")
+        with self.assertRaises(ValueError) as ctx:
+            CompactPanel([-1, 5])
+        self.assertEqual(str(ctx.exception), "the positions must be positive: -1")
+
+    def test_from_file(self):
+        text = "# panel\n8\n2\n\n5\n5\n"
+        for positions_file in (StringIO(text), BytesIO(text.encode())):
+            with self.subTest(positions_file=positions_file):
+                self.assertEqual(list(CompactPanel.from_file(positions_file)), [2, 5, 5, 8])
+        # the file is read once, the runs after the sorted head are sorted and merged
+        positions = [pos * 7 % 1000 for pos in range(1000)]
+        text = ''.join(f"{pos}\n" for pos in list(range(100)) + positions)
+        for sort_positions in (10, 64, 2000):
+            with self.subTest(sort_positions=sort_positions):
+                with patch.object(compact, '_SORT_POSITIONS', sort_positions):
+                    panel = CompactPanel.from_file(BytesIO(text.encode()))
+                self.assertEqual(list(panel), sorted(list(range(100)) + positions))
+        for text in ("2\nfoo\n", "-3\n", "5\n3\n-3\n"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError) as ctx:
+                    CompactPanel.from_file(StringIO(text))
+                self.assertTrue(str(ctx.exception).startswith("position file has wrong format"))
+
+    def test_generators(self):
+        pos_file_name = self.find_data('data.txt')
+        data_file_name = self.find_data('data.vcf')
+        with open(pos_file_name) as positions:
+            panel = CompactPanel.from_file(positions)
+        for invert in (False, True):
+            with self.subTest(invert=invert):
+                with open(pos_file_name, 'rb') as ref, open(data_file_name, 'rb') as target:
+                    expected = b''.join(grep_vcf.block_match_generator(ref, target, invert=invert))
+                for gen in (grep_vcf.block_match_generator, grep_vcf.mmap_match_generator,
+                            grep_vcf.skip_match_generator, grep_vcf.numpy_match_generator):
+                    with open(data_file_name, 'rb') as target:
+                        self.assertEqual(b''.join(gen(panel, target, invert=invert)), expected)
+                gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                with open(data_file_name) as target:
+                    self.assertEqual(''.join(gen(panel, target)), expected.decode())
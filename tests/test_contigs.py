@@ -0,0 +1,103 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import tempfile
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import contigs
+
+
+class GrepVcfTestContigs(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.pos_text = ["# panel\n",
+                         "chr1\t5\tline 1\n",
+                         "chr1\t9\tline 2\n",
+                         "chr2\t3\tline 3\n",
+                         "chr10\t4\tline 4\n",
+                         "chr10\t8\tline 5\n"]
+        self.vcf_text = ["##fileformat=VCFv4.2\n",
+                         "##contig=<ID=chr1,length=1000>\n",
+                         "##contig=<ID=chr2,length=1000>\n",
+                         "##contig=<ID=chrX,length=1000>\n",
+                         "##contig=<ID=chr10,length=1000>\n",
+                         "#CHROM\tPOS\tID\n",
+                         "chr1\t5\tvcf line 1\n",
+                         "chr1\t7\tvcf line 2\n",
+                         "chr2\t5\tvcf line 3\n",
+                         "chrX\t4\tvcf line 4\n",
+                         "chr10\t4\tvcf line 5\n",
+                         "chr10\t9\tvcf line 6\n"]
+        self.contigs = ['chr1', 'chr2', 'chrX', 'chr10']
+
+    def test_read_contigs(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            with open(vcf_path, 'w') as vcf:
+                vcf.write(''.join(self.vcf_text))
+            self.assertListEqual(contigs.read_contigs(vcf_path), self.contigs)
+            fai_path = os.path.join(tmpdir, 'ref.fa.fai')
+            with open(fai_path, 'w') as fai:
+                fai.write("chr1\t1000\t6\t60\t61\nchr2\t1000\t1029\t60\t61\n")
+            self.assertListEqual(contigs.read_fai(fai_path), ['chr1', 'chr2'])
+        self.assertListEqual(contigs.read_contigs(self.find_data('data.vcf')), [])
+
+    def test_segments(self):
+        ranks = {name: rank for rank, name in enumerate(self.contigs)}
+        segments = [(rank, list(records))
+                    for rank, records in contigs.segments(StringIO(''.join(self.pos_text)), ranks)]
+        self.assertListEqual(segments, [(0, [(5, "chr1\t5\tline 1\n"), (9, "chr1\t9\tline 2\n")]),
+                                        (1, [(3, "chr2\t3\tline 3\n")]),
+                                        (3, [(4, "chr10\t4\tline 4\n"), (8, "chr10\t8\tline 5\n")])])
+        with self.assertRaises(ValueError):
+            list(contigs.segments(StringIO("chr2\t3\nchr1\t5\n"), ranks))
+        with self.assertRaises(ValueError):
+            list(contigs.segments(StringIO("chr1\t3\nchr3\t5\n"), ranks))
+        with self.assertRaises(ValueError):
+            list(contigs.segments(StringIO("chr1\t3.5\n"), ranks))
+
+    def test_contig_match_generator(self):
+        lines = list(contigs.contig_match_generator(StringIO(''.join(self.pos_text)),
+                                                    StringIO(''.join(self.vcf_text)),
+                                                    self.contigs))
+        self.assertListEqual(lines, ["chr1\t5\tvcf line 1\n", "chr10\t4\tvcf line 5\n"])
+        lines = list(contigs.contig_match_generator(BytesIO(''.join(self.pos_text).encode()),
+                                                    BytesIO(''.join(self.vcf_text).encode()),
+                                                    self.contigs, invert=True))
+        self.assertListEqual(lines, [b"chr1\t7\tvcf line 2\n", b"chr2\t5\tvcf line 3\n",
+                                     b"chrX\t4\tvcf line 4\n", b"chr10\t9\tvcf line 6\n"])
+        # any iterator of lines can be used
+        lines = list(contigs.contig_match_generator(iter(self.pos_text), iter(self.vcf_text), self.contigs))
+        self.assertListEqual(lines, ["chr1\t5\tvcf line 1\n", "chr10\t4\tvcf line 5\n"])
+
+    def test_contig_match_generator_empty(self):
+        self.assertListEqual(list(contigs.contig_match_generator(StringIO(''), StringIO(''.join(self.vcf_text)),
+                                                                 self.contigs)), [])
+        lines = list(contigs.contig_match_generator(StringIO(''), StringIO(''.join(self.vcf_text)),
+                                                    self.contigs, invert=True))
+        self.assertEqual(len(lines), 6)
+        self.assertListEqual(list(contigs.contig_match_generator(StringIO(''.join(self.pos_text)), StringIO(''),
+                                                                 self.contigs)), [])
@@ -25,8 +25,13 @@ import tempfile
 import shutil
 import os
 import sys
+import gzip
+import json
+from unittest.mock import patch
 from grep_vcf.scripts.grep_vcf import main
+from grep_vcf import tabix as gv_tabix
 from tests import GrepVcfTest
+from tests.test_tabix import write_indexed_vcf
 
 
 class Functional(GrepVcfTest):
@@ -135,6 +140,461 @@ class Functional(GrepVcfTest):
             self.assertEqual(res,
                              "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n")
 
+    def test_block_engine(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            for opt, expected in (('', "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n"),
+                                  ('--invert', "8\tvcf ligne 2\n12\tvcf ligne 5\n"),
+                                  ('--switch', "7\ttxt ligne 3\n9\ttxt ligne 4\n11\ttxt ligne 6\n")):
+                for engine in ('block', 'numpy'):
+                    with self.subTest(opt=opt, engine=engine):
+                        out_file_name = os.path.join(tmpdir, 'diff.vcf')
+                        command = f"grep_vcf --engine {engine} {opt} --out {out_file_name} {pos_file_name}"
+                        main(args=command.split()[1:])
+                        with open(out_file_name) as out:
+                            res = out.read()
+                        self.assertEqual(res, expected)
+            command = f"grep_vcf --engine block {pos_file_name}"
+            with self.catch_io(out=True):
+                main(args=command.split()[1:])
+                stdout = sys.stdout.getvalue().strip()
+            self.assertEqual(stdout,
+                             "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4")
+
+    def test_crlf(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'wb') as pos_file:
+                pos_file.write(b"7\r\n9\r\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'wb') as data_file:
+                data_file.write(b"# vcf\r\n7\tvcf ligne 1\r\n8\tvcf ligne 2\r\n\r\n9\tvcf ligne 3\r\n")
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            # all the engines write the line ends as they are in the vcf, the header too
+            for header, expected in (('', b"7\tvcf ligne 1\r\n9\tvcf ligne 3\r\n"),
+                                     ('--header', b"# vcf\r\n7\tvcf ligne 1\r\n9\tvcf ligne 3\r\n")):
+                for opt in ('', '--engine block', '--engine numpy', '--mmap', '--skip', '--unsorted', '--bgzip'):
+                    with self.subTest(header=header, opt=opt):
+                        command = f"grep_vcf {header} {opt} --vcf {data_file_name} --out {out_file_name} " \
+                                  f"{pos_file_name}"
+                        main(args=command.split()[1:])
+                        with gzip.open(out_file_name) if opt == '--bgzip' else open(out_file_name, 'rb') as out:
+                            self.assertEqual(out.read(), expected)
+
+    def test_mmap(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            out_file_name = os.path.join(tmpdir, 'diff.vcf')
+            command = f"grep_vcf --mmap --invert --out {out_file_name} {pos_file_name}"
+            main(args=command.split()[1:])
+            with open(out_file_name) as out:
+                res = out.read()
+            self.assertEqual(res, "8\tvcf ligne 2\n12\tvcf ligne 5\n")
+
+    def test_processes(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            out_file_name = os.path.join(tmpdir, 'diff.vcf')
+            command = f"grep_vcf --processes 2 --switch --out {out_file_name} {pos_file_name}"
+            main(args=command.split()[1:])
+            with open(out_file_name) as out:
+                res = out.read()
+            self.assertEqual(res, "7\ttxt ligne 3\n9\ttxt ligne 4\n11\ttxt ligne 6\n")
+
+    def test_make_index(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            for command in (f"grep_vcf --make-index {pos_file_name}", f"grep_vcf {pos_file_name}"):
+                with self.catch_io(out=True):
+                    main(args=command.split()[1:])
+                    stdout = sys.stdout.getvalue().strip()
+                self.assertTrue(os.path.exists(pos_file_name + '.gvi'))
+                self.assertEqual(stdout,
+                                 "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4")
+
+    def test_unsorted(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'w') as pos_file:
+                pos_file.write("11\ttxt ligne 1\n9\ttxt ligne 2\n# bla\n7\ttxt ligne 3\n")
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            command = f"grep_vcf --unsorted {pos_file_name}"
+            with self.catch_io(out=True, err=True):
+                main(args=command.split()[1:])
+                stdout = sys.stdout.getvalue().strip()
+                stderr = sys.stderr.getvalue().strip()
+            self.assertEqual(stdout,
+                             "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4")
+            self.assertTrue(stderr.startswith("grep_vcf: unsorted mode, 3 positions held in a bitset"))
+            # without --unsorted the files are merged, the order is not checked
+            with self.catch_io(out=True, err=True):
+                main(args=f"grep_vcf {pos_file_name}".split()[1:])
+                self.assertEqual(sys.stderr.getvalue(), '')
+            # the positions in memory are always the ones of the position file
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=f"grep_vcf --unsorted --switch {pos_file_name}".split()[1:])
+
+    def test_skip(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = self.find_data('data.vcf')
+            data_file_name = shutil.copyfile(data_file_name,
+                                             os.path.join(tmpdir, os.path.basename(data_file_name)))
+            out_file_name = os.path.join(tmpdir, 'diff.vcf')
+            command = f"grep_vcf --skip --out {out_file_name} {pos_file_name}"
+            main(args=command.split()[1:])
+            with open(out_file_name) as out:
+                res = out.read()
+            self.assertEqual(res, "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n")
+
+    def test_bgzf(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            pos_file_name = shutil.copyfile(pos_file_name,
+                                            os.path.join(tmpdir, os.path.basename(pos_file_name)))
+            data_file_name = os.path.join(tmpdir, 'data.vcf.gz')
+            with open(self.find_data('data.vcf'), 'rb') as data, gzip.open(data_file_name, 'wb') as compressed:
+                compressed.write(data.read())
+            out_file_name = os.path.join(tmpdir, 'diff.vcf.gz')
+            for engine in ('line', 'block'):
+                with self.subTest(engine=engine):
+                    command = f"grep_vcf --engine {engine} --threads 2 --bgzip --vcf {data_file_name} " \
+                              f"--out {out_file_name} {pos_file_name}"
+                    main(args=command.split()[1:])
+                    with gzip.open(out_file_name, 'rt') as out:
+                        res = out.read()
+                    self.assertEqual(res, "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n")
+            command = f"grep_vcf --mmap --vcf {data_file_name} {pos_file_name}"
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=command.split()[1:])
+
+    def test_tabix(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'w') as pos_file:
+                pos_file.write("# bla\n2500\n100000\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf.gz')
+            lines = [b"chr1\t%d\tvcf ligne\n" % pos for pos in range(1000, 200000, 1500)]
+            write_indexed_vcf(data_file_name, lines)
+            command = f"grep_vcf --tabix --vcf {data_file_name} {pos_file_name}"
+            with self.catch_io(out=True):
+                main(args=command.split()[1:])
+                stdout = sys.stdout.getvalue().strip()
+            self.assertEqual(stdout, "chr1\t2500\tvcf ligne\nchr1\t100000\tvcf ligne")
+            # without --tabix, the positions are in the first column whether there is an index or not
+            command = f"grep_vcf --vcf {data_file_name} {pos_file_name}"
+            with self.catch_io(out=True):
+                with self.assertRaises(ValueError) as ctx:
+                    main(args=command.split()[1:])
+            self.assertTrue(str(ctx.exception).startswith("vcf has wrong format"))
+            for command in (f"grep_vcf --tabix --invert --vcf {data_file_name} {pos_file_name}",
+                            f"grep_vcf --tabix --vcf {self.find_data('data.vcf')} {pos_file_name}"):
+                with self.subTest(command=command):
+                    with self.catch_io(err=True):
+                        with self.assertRaises(SystemExit):
+                            main(args=command.split()[1:])
+            # without --tabix, an index on the first column is not used
+            lines = [b"%d\tchr1\tvcf ligne\n" % pos for pos in range(1000, 200000, 1500)]
+            write_indexed_vcf(data_file_name, lines, col_seq=2, col_beg=1)
+            with patch.object(gv_tabix, 'tabix_match_generator',
+                              wraps=gv_tabix.tabix_match_generator) as tabix_match_generator:
+                with self.catch_io(out=True):
+                    main(args=f"grep_vcf --vcf {data_file_name} {pos_file_name}".split()[1:])
+                    stdout = sys.stdout.getvalue()
+            self.assertFalse(tabix_match_generator.called)
+            self.assertEqual(stdout, "2500\tchr1\tvcf ligne\n100000\tchr1\tvcf ligne\n")
+
+    def test_chrom(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'w') as pos_file:
+                pos_file.write("# bla\nchr1\t7\ttxt ligne 1\nchr2\t9\ttxt ligne 2\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'w') as data_file:
+                data_file.write("##contig=<ID=chr1>\n##contig=<ID=chr2>\n#CHROM\tPOS\n"
+                                "chr1\t7\tvcf ligne 1\nchr1\t9\tvcf ligne 2\nchr2\t9\tvcf ligne 3\n")
+            for opt, expected in (('', "chr1\t7\tvcf ligne 1\nchr2\t9\tvcf ligne 3"),
+                                  ('--invert --engine block', "chr1\t9\tvcf ligne 2")):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf --chrom {opt} {pos_file_name}"
+                    with self.catch_io(out=True):
+                        main(args=command.split()[1:])
+                        stdout = sys.stdout.getvalue().strip()
+                    self.assertEqual(stdout, expected)
+            fai_file_name = os.path.join(tmpdir, 'ref.fa.fai')
+            with open(fai_file_name, 'w') as fai_file:
+                fai_file.write("chr2\t100\nchr1\t100\n")
+            command = f"grep_vcf --chrom --fai {fai_file_name} {pos_file_name}"
+            with self.catch_io(out=True):
+                with self.assertRaises(ValueError):
+                    main(args=command.split()[1:])
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            vcf_names = []
+            for i in range(3):
+                vcf_name = os.path.join(tmpdir, f'sample_{i}.vcf.gz')
+                with open(self.find_data('data.vcf'), 'rb') as data, gzip.open(vcf_name, 'wb') as compressed:
+                    compressed.write(data.read())
+                vcf_names.append(vcf_name)
+            vcf_list = os.path.join(tmpdir, 'vcf_list.txt')
+            with open(vcf_list, 'w') as manifest:
+                manifest.write('\n'.join(vcf_names[1:]) + '\n')
+            out_dir = os.path.join(tmpdir, 'filtered')
+            for opt, expected in (('', "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n"),
+                                  ('--invert --jobs 2', "8\tvcf ligne 2\n12\tvcf ligne 5\n")):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf {opt} --vcf {vcf_names[0]} --vcf-list {vcf_list} " \
+                              f"--out-dir {out_dir} {pos_file_name}"
+                    main(args=command.split()[1:])
+                    for i in range(3):
+                        with open(os.path.join(out_dir, f'sample_{i}.vcf')) as out:
+                            self.assertEqual(out.read(), expected)
+            command = f"grep_vcf --vcf {vcf_names[0]} --vcf {vcf_names[1]} {pos_file_name}"
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=command.split()[1:])
+
+    def test_panel(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            panel_file_name = os.path.join(tmpdir, 'qc.txt')
+            with open(panel_file_name, 'w') as panel_file:
+                panel_file.write("# qc\n8\n12\n")
+            out_dir = os.path.join(tmpdir, 'split')
+            command = f"grep_vcf --vcf {self.find_data('data.vcf')} --panel {panel_file_name} " \
+                      f"--out-dir {out_dir} {pos_file_name}"
+            main(args=command.split()[1:])
+            with open(os.path.join(out_dir, 'data.vcf')) as out:
+                self.assertEqual(out.read(), "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n")
+            with open(os.path.join(out_dir, 'qc.vcf')) as out:
+                self.assertEqual(out.read(), "8\tvcf ligne 2\n12\tvcf ligne 5\n")
+            command = f"grep_vcf --vcf {self.find_data('data.vcf')} --panel {panel_file_name} {pos_file_name}"
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=command.split()[1:])
+
+    def test_stdin(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            data_file_name = os.path.join(tmpdir, 'data.vcf.gz')
+            with open(self.find_data('data.vcf'), 'rb') as data, gzip.open(data_file_name, 'wb') as compressed:
+                compressed.write(data.read())
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            stdin, stdout = sys.stdin, sys.stdout
+            try:
+                for opt, stdin_file, expected in (
+                        (f"--vcf - {pos_file_name}", data_file_name,
+                         "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n"),
+                        (f"--engine block --invert --vcf {self.find_data('data.vcf')} -", pos_file_name,
+                         "8\tvcf ligne 2\n12\tvcf ligne 5\n"),
+                        (f"--switch --vcf - {pos_file_name}", data_file_name,
+                         "7\ttxt ligne 3\n9\ttxt ligne 4\n11\ttxt ligne 6\n")):
+                    with self.subTest(opt=opt):
+                        # the output is written on the standard output by big blocks
+                        with open(stdin_file, 'rb') as sys.stdin, open(out_file_name, 'w') as sys.stdout:
+                            main(args=f"grep_vcf --out - {opt}".split()[1:])
+                        with open(out_file_name) as out:
+                            self.assertEqual(out.read(), expected)
+            finally:
+                sys.stdin, sys.stdout = stdin, stdout
+            for opt in (f"--vcf - -", "-", f"--mmap --vcf - {pos_file_name}"):
+                with self.subTest(opt=opt):
+                    with self.catch_io(err=True):
+                        with self.assertRaises(SystemExit):
+                            main(args=f"grep_vcf {opt}".split()[1:])
+
+    def test_stdin_pipe(self):
+        # a pipe cannot seek, unlike a file redirected on the standard input
+        pos_file_name = self.find_data('data.txt')
+        with open(self.find_data('data.vcf'), 'rb') as data:
+            vcf = data.read()
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            command = f"grep_vcf --header --vcf {self.find_data('data.vcf')} --out {out_file_name} {pos_file_name}"
+            main(args=command.split()[1:])
+            with open(out_file_name) as out:
+                expected = out.read()
+            stdin = sys.stdin
+            try:
+                for opt in ('', '--engine block', '--engine block --stats'):
+                    with self.subTest(opt=opt):
+                        read_end, write_end = os.pipe()
+                        with os.fdopen(write_end, 'wb') as pipe:
+                            pipe.write(vcf)
+                        with os.fdopen(read_end, 'rb') as sys.stdin:
+                            with self.catch_io(err=True):
+                                main(args=f"grep_vcf --header {opt} --vcf - --out {out_file_name} "
+                                          f"{pos_file_name}".split()[1:])
+                        with open(out_file_name) as out:
+                            self.assertEqual(out.read(), expected)
+                # the positions are streamed from the pipe, with or without checking their order
+                with open(pos_file_name, 'rb') as positions:
+                    pos = positions.read()
+                for opt in ('', '--strict', '--engine block --strict'):
+                    with self.subTest(opt=opt, positions='-'):
+                        read_end, write_end = os.pipe()
+                        with os.fdopen(write_end, 'wb') as pipe:
+                            pipe.write(pos)
+                        with os.fdopen(read_end, 'rb') as sys.stdin:
+                            main(args=f"grep_vcf --header {opt} --vcf {self.find_data('data.vcf')} "
+                                      f"--out {out_file_name} -".split()[1:])
+                        with open(out_file_name) as out:
+                            self.assertEqual(out.read(), expected)
+            finally:
+                sys.stdin = stdin
+
+    def test_header(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = self.find_data('data.txt')
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'w') as data_file:
+                data_file.write("##fileformat=VCFv4.2\n#CHROM\tPOS\n7\tvcf ligne 1\n8\tvcf ligne 2\n")
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            expected = "##fileformat=VCFv4.2\n#CHROM\tPOS\n7\tvcf ligne 1\n"
+            for opt in ('', '--engine block', '--mmap', '--processes 2', '--unsorted'):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf --header {opt} --vcf {data_file_name} --out {out_file_name} {pos_file_name}"
+                    main(args=command.split()[1:])
+                    with open(out_file_name) as out:
+                        self.assertEqual(out.read(), expected)
+            with self.catch_io(out=True):
+                main(args=f"grep_vcf --header --vcf {data_file_name} {pos_file_name}".split()[1:])
+                self.assertEqual(sys.stdout.getvalue(), expected)
+            out_dir = os.path.join(tmpdir, 'batch')
+            main(args=f"grep_vcf --header --vcf {data_file_name} --out-dir {out_dir} {pos_file_name}".split()[1:])
+            with open(os.path.join(out_dir, 'data.vcf')) as out:
+                self.assertEqual(out.read(), expected)
+
+    def test_stats(self):
+        pos_file_name = self.find_data('data.txt')
+        data_file_name = self.find_data('data.vcf')
+        with open(data_file_name) as data_file:
+            vcf_lines = data_file.readlines()
+        for opt in ('', '--engine block', '--mmap', '--skip', '--unsorted'):
+            with self.subTest(opt=opt):
+                with self.catch_io(out=True, err=True):
+                    main(args=f"grep_vcf --stats {opt} --vcf {data_file_name} {pos_file_name}".split()[1:])
+                    selected = sys.stdout.getvalue()
+                    err = sys.stderr.getvalue()
+                # the report follows the messages of the run
+                report = json.loads(err[err.index('{'):])
+                self.assertEqual(report['matches'], selected.count('\n'))
+                self.assertEqual(report['bytes_out'], len(selected.encode()))
+                self.assertEqual(report['inputs']['target']['bytes'], os.path.getsize(data_file_name))
+                if opt in ('', '--engine block', '--mmap'):
+                    self.assertEqual(report['inputs']['target']['lines'], len(vcf_lines))
+                    self.assertIsNotNone(report['time']['parse'])
+                else:
+                    # the files are not read again to count their lines
+                    self.assertIsNone(report['inputs']['target']['lines'])
+                    self.assertIsNone(report['time']['parse'])
+        with self.catch_io(err=True):
+            with self.assertRaises(SystemExit):
+                main(args=f"grep_vcf --stats --out-dir out --vcf {data_file_name} {pos_file_name}".split()[1:])
+
+    def test_intervals(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            intervals_file_name = os.path.join(tmpdir, 'regions.txt')
+            with open(intervals_file_name, 'w') as intervals_file:
+                intervals_file.write("# start end\n7 8\n11 20\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'w') as data_file:
+                data_file.write("#CHROM\tPOS\n5\tvcf ligne 1\n7\tvcf ligne 2\n8\tvcf ligne 3\n"
+                                "9\tvcf ligne 4\n15\tvcf ligne 5\n")
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            for opt, expected in (('', "7\tvcf ligne 2\n8\tvcf ligne 3\n15\tvcf ligne 5\n"),
+                                  ('--engine block', "7\tvcf ligne 2\n8\tvcf ligne 3\n15\tvcf ligne 5\n"),
+                                  ('--invert', "5\tvcf ligne 1\n9\tvcf ligne 4\n"),
+                                  ('--header --engine block --invert',
+                                   "#CHROM\tPOS\n5\tvcf ligne 1\n9\tvcf ligne 4\n")):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf --intervals {opt} --vcf {data_file_name} --out {out_file_name} " \
+                              f"{intervals_file_name}"
+                    main(args=command.split()[1:])
+                    with open(out_file_name) as out:
+                        self.assertEqual(out.read(), expected)
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=f"grep_vcf --intervals --mmap --vcf {data_file_name} {intervals_file_name}".split()[1:])
+
+    def test_strict(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'w') as pos_file:
+                pos_file.write("7\n8\n10\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'w') as data_file:
+                data_file.write("# vcf\n7\tvcf ligne 1\n9\tvcf ligne 2\n# bla\n8\tvcf ligne 3\n")
+            # the lines are numbered in the file, the header copied is counted
+            for opt in ('', '--engine block', '--mmap', '--invert', '--header', '--header --engine block',
+                        '--header --mmap', '--header --stats'):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf --strict {opt} --vcf {data_file_name} {pos_file_name}"
+                    with self.catch_io(out=True, err=True):
+                        with self.assertRaises(ValueError) as ctx:
+                            main(args=command.split()[1:])
+                    self.assertEqual(str(ctx.exception),
+                                     "vcf is not sorted: the line 5 (position 8) comes after the position 9")
+            with self.catch_io(err=True):
+                with self.assertRaises(SystemExit):
+                    main(args=f"grep_vcf --strict --skip --vcf {data_file_name} {pos_file_name}".split()[1:])
+
+    def test_sort(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_file_name = os.path.join(tmpdir, 'data.txt')
+            with open(pos_file_name, 'w') as pos_file:
+                pos_file.write("# positions\n9\n7\n3\n")
+            data_file_name = os.path.join(tmpdir, 'data.vcf')
+            with open(data_file_name, 'w') as data_file:
+                data_file.write("#CHROM\tPOS\n9\tvcf ligne 1\n5\tvcf ligne 2\n7\tvcf ligne 3\n"
+                                "3\tvcf ligne 4\n8\tvcf ligne 5\n")
+            out_file_name = os.path.join(tmpdir, 'out.vcf')
+            for opt, expected in (('', "3\tvcf ligne 4\n7\tvcf ligne 3\n9\tvcf ligne 1\n"),
+                                  ('--processes 2 --sort-memory 1', "3\tvcf ligne 4\n7\tvcf ligne 3\n"
+                                                                    "9\tvcf ligne 1\n"),
+                                  (f'--tmpdir {tmpdir} --invert', "5\tvcf ligne 2\n8\tvcf ligne 5\n"),
+                                  ('--header --invert', "#CHROM\tPOS\n5\tvcf ligne 2\n8\tvcf ligne 5\n"),
+                                  ('--switch', "3\n7\n9\n")):
+                with self.subTest(opt=opt):
+                    command = f"grep_vcf --sort {opt} --vcf {data_file_name} --out {out_file_name} {pos_file_name}"
+                    main(args=command.split()[1:])
+                    with open(out_file_name) as out:
+                        self.assertEqual(out.read(), expected)
+            for command in (f"grep_vcf --sort --mmap --vcf {data_file_name} {pos_file_name}",
+                            f"grep_vcf --tmpdir {tmpdir} --vcf {data_file_name} {pos_file_name}"):
+                with self.subTest(command=command):
+                    with self.catch_io(err=True):
+                        with self.assertRaises(SystemExit):
+                            main(args=command.split()[1:])
+
     def test_no_position_file(self):
         with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
             pos_file_name = self.find_data('data.txt')
@@ -22,10 +22,17 @@
 # If not, see <https://www.gnu.org/licenses/>.                          #
 #########################################################################
 
+import io
+import codecs
+import tempfile
+import unittest
+import os
+
 from tests import GrepVcfTest
-from io import StringIO
+from io import StringIO, BytesIO
 
 from grep_vcf import grep_vcf
+from grep_vcf.position_filter import PositionFilter
 
 
 class GrepVcfTestModule(GrepVcfTest):
@@ -65,6 +72,17 @@ class GrepVcfTestModule(GrepVcfTest):
         self.assertEqual(str(ctx.exception),
                          "4.5 line 1: invalid literal for int() with base 10: '4.5'")
 
+    def test_parse_line_first_field(self):
+        wide = "12\t" + "\t".join(["0/1:35,12:47:99"] * 1000) + "\n"
+        for text, expected in ((wide, 12),
+                               (" \t 13 vcf\n", 13),
+                               ("14\u2003vcf\n", 14),  # an unicode whitespace ends the field as with split
+                               ("15", 15)):
+            with self.subTest(text=text[:20]):
+                pos, line = grep_vcf._parse_line(StringIO(text))
+                self.assertEqual(pos, expected)
+                self.assertEqual(line, text.lstrip())
+
     def test_until_the_end(self):
         pos_txt = StringIO(''.join(self.pos_text))
         lines = [l for l in grep_vcf._until_the_end(pos_txt)]
@@ -82,6 +100,17 @@ class GrepVcfTestModule(GrepVcfTest):
                                     "11\tvcf line 4\n"
                                     ])
 
+    def test_match_generator_iterator(self):
+        # any iterator of lines can be used, not only the text files
+        expected = ["8\tvcf line 2\n", "9\tvcf line 3\n", "11\tvcf line 4\n"]
+        diff = list(grep_vcf.match_generator(iter(self.pos_text), iter(self.vcf_text)))
+        self.assertListEqual(diff, expected)
+        pos_reader = codecs.getreader('utf-8')(BytesIO(''.join(self.pos_text).encode()))
+        diff = list(grep_vcf.match_generator(pos_reader, StringIO(''.join(self.vcf_text))))
+        self.assertListEqual(diff, expected)
+        diff = list(grep_vcf.invert_match_generator(iter(self.pos_text), iter(self.vcf_text)))
+        self.assertListEqual(diff, ["7\tvcf line 1\n", "12\tvcf line 5\n"])
+
     def test_match_generator_bad_pos1(self):
         vcf_txt = StringIO(''.join(self.vcf_text))
         pos_text = self.pos_text[:]
@@ -274,3 +303,323 @@ class GrepVcfTestModule(GrepVcfTest):
         self.assertListEqual(diff, ['9\tvcf 1\n',
                                     '10\tvcf 2\n',
                                     '11\tvcf 3\n'])
+
+
+    def test_scan_records(self):
+        buf = b"  4\tline 1\n# comment\n\n   \n5\tline 2"
+        records = list(grep_vcf._scan_records(buf))
+        self.assertListEqual(records, [(4, b"4\tline 1\n"), (5, b"5\tline 2")])
+
+        view = memoryview(buf)
+        records = list(grep_vcf._scan_records(buf, start=buf.index(b"5\t"), view=view))
+        self.assertEqual(len(records), 1)
+        self.assertIsInstance(records[0][1], memoryview)
+        self.assertEqual(records[0][1].tobytes(), b"5\tline 2")
+
+        with self.assertRaises(ValueError) as ctx:
+            _ = list(grep_vcf._scan_records(b"4.5 line 1\n"))
+        self.assertEqual(str(ctx.exception),
+                         "4.5 line 1: invalid literal for int() with base 10: '4.5'")
+
+    def test_block_records(self):
+        pos_bin = ''.join(self.pos_text).encode()
+        expected = [(pos, line.encode()) for pos, line in grep_vcf._text_records(StringIO(''.join(self.pos_text)))]
+        for block_size in (1, 3, 7, 1024):
+            with self.subTest(block_size=block_size):
+                records = list(grep_vcf._block_records(BytesIO(pos_bin), block_size=block_size))
+                self.assertListEqual(records, expected)
+
+    def test_block_match_generator(self):
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            expected = ''.join(gen(StringIO(''.join(self.pos_text)), StringIO(''.join(self.vcf_text))))
+            for block_size in (1, 5, 1024):
+                with self.subTest(invert=invert, block_size=block_size):
+                    pos_bin = BytesIO(''.join(self.pos_text).encode())
+                    vcf_bin = BytesIO(''.join(self.vcf_text).encode())
+                    chunks = list(grep_vcf.block_match_generator(pos_bin, vcf_bin,
+                                                                 invert=invert, block_size=block_size))
+                    self.assertEqual(b''.join(chunks), expected.encode())
+
+    def test_block_match_generator_crlf(self):
+        pos = "7\r\n9\r\n"
+        vcf = "# vcf\r\n7\tvcf 1\r\n8\tvcf 2\r\n\r\n9\tvcf 3\r\n"
+        for invert in (False, True):
+            with self.subTest(invert=invert):
+                gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                # the line ends are not translated by a text file opened with newline=''
+                expected = ''.join(gen(StringIO(pos, newline=''), StringIO(vcf, newline='')))
+                self.assertEqual(expected, "8\tvcf 2\r\n" if invert else "7\tvcf 1\r\n9\tvcf 3\r\n")
+                chunks = grep_vcf.block_match_generator(BytesIO(pos.encode()), BytesIO(vcf.encode()), invert=invert)
+                self.assertEqual(b''.join(chunks), expected.encode())
+
+    def test_merge_strict(self):
+        def numbered(records, count):
+            # the records of a stream without comment, one line each
+            for number, record in enumerate(records, 1):
+                count.number = number
+                yield record
+
+        for merge in {grep_vcf._merge, grep_vcf._py_merge}:
+            for invert in (False, True):
+                with self.subTest(merge=merge, invert=invert):
+                    ref = [(4, None), (8, None), (11, None)]
+                    target = [(7, '7\tvcf 1\n'), (8, '8\tvcf 2\n'), (12, '12\tvcf 3\n')]
+                    self.assertListEqual(list(merge(iter(ref), iter(target), invert=invert, strict=True)),
+                                         list(merge(iter(ref), iter(target), invert=invert)))
+                    # the lines of the records of an index are not counted, only the positions are reported
+                    cases = (([(8, None), (4, None)], target,
+                              "position file is not sorted: the position 4 comes after the position 8"),
+                             (ref, [(7, 'a'), (3, 'b'), (12, 'c')],
+                              "vcf is not sorted: the line 2 (position 3) comes after the position 7"),
+                             ([(4, '4'), (11, '11'), (9, '9')], [(4, 'a'), (12, 'b')],
+                              "position file is not sorted: the line 3 (position 9) comes after the position 11"))
+                    for ref_records, target_records, msg in cases:
+                        ref_lines, target_lines = grep_vcf._LineCount(), grep_vcf._LineCount()
+                        with self.assertRaises(ValueError) as ctx:
+                            list(merge(numbered(ref_records, ref_lines), numbered(target_records, target_lines),
+                                       invert=invert, strict=True,
+                                       ref_lines=None if ref_records[0][1] is None else ref_lines,
+                                       target_lines=target_lines))
+                        self.assertEqual(str(ctx.exception), msg)
+                        # without strict the wrong order is not detected
+                        list(merge(iter(ref_records), iter(target_records), invert=invert))
+                    # the merge stops when the reference is exhausted, the rest of the target is read
+                    # only to be yielded with invert
+                    target = [(4, 'a'), (8, 'b'), (6, 'c')]
+                    target_lines = grep_vcf._LineCount()
+                    merged = merge(iter([(4, None)]), numbered(target, target_lines), invert=invert, strict=True,
+                                   target_lines=target_lines)
+                    if invert:
+                        with self.assertRaises(ValueError) as ctx:
+                            list(merged)
+                        self.assertEqual(str(ctx.exception),
+                                         "vcf is not sorted: the line 3 (position 6) comes after the position 8")
+                    else:
+                        self.assertListEqual(list(merged), ['a'])
+
+    def test_strict_line_numbers(self):
+        # the lines are numbered in the file, the comments and the blank lines are counted
+        pos = "# panel\n4\n\n8\n#\n11\n"
+        vcf = "##fileformat=VCFv4.2\n#CHROM\tPOS\n7\tvcf 1\n\n9\tvcf 2\n# bla\n8\tvcf 3\n12\tvcf 4\n"
+        vcf_msg = "vcf is not sorted: the line 7 (position 8) comes after the position 9"
+        bad_pos = "# panel\n4\n\n11\n#\n9\n"
+        pos_msg = "position file is not sorted: the line 6 (position 9) comes after the position 11"
+        for invert in (False, True):
+            for pos_text, vcf_text, msg in ((pos, vcf, vcf_msg), (bad_pos, "4\ta\n# bla\n12\tb\n", pos_msg)):
+                with self.subTest(invert=invert, msg=msg):
+                    gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                    with self.assertRaises(ValueError) as ctx:
+                        list(gen(StringIO(pos_text), StringIO(vcf_text), strict=True))
+                    self.assertEqual(str(ctx.exception), msg)
+                    for block_size in (1, 5, 1024):
+                        with self.assertRaises(ValueError) as ctx:
+                            list(grep_vcf.block_match_generator(BytesIO(pos_text.encode()),
+                                                                BytesIO(vcf_text.encode()),
+                                                                invert=invert, block_size=block_size, strict=True))
+                        self.assertEqual(str(ctx.exception), msg)
+                    with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+                        paths = []
+                        for name, text in (('pos.txt', pos_text), ('data.vcf', vcf_text)):
+                            paths.append(os.path.join(tmpdir, name))
+                            with open(paths[-1], 'w') as file:
+                                file.write(text)
+                        with open(paths[0], 'rb') as pos_file, open(paths[1], 'rb') as vcf_file:
+                            with self.assertRaises(ValueError) as ctx:
+                                list(grep_vcf.mmap_match_generator(pos_file, vcf_file, invert=invert, strict=True))
+                            self.assertEqual(str(ctx.exception), msg)
+
+    def test_batches(self):
+        lines = [f"{i}\tline\n" for i in range(100)]
+        for batch_bytes in (1, 30, 100000):
+            with self.subTest(batch_bytes=batch_bytes):
+                batches = list(grep_vcf._batches(iter(lines), batch_bytes))
+                self.assertEqual([line for batch in batches for line in batch], lines)
+                # the number of lines grows at most 8 times from one batch to the next
+                for batch, next_batch in zip(batches, batches[1:-1]):
+                    self.assertLessEqual(len(next_batch), 8 * len(batch))
+                if batch_bytes == 1:
+                    self.assertEqual(len(batches), len(lines))
+        self.assertEqual(list(grep_vcf._batches(iter([]), 10)), [])
+
+    def test_match_batches(self):
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            expected = list(gen(StringIO(''.join(self.pos_text)), StringIO(''.join(self.vcf_text))))
+            for batch_bytes in (1, 15, 1024):
+                with self.subTest(invert=invert, batch_bytes=batch_bytes):
+                    batches = list(grep_vcf.match_batches(StringIO(''.join(self.pos_text)),
+                                                          StringIO(''.join(self.vcf_text)),
+                                                          invert=invert, batch_bytes=batch_bytes))
+                    self.assertTrue(all(batches))
+                    self.assertListEqual([line for batch in batches for line in batch], expected)
+                    batches = grep_vcf.match_batches(BytesIO(''.join(self.pos_text).encode()),
+                                                     BytesIO(''.join(self.vcf_text).encode()),
+                                                     invert=invert, batch_bytes=batch_bytes)
+                    self.assertEqual(b''.join(line for batch in batches for line in batch),
+                                     ''.join(expected).encode())
+
+    def test_block_match_generator_limit_cases(self):
+        cases = [('', ''.join(self.vcf_text)),
+                 (''.join(self.pos_text), ''),
+                 ('8\tline 1\n9\tline 2\n', '8\tvcf 1\n'),
+                 ('9\tline 1\n', '9\tvcf 1\n10\tvcf 2\n11\tvcf 3'),
+                 ('7\tline 1\n', '  9\tvcf 1\n10\tvcf 2\n11\tvcf 3\n'),
+                 ]
+        for pos_text, vcf_text in cases:
+            for invert in (False, True):
+                gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                expected = ''.join(gen(StringIO(pos_text), StringIO(vcf_text)))
+                with self.subTest(pos=pos_text, vcf=vcf_text, invert=invert):
+                    chunks = grep_vcf.block_match_generator(BytesIO(pos_text.encode()),
+                                                            BytesIO(vcf_text.encode()),
+                                                            invert=invert)
+                    self.assertEqual(b''.join(chunks), expected.encode())
+
+    def test_block_match_generator_bad_lines(self):
+        pos_text = self.pos_text[:]
+        pos_text.insert(4, "8.5\tbad position\n")
+        vcf_text = self.vcf_text[:]
+        vcf_text.insert(3, "8.5\tbad position\n")
+        for pos, vcf in ((pos_text, self.vcf_text), (self.pos_text, vcf_text)):
+            for invert in (False, True):
+                with self.subTest(invert=invert):
+                    with self.assertRaises(ValueError):
+                        _ = list(grep_vcf.block_match_generator(BytesIO(''.join(pos).encode()),
+                                                                BytesIO(''.join(vcf).encode()),
+                                                                invert=invert))
+
+    def test_mmap_match_generator(self):
+        cases = [(''.join(self.pos_text), ''.join(self.vcf_text)),
+                 ('', ''.join(self.vcf_text)),
+                 (''.join(self.pos_text), ''),
+                 ('9\tline 1\n', '9\tvcf 1\n10\tvcf 2\n11\tvcf 3'),
+                 ]
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_path = os.path.join(tmpdir, 'pos.txt')
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            for pos_text, vcf_text in cases:
+                for path, text in (pos_path, pos_text), (vcf_path, vcf_text):
+                    with open(path, 'w') as f:
+                        f.write(text)
+                for invert in (False, True):
+                    gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                    expected = ''.join(gen(StringIO(pos_text), StringIO(vcf_text)))
+                    with self.subTest(pos=pos_text, vcf=vcf_text, invert=invert):
+                        with open(pos_path, 'rb') as pos, open(vcf_path, 'rb') as vcf:
+                            lines = list(grep_vcf.mmap_match_generator(pos, vcf, invert=invert))
+                        self.assertTrue(all(isinstance(l, memoryview) for l in lines))
+                        self.assertEqual(b''.join(lines), expected.encode())
+
+    def test_gallop(self):
+        buf = ''.join(f"{pos}\tvcf line\n" if pos % 7 else f"# comment\n{pos}\tvcf line\n"
+                      for pos in range(10, 2000, 3)).encode()
+        for pos in (0, 10, 11, 13, 500, 1000, 1999, 2000, 5000):
+            for lo in (0, grep_vcf._line_start(buf, 100)):
+                with self.subTest(pos=pos, lo=lo):
+                    offset = grep_vcf._gallop(buf, pos, lo, step=16)
+                    self.assertTrue(offset in (lo, len(buf)) or buf[offset - 1:offset] == b'\n')
+                    for previous_pos, _ in grep_vcf._scan_records(buf, lo, offset):
+                        self.assertLess(previous_pos, pos)
+                    following = grep_vcf._next_record(buf, offset)
+                    if following:
+                        self.assertGreaterEqual(following[0], pos)
+
+    def test_skip_match_generator(self):
+        cases = [(''.join(self.pos_text), ''.join(self.vcf_text)),
+                 ('', ''.join(self.vcf_text)),
+                 (''.join(self.pos_text), ''),
+                 ('5\tline 1\n5\tline 2\n9\tline 3\n', '5\tvcf 1\n5\tvcf 2\n5\tvcf 3\n9\tvcf 4'),
+                 (''.join(f"{pos}\tline\n" for pos in range(1, 3000, 97)),
+                  ''.join(f"{pos}\tvcf line\n" for pos in range(1, 3000, 2))),
+                 ]
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_path = os.path.join(tmpdir, 'pos.txt')
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            for pos_text, vcf_text in cases:
+                for path, text in (pos_path, pos_text), (vcf_path, vcf_text):
+                    with open(path, 'w') as f:
+                        f.write(text)
+                for invert in (False, True):
+                    gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                    expected = ''.join(gen(StringIO(pos_text), StringIO(vcf_text)))
+                    with self.subTest(pos=pos_text[:20], vcf=vcf_text[:20], invert=invert):
+                        with open(pos_path, 'rb') as pos, open(vcf_path, 'rb') as vcf:
+                            lines = list(grep_vcf.skip_match_generator(pos, vcf, invert=invert))
+                        self.assertEqual(b''.join(lines), expected.encode())
+
+    @unittest.skipIf(grep_vcf.np is None, "numpy is not installed")
+    def test_array_records(self):
+        data = b"# bla\n7\tvcf 1\n\n12 vcf 2\n13"
+        starts, stops, is_data, positions = grep_vcf._array_records(grep_vcf.np.frombuffer(data, dtype='uint8'))
+        self.assertListEqual(starts.tolist(), [0, 6, 14, 15, 24])
+        self.assertListEqual(stops.tolist(), [6, 14, 15, 24, 26])
+        self.assertListEqual(is_data.tolist(), [False, True, False, True, True])
+        self.assertListEqual(positions.tolist(), [7, 12, 13])
+        # the irregular lines are left to the python parser
+        for data in (b"7\tvcf 1\n  8\tvcf 2\n", b"7a\tvcf 1\n", b"1234567890123456789\tvcf 1\n"):
+            with self.subTest(data=data):
+                self.assertIsNone(grep_vcf._array_records(grep_vcf.np.frombuffer(data, dtype='uint8')))
+
+    def test_numpy_match_generator(self):
+        pos_text = "# bla\n3\n5\n7\n7\n9\n12\n"
+        vcf_text = "# vcf\n1\tvcf 1\n3\tvcf 2\n3\tvcf 3\n5\tvcf 4\n\n7\tvcf 5\n7\tvcf 6\n" \
+                   "  7\tvcf 7\n8\tvcf 8\n9\tvcf 9\n12\tvcf 10\n13\tvcf 11"
+        numpy = grep_vcf.np
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_path = os.path.join(tmpdir, 'pos.txt')
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            for path, text in (pos_path, pos_text), (vcf_path, vcf_text):
+                with open(path, 'w') as f:
+                    f.write(text)
+            try:
+                for np in {numpy, None}:
+                    grep_vcf.np = np
+                    for invert in (False, True):
+                        gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+                        expected = ''.join(gen(StringIO(pos_text), StringIO(vcf_text)))
+                        # the small chunks split the runs of lines with the same position
+                        for chunk_size in (1, 10, 20, grep_vcf.BLOCK_SIZE):
+                            with self.subTest(numpy=np is not None, invert=invert, chunk_size=chunk_size):
+                                with open(pos_path, 'rb') as pos, open(vcf_path, 'rb') as vcf:
+                                    lines = list(grep_vcf.numpy_match_generator(pos, vcf, invert=invert,
+                                                                                chunk_size=chunk_size))
+                                self.assertTrue(all(isinstance(l, memoryview) for l in lines))
+                                self.assertEqual(b''.join(lines), expected.encode())
+            finally:
+                grep_vcf.np = numpy
+            with open(pos_path, 'rb') as pos, open(vcf_path, 'rb') as vcf:
+                self.assertEqual(b''.join(grep_vcf.numpy_match_generator(PositionFilter([7, 9]), vcf)),
+                                 b"7\tvcf 5\n9\tvcf 9\n")
+
+    def test_copy_header(self):
+        header = "##fileformat=VCFv4.2\n##contig=<ID=chr1>\n#CHROM\tPOS\n"
+        data = "7\tvcf 1\n# not in the header\n9\tvcf 2\n"
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            out_path = os.path.join(tmpdir, 'out.vcf')
+            with open(vcf_path, 'w') as f:
+                f.write(header + data)
+            # copied by the kernel in a real file, then the merge goes on with the data lines
+            for mode in ('b', ''):
+                with self.subTest(mode=mode):
+                    with open(vcf_path, 'r' + mode) as vcf, open(out_path, 'w' + mode) as out:
+                        self.assertEqual(grep_vcf.copy_header(vcf, out), len(header))
+                        out.write(next(vcf))
+                    with open(out_path) as out:
+                        self.assertEqual(out.read(), header + "7\tvcf 1\n")
+            with open(vcf_path, 'rb') as vcf:
+                out = StringIO()
+                grep_vcf.copy_header(vcf, out)
+                self.assertEqual(out.getvalue(), header)
+            # the streams which cannot be mapped
+            for vcf in (BytesIO((header + data).encode()), io.BufferedReader(BytesIO((header + data).encode()))):
+                with self.subTest(vcf=type(vcf)):
+                    out = BytesIO()
+                    self.assertEqual(grep_vcf.copy_header(vcf, out), len(header))
+                    self.assertEqual(out.getvalue(), header.encode())
+                    self.assertEqual(vcf.read(), data.encode())
+            out = BytesIO()
+            self.assertEqual(grep_vcf.copy_header(BytesIO(data.encode()), out), 0)
+            self.assertEqual(out.getvalue(), b'')
+            self.assertEqual(grep_vcf.read_header(BytesIO(header.encode())), header.encode())
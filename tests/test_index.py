@@ -0,0 +1,114 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import tempfile
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf import index
+
+
+class GrepVcfTestIndex(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.pos_text = ["4\tline 1\n",
+                         "5\tline 2\n",
+                         "# comment 1\n",
+                         "8\tline 3\n",
+                         "9\tline 4\n",
+                         "11\tline 5\n"]
+        self.vcf_text = ["# comment 1\n",
+                         "7\tvcf line 1\n",
+                         "8\tvcf line 2\n",
+                         "9\tvcf line 3\n",
+                         "11\tvcf line 4\n",
+                         "12\tvcf line 5\n"]
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='test_grep_vcf')
+        self.pos_path = os.path.join(self.tmpdir.name, 'data.txt')
+        with open(self.pos_path, 'w') as pos:
+            pos.write(''.join(self.pos_text))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_compile_load(self):
+        self.assertIsNone(index.load_index(self.pos_path))
+        path = index.compile_index(self.pos_path)
+        self.assertEqual(path, self.pos_path + '.gvi')
+        idx = index.load_index(self.pos_path)
+        self.assertEqual(len(idx), 5)
+        self.assertListEqual(list(idx.records()), [(p, None) for p in (4, 5, 8, 9, 11)])
+
+    def test_load_out_of_date(self):
+        index.compile_index(self.pos_path)
+        with open(self.pos_path, 'a') as pos:
+            pos.write("12\tline 6\n")
+        self.assertIsNone(index.load_index(self.pos_path))
+
+    def test_load_corrupted(self):
+        path = index.compile_index(self.pos_path)
+        with open(path, 'r+b') as idx:
+            idx.seek(-1, os.SEEK_END)
+            idx.write(b'\xff')
+        # the checksum is checked only on request
+        self.assertIsNotNone(index.load_index(self.pos_path))
+        self.assertIsNone(index.load_index(self.pos_path, verify=True))
+        with open(path, 'wb') as idx:
+            idx.write(b'GVCF')
+        self.assertIsNone(index.load_index(self.pos_path))
+
+    def test_compile_empty(self):
+        open(self.pos_path, 'w').close()
+        index.compile_index(self.pos_path)
+        idx = index.load_index(self.pos_path)
+        self.assertEqual(len(idx), 0)
+
+    def test_compile_bad_position(self):
+        with open(self.pos_path, 'a') as pos:
+            pos.write("-12\tline 6\n")
+        with self.assertRaises(ValueError):
+            index.compile_index(self.pos_path)
+
+    def test_compile_unsorted(self):
+        with open(self.pos_path, 'a') as pos:
+            pos.write("10\tline 6\n")
+        with self.assertRaises(ValueError) as ctx:
+            index.compile_index(self.pos_path)
+        self.assertEqual(str(ctx.exception),
+                         f"{self.pos_path} is not sorted: the line 7 (position 10) comes after the position 11")
+        self.assertFalse(os.path.exists(index.index_path(self.pos_path)))
+
+    def test_generators_with_index(self):
+        index.compile_index(self.pos_path)
+        idx = index.load_index(self.pos_path)
+        vcf_text = ''.join(self.vcf_text)
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            expected = ''.join(gen(StringIO(''.join(self.pos_text)), StringIO(vcf_text)))
+            with self.subTest(invert=invert):
+                self.assertEqual(''.join(gen(idx, StringIO(vcf_text))), expected)
+                chunks = grep_vcf.block_match_generator(idx, BytesIO(vcf_text.encode()), invert=invert)
+                self.assertEqual(b''.join(chunks), expected.encode())
@@ -0,0 +1,86 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf.intervals import IntervalPanel, interval_match_generator
+
+
+class GrepVcfTestIntervals(GrepVcfTest):
+
+    intervals = "# start end\n20 25\n3 5\n\n8\n4 6\n26 30\n"
+    vcf = "# vcf\n1\tvcf ligne 1\n3\tvcf ligne 2\n6\tvcf ligne 3\n7\tvcf ligne 4\n8\tvcf ligne 5\n" \
+          "8\tvcf ligne 6\n19\tvcf ligne 7\n30\tvcf ligne 8\n31\tvcf ligne 9\n"
+
+    def test_panel(self):
+        panel = IntervalPanel.from_file(StringIO(self.intervals))
+        # the overlapping and touching intervals are merged
+        self.assertEqual(list(panel.starts), [3, 8, 20])
+        self.assertEqual(list(panel.ends), [6, 8, 30])
+        self.assertEqual(len(panel), 3)
+        self.assertEqual([pos for pos in range(33) if pos in panel],
+                         [3, 4, 5, 6, 8] + list(range(20, 31)))
+        self.assertGreater(panel.nbytes, 0)
+        self.assertEqual(list(IntervalPanel([]).starts), [])
+        self.assertNotIn(3, IntervalPanel([]))
+
+    def test_panel_wrong_format(self):
+        for intervals in ("3 foo\n", "foo 3\n", "5 3\n"):
+            with self.subTest(intervals=intervals):
+                with self.assertRaises(ValueError) as ctx:
+                    IntervalPanel.from_file(StringIO(intervals))
+                self.assertTrue(str(ctx.exception).startswith("position file has wrong format"))
+                # the same message in binary mode, without bytes repr
+                with self.assertRaises(ValueError) as bin_ctx:
+                    IntervalPanel.from_file(BytesIO(intervals.encode()))
+                self.assertEqual(str(bin_ctx.exception), str(ctx.exception))
+        with self.assertRaises(ValueError) as ctx:
+            IntervalPanel.from_file(BytesIO(b"3\tf\xe9o\n"))
+        self.assertEqual(str(ctx.exception),
+                         "position file has wrong format: 3\tf\ufffdo: "
+                         "invalid literal for int() with base 10: 'f\ufffdo'")
+
+    def test_interval_match_generator(self):
+        vcf_lines = self.vcf.splitlines(keepends=True)[1:]
+        expected = [vcf_lines[i] for i in (1, 2, 4, 5, 7)]
+        expected_invert = [vcf_lines[i] for i in (0, 3, 6, 8)]
+        for invert, lines in ((False, expected), (True, expected_invert)):
+            with self.subTest(invert=invert):
+                gen = interval_match_generator(StringIO(self.intervals), StringIO(self.vcf), invert=invert)
+                self.assertEqual(list(gen), lines)
+                gen = interval_match_generator(BytesIO(self.intervals.encode()), BytesIO(self.vcf.encode()),
+                                               invert=invert)
+                self.assertEqual(b''.join(gen), ''.join(lines).encode())
+
+    def test_unsorted_vcf(self):
+        vcf = "30\tvcf ligne 1\n4\tvcf ligne 2\n7\tvcf ligne 3\n21\tvcf ligne 4\n2\tvcf ligne 5\n"
+        panel = IntervalPanel([(3, 5), (20, 30)])
+        gen = interval_match_generator(None, StringIO(vcf), panel=panel)
+        self.assertEqual(list(gen), ["30\tvcf ligne 1\n", "4\tvcf ligne 2\n", "21\tvcf ligne 4\n"])
+
+    def test_vcf_wrong_format(self):
+        with self.assertRaises(ValueError) as ctx:
+            list(interval_match_generator(StringIO(self.intervals), StringIO("3\tfoo\nbar\tfoo\n")))
+        self.assertTrue(str(ctx.exception).startswith("vcf has wrong format"))
@@ -0,0 +1,89 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf import membership
+
+
+class GrepVcfTestMembership(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.pos_text = ["9\tline 1\n",
+                         "5\tline 2\n",
+                         "# comment 1\n",
+                         "11\tline 3\n",
+                         "8\tline 4\n"]
+        self.vcf_text = ["# comment 1\n",
+                         "12\tvcf line 1\n",
+                         "8\tvcf line 2\n",
+                         "7\tvcf line 3\n",
+                         "11\tvcf line 4\n",
+                         "9\tvcf line 5\n"]
+
+    def test_position_set(self):
+        for positions, kind in (([9, 5, 11, 8], 'bitset'), ([1, 5, 10_000_000], 'set'), ([], 'bitset')):
+            with self.subTest(positions=positions):
+                position_set = membership.PositionSet(positions)
+                self.assertEqual(position_set.kind, kind)
+                self.assertEqual(len(position_set), len(positions))
+                self.assertGreater(position_set.nbytes, 0)
+                for pos in positions:
+                    self.assertIn(pos, position_set)
+                for pos in (-1, 0, 2, 6, 12, 10_000_001):
+                    self.assertNotIn(pos, position_set)
+
+    def test_is_sorted(self):
+        self.assertFalse(membership.is_sorted(StringIO(''.join(self.pos_text))))
+        self.assertTrue(membership.is_sorted(BytesIO(b"# comment\n1\ta\n1\tb\n3\tc\n")))
+        self.assertTrue(membership.is_sorted(StringIO('')))
+
+    def test_membership_match_generator(self):
+        lines = list(membership.membership_match_generator(StringIO(''.join(self.pos_text)),
+                                                           StringIO(''.join(self.vcf_text))))
+        self.assertListEqual(lines, ["8\tvcf line 2\n", "11\tvcf line 4\n", "9\tvcf line 5\n"])
+        lines = list(membership.membership_match_generator(BytesIO(''.join(self.pos_text).encode()),
+                                                           BytesIO(''.join(self.vcf_text).encode()),
+                                                           invert=True))
+        self.assertListEqual(lines, [b"12\tvcf line 1\n", b"7\tvcf line 3\n"])
+
+    def test_membership_sorted_files(self):
+        # on sorted files without duplicates the result is the same as the sorted merge
+        pos_text = ''.join(sorted(self.pos_text[:2] + self.pos_text[3:], key=lambda l: int(l.split()[0])))
+        vcf_text = ''.join(sorted(self.vcf_text[1:], key=lambda l: int(l.split()[0])))
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            with self.subTest(invert=invert):
+                self.assertListEqual(
+                    list(membership.membership_match_generator(StringIO(pos_text), StringIO(vcf_text),
+                                                               invert=invert)),
+                    list(gen(StringIO(pos_text), StringIO(vcf_text))))
+
+    def test_membership_bad_lines(self):
+        with self.assertRaises(ValueError):
+            list(membership.membership_match_generator(StringIO("8.5\tbad\n"), StringIO(''.join(self.vcf_text))))
+        with self.assertRaises(ValueError):
+            list(membership.membership_match_generator(StringIO(''.join(self.pos_text)), StringIO("8.5\tbad\n")))
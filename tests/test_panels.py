@@ -0,0 +1,86 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf.panels import fan_out_generator, fan_out
+from grep_vcf.position_filter import PositionFilter
+
+
+class GrepVcfTestPanels(GrepVcfTest):
+
+    panels = ("4\n7\n9\n", "# bla\n7\n8\n8\n12\n", "", "1\n2\n20\n", "7\n9\n11\n12\n")
+    vcf = "# vcf\n7\tvcf ligne 1\n8\tvcf ligne 2\n8\tvcf ligne 3\n9\tvcf ligne 4\n11\tvcf ligne 5\n12\tvcf ligne 6\n"
+
+    def test_fan_out_generator(self):
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            with self.subTest(invert=invert):
+                selected = [[] for _ in self.panels]
+                for line, refs in fan_out_generator([StringIO(panel) for panel in self.panels],
+                                                    StringIO(self.vcf), invert=invert):
+                    self.assertTrue(refs)
+                    for i in refs:
+                        selected[i].append(line)
+                # the same lines as one pass by panel
+                for panel, lines in zip(self.panels, selected):
+                    self.assertListEqual(lines, list(gen(StringIO(panel), StringIO(self.vcf))))
+
+    def test_fan_out_generator_binary(self):
+        refs = [BytesIO(self.panels[0].encode()), PositionFilter([8, 12])]
+        self.assertListEqual(list(fan_out_generator(refs, BytesIO(self.vcf.encode()))),
+                             [(b"7\tvcf ligne 1\n", (0,)),
+                              (b"8\tvcf ligne 2\n", (1,)),
+                              (b"9\tvcf ligne 4\n", (0,)),
+                              (b"12\tvcf ligne 6\n", (1,))])
+
+    def test_fan_out(self):
+        outs = [StringIO() for _ in self.panels]
+        counts = fan_out([StringIO(panel) for panel in self.panels], StringIO(self.vcf), outs)
+        self.assertListEqual(counts, [2, 4, 0, 0, 4])
+        self.assertEqual(outs[1].getvalue(), "7\tvcf ligne 1\n8\tvcf ligne 2\n8\tvcf ligne 3\n12\tvcf ligne 6\n")
+        outs = [BytesIO(), BytesIO()]
+        counts = fan_out([StringIO(panel) for panel in self.panels[:2]], BytesIO(self.vcf.encode()), outs,
+                         invert=True)
+        self.assertListEqual(counts, [4, 2])
+        self.assertEqual(outs[0].getvalue(),
+                         b"8\tvcf ligne 2\n8\tvcf ligne 3\n11\tvcf ligne 5\n12\tvcf ligne 6\n")
+
+    def test_wrong_format(self):
+        with self.assertRaises(ValueError) as ctx:
+            list(fan_out_generator([StringIO("7\nfoo\n")], StringIO(self.vcf)))
+        self.assertTrue(str(ctx.exception).startswith("position file has wrong format"))
+        with self.assertRaises(ValueError) as ctx:
+            list(fan_out_generator([StringIO("7\n8\n")], StringIO("7\ta\nbar\tb\n")))
+        self.assertTrue(str(ctx.exception).startswith("vcf has wrong line"))
+
+    def test_fan_out_header(self):
+        vcf = "##fileformat=VCFv4.2\n#CHROM\tPOS\n" + self.vcf
+        outs = [BytesIO(), StringIO()]
+        counts = fan_out([StringIO("7\n"), StringIO("9\n")], BytesIO(vcf.encode()), outs, header=True)
+        self.assertListEqual(counts, [1, 1])
+        self.assertEqual(outs[0].getvalue(), b"##fileformat=VCFv4.2\n#CHROM\tPOS\n# vcf\n7\tvcf ligne 1\n")
+        self.assertEqual(outs[1].getvalue(), "##fileformat=VCFv4.2\n#CHROM\tPOS\n# vcf\n9\tvcf ligne 4\n")
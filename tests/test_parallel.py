@@ -0,0 +1,117 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import tempfile
+from io import StringIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf import parallel
+
+
+class GrepVcfTestParallel(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.pos_text = ["# comment\n",
+                         "2\tline 1\n",
+                         "4\tline 2\n",
+                         "5\tline 3\n",
+                         "5\tline 4\n",
+                         "9\tline 5\n",
+                         "# comment 2\n",
+                         "11\tline 6\n",
+                         "15\tline 7\n"]
+        self.vcf_text = ["##fileformat=VCFv4.2\n",
+                         "#POS\tREF\tALT\n",
+                         "1\tvcf line 1\n",
+                         "4\tvcf line 2\n",
+                         "5\tvcf line 3\n",
+                         "5\tvcf line 4\n",
+                         "# vcf comment\n",
+                         "5\tvcf line 5\n",
+                         "8\tvcf line 6\n",
+                         "9\tvcf line 7\n",
+                         "\n",
+                         "11\tvcf line 8\n",
+                         "12\tvcf line 9\n",
+                         "16\tvcf line 10"]
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='test_grep_vcf')
+        self.pos_path = os.path.join(self.tmpdir.name, 'data.txt')
+        self.vcf_path = os.path.join(self.tmpdir.name, 'data.vcf')
+        with open(self.pos_path, 'w') as pos, open(self.vcf_path, 'w') as vcf:
+            pos.write(''.join(self.pos_text))
+            vcf.write(''.join(self.vcf_text))
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_bisect_records(self):
+        buf = ''.join(self.vcf_text).encode()
+        for pos, expected in ((0, "1\t"), (1, "1\t"), (3, "4\t"), (5, "5\tvcf line 3"),
+                              (6, "8\t"), (10, "11\t"), (16, "16\t")):
+            with self.subTest(pos=pos):
+                offset = grep_vcf._bisect_records(buf, pos)
+                first = grep_vcf._next_record(buf, offset)
+                self.assertTrue(buf[first[1]:].decode().startswith(expected))
+                for previous_pos, _ in grep_vcf._scan_records(buf, end=offset):
+                    self.assertLess(previous_pos, pos)
+        self.assertEqual(grep_vcf._bisect_records(buf, 17), len(buf))
+
+    def test_chunk_bounds(self):
+        buf = ''.join(self.vcf_text).encode()
+        for chunk_size in (1, 10, 30, 1000):
+            with self.subTest(chunk_size=chunk_size):
+                bounds = parallel._chunk_bounds(buf, chunk_size=chunk_size)
+                self.assertEqual(bounds[0][0], 0)
+                self.assertEqual(bounds[-1][1], len(buf))
+                for (_, end), (start, _) in zip(bounds, bounds[1:]):
+                    self.assertEqual(end, start)
+                    self.assertEqual(buf[end - 1:end], b'\n')
+                    previous = grep_vcf._previous_record(buf, end)
+                    following = grep_vcf._next_record(buf, end)
+                    if previous and following:
+                        self.assertNotEqual(previous[0], following[0])
+
+    def test_parallel_match_generator(self):
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            for ref_path, target_path in (self.pos_path, self.vcf_path), (self.vcf_path, self.pos_path):
+                with open(ref_path) as ref, open(target_path) as target:
+                    expected = ''.join(gen(ref, target)).encode()
+                for chunk_size in (1, 20, 1000):
+                    with self.subTest(invert=invert, ref=ref_path, chunk_size=chunk_size):
+                        chunks = parallel.parallel_match_generator(ref_path, target_path,
+                                                                   invert=invert,
+                                                                   processes=2,
+                                                                   chunk_size=chunk_size)
+                        self.assertEqual(b''.join(chunks), expected)
+
+    def test_parallel_match_generator_empty(self):
+        empty_path = os.path.join(self.tmpdir.name, 'empty.vcf')
+        open(empty_path, 'w').close()
+        self.assertListEqual(list(parallel.parallel_match_generator(self.pos_path, empty_path, processes=2)), [])
+        chunks = parallel.parallel_match_generator(empty_path, self.vcf_path, invert=True, processes=2)
+        expected = ''.join(grep_vcf.invert_match_generator(StringIO(''), StringIO(''.join(self.vcf_text))))
+        self.assertEqual(b''.join(chunks), expected.encode())
@@ -0,0 +1,106 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import gzip
+import tempfile
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf import index
+from grep_vcf import position_filter
+from grep_vcf.position_filter import PositionFilter
+
+
+class GrepVcfTestPositionFilter(GrepVcfTest):
+
+    def setUp(self) -> None:
+        with open(self.find_data('data.txt')) as pos, open(self.find_data('data.vcf')) as vcf:
+            self.pos_text = pos.read()
+            self.vcf_text = vcf.read()
+
+    def test_from_file(self):
+        panel = PositionFilter.from_file(self.find_data('data.txt'))
+        self.assertEqual(len(panel), 6)
+        self.assertListEqual(list(panel.positions), [4, 5, 7, 9, 10, 11])
+        panel = PositionFilter.from_file(StringIO(self.pos_text))
+        self.assertListEqual(list(panel.positions), [4, 5, 7, 9, 10, 11])
+        with self.assertRaises(ValueError):
+            PositionFilter.from_file(StringIO("4.5\tbad\n"))
+
+    def test_from_index(self):
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            pos_path = os.path.join(tmpdir, 'data.txt')
+            with open(pos_path, 'w') as pos:
+                pos.write(self.pos_text)
+            index.compile_index(pos_path)
+            panel = PositionFilter.from_file(pos_path)
+            self.assertIsInstance(panel.positions, memoryview)
+            self.assertListEqual(list(panel.positions), [4, 5, 7, 9, 10, 11])
+
+    def test_lines(self):
+        panel = PositionFilter.from_file(self.find_data('data.txt'))
+        for invert in (False, True):
+            gen = grep_vcf.invert_match_generator if invert else grep_vcf.match_generator
+            expected = list(gen(StringIO(self.pos_text), StringIO(self.vcf_text)))
+            with self.subTest(invert=invert):
+                # the panel is reused
+                for _ in range(2):
+                    self.assertListEqual(list(panel.lines(StringIO(self.vcf_text), invert=invert)), expected)
+                    self.assertListEqual(list(panel.lines(self.find_data('data.vcf'), invert=invert)),
+                                         [line.encode() for line in expected])
+                    self.assertListEqual(list(grep_vcf.match_generator(panel, StringIO(self.vcf_text))),
+                                         list(grep_vcf.match_generator(StringIO(self.pos_text),
+                                                                       StringIO(self.vcf_text))))
+
+    def test_filter(self):
+        panel = PositionFilter.from_file(self.find_data('data.txt'))
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            vcf_path = os.path.join(tmpdir, 'data.vcf.gz')
+            with gzip.open(vcf_path, 'wt') as vcf:
+                vcf.write(self.vcf_text)
+            out_path = os.path.join(tmpdir, 'out.vcf')
+            self.assertEqual(panel.filter(vcf_path, out_path), 3)
+            with open(out_path) as out:
+                self.assertEqual(out.read(), "7\tvcf ligne 1\n9\tvcf ligne 3\n11\tvcf ligne 4\n")
+        out = StringIO()
+        self.assertEqual(panel.filter(StringIO(self.vcf_text), out, invert=True), 2)
+        self.assertEqual(out.getvalue(), "8\tvcf ligne 2\n12\tvcf ligne 5\n")
+        out = BytesIO()
+        panel.filter(BytesIO(self.vcf_text.encode()), out, invert=True)
+        self.assertEqual(out.getvalue(), b"8\tvcf ligne 2\n12\tvcf ligne 5\n")
+
+    def test_batch_filter(self):
+        panel = PositionFilter.from_file(self.find_data('data.txt'))
+        expected = ''.join(grep_vcf.match_generator(StringIO(self.pos_text), StringIO(self.vcf_text)))
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            paths = [(self.find_data('data.vcf'), os.path.join(tmpdir, f'out_{i}.vcf')) for i in range(4)]
+            for processes in (1, 2):
+                with self.subTest(processes=processes):
+                    done = list(position_filter.batch_filter(panel, paths, processes=processes))
+                    self.assertListEqual(sorted(done), [(vcf, out, 3) for vcf, out in paths])
+                    for _, out_path in paths:
+                        with open(out_path) as out:
+                            self.assertEqual(out.read(), expected)
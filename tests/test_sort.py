@@ -0,0 +1,140 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+
+import os
+import random
+import tempfile
+from io import BytesIO
+from unittest.mock import patch
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf, sort
+from grep_vcf.index import PositionIndex
+
+
+class GrepVcfTestSort(GrepVcfTest):
+
+    def shuffled(self, seed=0, lines=3000):
+        rand = random.Random(seed)
+        text = ["##fileformat=VCFv4.2\n", "#CHROM\tPOS\n"]
+        for i in range(lines):
+            if rand.random() < 0.05:
+                text.append(f"# comment {i}\n")
+            text.append(f"{rand.randint(0, 500)}\tvcf ligne {i}\n")
+        text.append("# last\n")
+        return text
+
+    def test_sorted_records(self):
+        text = self.shuffled()
+        records = [(int(line.split()[0]), line.encode()) for line in text if not line.startswith('#')]
+        expected = sorted(records, key=lambda record: record[0])
+        data = ''.join(text).encode()
+        # small runs merged in several passes, in the current process and in worker processes
+        with patch.object(sort, '_MIN_RUN_SIZE', 1000), patch.object(sort, 'MAX_FAN_IN', 4):
+            for memory, processes in ((sort.MEMORY, 1), (6000, 1), (12000, 2)):
+                with self.subTest(memory=memory, processes=processes):
+                    with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+                        self.assertEqual(list(sort.sorted_records(BytesIO(data), memory=memory, tmpdir=tmpdir,
+                                                                  processes=processes)),
+                                         expected)
+                        # the runs are removed
+                        self.assertEqual(os.listdir(tmpdir), [])
+
+    def test_sort_file(self):
+        text = "##fileformat=VCFv4.2\n#CHROM\tPOS\n8\tvcf ligne 1\n# about 3\n3\tvcf ligne 2\n\n" \
+               "5\tvcf ligne 3\n3\tvcf ligne 4\n# trailing\n"
+        expected = "##fileformat=VCFv4.2\n#CHROM\tPOS\n# about 3\n3\tvcf ligne 2\n3\tvcf ligne 4\n" \
+                   "\n5\tvcf ligne 3\n8\tvcf ligne 1\n# trailing\n"
+        out = BytesIO()
+        sort.sort_file(BytesIO(text.encode()), out)
+        self.assertEqual(out.getvalue().decode(), expected)
+        text = self.shuffled(seed=1)
+        with patch.object(sort, '_MIN_RUN_SIZE', 1000), patch.object(sort, 'MAX_FAN_IN', 4):
+            out = BytesIO()
+            sort.sort_file(BytesIO(''.join(text).encode()), out, memory=6000, processes=2)
+        lines = out.getvalue().decode().splitlines(keepends=True)
+        self.assertEqual(lines[:2], text[:2])
+        self.assertEqual(lines[-1], "# last\n")
+        self.assertEqual(sorted(lines), sorted(text))
+        # each comment stays before the line which followed it
+        for i, line in enumerate(text[2:-1], 2):
+            if line.startswith('#'):
+                self.assertEqual(lines[lines.index(line) + 1], text[i + 1])
+
+    def test_line_ends(self):
+        # the lines are kept as they are, even the last one without newline
+        for comment in (b"", b"# bla\n"):
+            data = b"3\tfoo\r\n" + comment + b"5\tb\rar\n8\tbaz"
+            with self.subTest(comment=comment):
+                expected = b''.join(grep_vcf.block_match_generator(BytesIO(b"3\n5\n8\n"), BytesIO(data)))
+                self.assertEqual(b''.join(sort.sort_match_generator(BytesIO(b"3\n5\n8\n"), BytesIO(data))),
+                                 expected)
+                out = BytesIO()
+                sort.sort_file(BytesIO(data), out)
+                self.assertEqual(out.getvalue(), data)
+        # the last line gets a newline only if the sort moves it before other lines
+        lines = [b"%d\tvcf ligne %d\n" % (pos, i) for i, pos in enumerate(random.Random(3).sample(range(500), 300))]
+        for last in (b"1000\tlast", b"2\tlast"):
+            data = b''.join(lines) + last
+            expected = b''.join(sorted(lines + [last + b'\n'], key=lambda line: int(line.split()[0])))
+            if last.startswith(b'1000'):
+                expected = expected[:-1]
+            with self.subTest(last=last):
+                with patch.object(sort, '_MIN_RUN_SIZE', 1000):
+                    for memory in (sort.MEMORY, 6000):
+                        out = BytesIO()
+                        sort.sort_file(BytesIO(data), out, memory=memory)
+                        self.assertEqual(out.getvalue(), expected)
+
+    def test_wrong_format(self):
+        # with and without comments, the chunks are not parsed the same way
+        for data in (b"3\tfoo\nbar\tbaz\n", b"3\tfoo\n# bla\nbar\tbaz\n"):
+            with self.subTest(data=data):
+                with self.assertRaises(ValueError) as ctx:
+                    list(sort.sorted_records(BytesIO(data)))
+                self.assertEqual(str(ctx.exception), "bar\tbaz: invalid literal for int() with base 10: 'bar'")
+                with self.assertRaises(ValueError) as ctx:
+                    list(sort.sort_match_generator(BytesIO(b"3\n"), BytesIO(data)))
+                self.assertEqual(str(ctx.exception),
+                                 "vcf has wrong format: bar\tbaz: invalid literal for int() with base 10: 'bar'")
+
+    def test_sort_match_generator(self):
+        text = self.shuffled(seed=2)
+        data = ''.join(text).encode()
+        positions = b"# panel\n" + b''.join(f"{pos}\n".encode() for pos in random.Random(2).sample(range(600), 200))
+        sorted_data = BytesIO()
+        sort.sort_file(BytesIO(data), sorted_data)
+        sorted_positions = b''.join(sorted(positions.splitlines(keepends=True)[1:], key=int))
+        for invert in (False, True):
+            with self.subTest(invert=invert):
+                sorted_data.seek(0)
+                expected = b''.join(grep_vcf.block_match_generator(BytesIO(sorted_positions), sorted_data,
+                                                                   invert=invert))
+                got = b''.join(sort.sort_match_generator(BytesIO(positions), BytesIO(data), invert=invert,
+                                                         processes=2))
+                self.assertEqual(got, expected)
+                index = PositionIndex([int(pos) for pos in sorted_positions.split()])
+                got = b''.join(sort.sort_match_generator(index, BytesIO(data), invert=invert))
+                self.assertEqual(got, expected)
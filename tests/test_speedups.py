@@ -0,0 +1,158 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import unittest
+import itertools
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+
+
+def _consume(iterator):
+    """
+    :return: the items got from *iterator* and the error which stopped it if any
+    """
+    items = []
+    try:
+        for item in iterator:
+            items.append(bytes(item) if isinstance(item, memoryview) else item)
+    except Exception as err:
+        return items, (type(err), str(err))
+    return items, None
+
+
+@unittest.skipIf(grep_vcf._speedups is None, "the compiled kernel is not built")
+class GrepVcfTestSpeedups(GrepVcfTest):
+    """
+    The compiled kernel must behave exactly as the pure python one.
+    """
+
+    texts = ("",
+             "# bla\n3\tvcf 1\n7\tvcf 2\n\n  7\tvcf 3\n9\tvcf 4\n12\tvcf 5",
+             "1\ta\n \t2 b c\n0007\td\n+8\te\n1_0\tf\n99999999999999999999\tg\n",
+             "1\ta\n2\tb\nfoo\tc\n3\td\n",
+             "1\ta\n2\tb\n12a\tc\n3\td\n",
+             "١٢\tarabic digits\n#é\n13\té\n",
+             )
+
+    def test_text_records(self):
+        for text in self.texts:
+            with self.subTest(text=text):
+                self.assertEqual(_consume(grep_vcf._speedups.text_records(StringIO(text))),
+                                 _consume(grep_vcf._py_text_records(StringIO(text))))
+
+    def test_scan_records(self):
+        for text in self.texts:
+            data = text.encode()
+            for start, end in ((0, None), (3, None), (0, len(data) // 2), (len(data), None)):
+                with self.subTest(text=text, start=start, end=end):
+                    self.assertEqual(_consume(grep_vcf._speedups.scan_records(data, start, end)),
+                                     _consume(grep_vcf._py_scan_records(data, start, end)))
+            with self.subTest(text=text, view=True):
+                self.assertEqual(_consume(grep_vcf._speedups.scan_records(data, view=memoryview(data))),
+                                 _consume(grep_vcf._py_scan_records(data, view=memoryview(data))))
+                self.assertEqual(_consume(grep_vcf._speedups.scan_records(data, view=grep_vcf._Offsets())),
+                                 _consume(grep_vcf._py_scan_records(data, view=grep_vcf._Offsets())))
+
+    def test_line_count(self):
+        # the lines read are counted as the pure python parsers do, up to the last record read or the error
+        for text in self.texts:
+            with self.subTest(text=text):
+                counts = []
+                for text_records, scan_records, line_count in (
+                        (grep_vcf._speedups.text_records, grep_vcf._speedups.scan_records, grep_vcf._LineCount),
+                        (grep_vcf._py_text_records, grep_vcf._py_scan_records, grep_vcf._PyLineCount)):
+                    text_count, scan_count = line_count(), line_count()
+                    counts.append((_consume(text_records(StringIO(text), count=text_count)), text_count.number,
+                                   _consume(scan_records(text.encode(), count=scan_count)), scan_count.number))
+                self.assertEqual(counts[0], counts[1])
+        with self.assertRaises(TypeError):
+            grep_vcf._speedups.scan_records(b"1\n", count=grep_vcf._PyLineCount())
+
+    def test_merge(self):
+        refs = ("", "3\n7\n7\n12\n", "# bla\n1\n9\n", "7\nbar\n9\n", "100\n", "9\n3\n7\n", "1\n12\n2\n")
+        for ref in refs:
+            for text in self.texts:
+                for invert, strict in itertools.product((False, True), repeat=2):
+                    with self.subTest(ref=ref, text=text, invert=invert, strict=strict):
+                        compiled = grep_vcf._speedups.merge(grep_vcf._speedups.text_records(StringIO(ref)),
+                                                            grep_vcf._speedups.text_records(StringIO(text)),
+                                                            invert=invert, strict=strict)
+                        pure = grep_vcf._py_merge(grep_vcf._py_text_records(StringIO(ref)),
+                                                  grep_vcf._py_text_records(StringIO(text)),
+                                                  invert=invert, strict=strict)
+                        self.assertEqual(_consume(compiled), _consume(pure))
+
+    def test_block_filter(self):
+        refs = ("", "3\n7\n7\n12\n", "# bla\n1\n9\n", "7\nbar\n9\n", "100\n", "9\n3\n7\n", "1\n12\n2\n")
+        texts = self.texts + ("3\tvcf 1\n7\tvcf 2\n5\tvcf 3\n12\tvcf 4\n",)
+        for ref, text in itertools.product(refs, texts):
+            for invert, strict, read_size in itertools.product((False, True), (False, True), (1, 7, 1000)):
+                with self.subTest(ref=ref, text=text, invert=invert, strict=strict, read_size=read_size):
+                    results = []
+                    for block_filter, scan_records, line_count in (
+                            (grep_vcf._speedups.BlockFilter, grep_vcf._speedups.scan_records, grep_vcf._LineCount),
+                            (grep_vcf._PyBlockFilter, grep_vcf._py_scan_records, grep_vcf._PyLineCount)):
+                        ref_lines, target_lines = line_count(), line_count()
+                        ref_records = grep_vcf._block_records(BytesIO(ref.encode()), scan=scan_records,
+                                                              count=ref_lines)
+                        filtered = block_filter(ref_records, invert=invert, strict=strict,
+                                                ref_lines=ref_lines, target_lines=target_lines)
+                        chunks = _consume(grep_vcf._filtered_blocks(filtered, BytesIO(text.encode()), read_size))
+                        results.append((b''.join(chunks[0]), chunks[1], target_lines.number))
+                    self.assertEqual(results[0], results[1])
+                    # the lines selected are the ones of the merge
+                    ref_lines, target_lines = grep_vcf._PyLineCount(), grep_vcf._PyLineCount()
+                    merged = _consume(grep_vcf._py_merge(grep_vcf._py_scan_records(ref.encode(), count=ref_lines),
+                                                         grep_vcf._py_scan_records(text.encode(), count=target_lines),
+                                                         invert=invert, strict=strict,
+                                                         ref_lines=ref_lines, target_lines=target_lines))
+                    self.assertEqual(results[1][1], merged[1])
+                    if merged[1] is None:
+                        self.assertEqual(results[1][0], b''.join(merged[0]))
+        with self.assertRaises(TypeError):
+            grep_vcf._speedups.BlockFilter([], target_lines=grep_vcf._PyLineCount())
+
+    def test_merge_records(self):
+        # any iterable of pairs is accepted as records
+        ref = [(3, None), (7, None)]
+        target = [[3, 'a'], (5, 'b'), (7, 'c')]
+        self.assertListEqual(list(grep_vcf._speedups.merge(ref, target)), ['a', 'c'])
+        self.assertListEqual(list(grep_vcf._speedups.merge(ref, target, invert=True)), ['b'])
+        self.assertListEqual(list(grep_vcf._speedups.merge([(2 ** 70, None)], [(2 ** 70, 'big')])), ['big'])
+
+    def test_merge_not_iterable(self):
+        # the target is not touched once the reference failed
+        called = []
+
+        class Target:
+            def __iter__(self):
+                called.append(True)
+                return iter([])
+        with self.assertRaises(TypeError):
+            grep_vcf._speedups.merge(1, Target())
+        self.assertEqual(called, [])
+        with self.assertRaises(TypeError):
+            grep_vcf._speedups.merge([], 1)
@@ -0,0 +1,133 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import json
+import tempfile
+from io import StringIO, BytesIO
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf.stats import Stats, _count_lines
+
+
+class GrepVcfTestStats(GrepVcfTest):
+
+    ref = "# bla\n7\n8\n12\n"
+    vcf = "# vcf\n\n7\tvcf ligne 1\n8\tvcf ligne 2\n9\tvcf ligne 3\n12\tvcf ligne 4\n13\tvcf ligne 5\n"
+
+    def test_count_lines(self):
+        self.assertEqual(_count_lines(''), 0)
+        self.assertEqual(_count_lines('7\tfoo\n'), 1)
+        self.assertEqual(_count_lines(b'7\tfoo\n8\tbar'), 2)
+        self.assertEqual(_count_lines(memoryview(b'7\tfoo\n8\tbar\n')), 2)
+
+    def test_generators(self):
+        cases = ((lambda ref, vcf, stats: grep_vcf.match_generator(ref, vcf, stats=stats), False, 3),
+                 (lambda ref, vcf, stats: grep_vcf.invert_match_generator(ref, vcf, stats=stats), False, 2),
+                 (lambda ref, vcf, stats: grep_vcf.block_match_generator(ref, vcf, stats=stats), True, 3),
+                 (lambda ref, vcf, stats: grep_vcf.block_match_generator(ref, vcf, invert=True, stats=stats),
+                  True, 2))
+        for gen, binary, matches in cases:
+            with self.subTest(binary=binary, matches=matches):
+                stats = Stats()
+                if binary:
+                    ref, vcf = BytesIO(self.ref.encode()), BytesIO(self.vcf.encode())
+                else:
+                    ref, vcf = StringIO(self.ref), StringIO(self.vcf)
+                out = [line for line in gen(ref, vcf, stats)]
+                stats.finish()
+                report = stats.report()
+                self.assertEqual(report['matches'], matches)
+                self.assertEqual(report['bytes_out'], sum(len(line) for line in out))
+                self.assertEqual(report['inputs']['ref']['records'], 3)
+                self.assertEqual(report['inputs']['target']['records'], 5)
+                self.assertEqual(report['inputs']['target']['comments'], 2)
+                self.assertEqual(report['inputs']['target']['lines'], 7)
+                self.assertEqual(report['inputs']['ref']['comments'], 1)
+                for step in ('wall', 'parse', 'merge', 'write'):
+                    self.assertGreaterEqual(report['time'][step], 0)
+
+    def test_comments(self):
+        vcf = "# header\n\n7\tvcf ligne 1\n# bla\n8\tvcf ligne 2\n  \n# bla\n9\tvcf ligne 3\n# end"
+        lines = vcf.splitlines()
+        data = [i for i, line in enumerate(lines) if line.strip() and not line.startswith('#')]
+
+        def expected(records):
+            # the lines skipped before the last record read, or all of them if the file is read to its end
+            end = data[records - 1] + 1 if records < len(data) else len(lines)
+            return end - records
+
+        with tempfile.TemporaryDirectory(prefix='test_grep_vcf') as tmpdir:
+            vcf_path = os.path.join(tmpdir, 'data.vcf')
+            with open(vcf_path, 'w') as vcf_file:
+                vcf_file.write(vcf)
+            gens = {'text': lambda ref, vcf, **kwargs: grep_vcf.match_batches(ref, vcf, **kwargs),
+                    'block': lambda ref, vcf, **kwargs: grep_vcf.block_match_generator(ref, vcf, **kwargs),
+                    'small blocks': lambda ref, vcf, **kwargs: grep_vcf.block_match_generator(ref, vcf, block_size=5,
+                                                                                              **kwargs),
+                    'mmap': lambda ref, vcf, **kwargs: grep_vcf.mmap_match_generator(ref, vcf, **kwargs)}
+            for name, gen in gens.items():
+                for ref, invert in (("7\n", False), ("7\n", True), ("# ref\n9\n", False), ("\n", False)):
+                    with self.subTest(engine=name, ref=ref, invert=invert):
+                        stats = Stats()
+                        mode = 'r' if name == 'text' else 'rb'
+                        ref_path = os.path.join(tmpdir, 'ref.txt')
+                        with open(ref_path, 'w') as ref_file:
+                            ref_file.write(ref)
+                        with open(ref_path, mode) as ref_file, open(vcf_path, mode) as vcf_file:
+                            for _ in gen(ref_file, vcf_file, invert=invert, stats=stats):
+                                pass
+                        target = stats.inputs['target']
+                        self.assertEqual(target.comments, expected(target.records))
+                        self.assertEqual(target.lines, target.records + target.comments)
+                        if invert:
+                            self.assertEqual(target.lines, len(lines))
+                        self.assertEqual(stats.inputs['ref'].comments, ref.count('#') + ref.count('\n\n') +
+                                         (ref == "\n"))
+            stats = Stats()
+            stats.header('target', b"##fileformat=VCFv4.2\n#CHROM\tPOS\n")
+            with open(vcf_path, 'rb') as vcf_file:
+                list(grep_vcf.block_match_generator(BytesIO(b"7\n"), vcf_file, invert=True, stats=stats))
+            self.assertEqual(stats.inputs['target'].lines, len(lines) + 2)
+            stats.file_size('target', vcf_path)
+            stats.file_size('ref', os.path.join(tmpdir, 'no_such_file.txt'))
+            self.assertEqual(stats.inputs['target'].bytes, len(vcf))
+            self.assertIsNone(stats.inputs['ref'].bytes)
+            self.assertEqual(Stats().input('ref').as_dict(),
+                             {'lines': None, 'records': None, 'comments': None, 'bytes': None})
+
+    def test_writer_dump(self):
+        stats = Stats()
+        written = []
+        write = stats.writer(written.append)
+        for line in stats.lines(iter(['7\tfoo\n', '8\tbar\n'])):
+            write(line)
+        self.assertEqual(written, ['7\tfoo\n', '8\tbar\n'])
+        out = StringIO()
+        stats.dump(out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['matches'], 2)
+        self.assertEqual(report['bytes_out'], 12)
+        self.assertIsNone(report['time']['parse'])
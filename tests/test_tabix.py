@@ -0,0 +1,156 @@
+#########################################################################
+# grep_vcf - remove line fom vcf file where positions are not in        #
+# reference file                                                        #
+# Authors: Bertrand Neron                                               #
+# Copyright (c) 2020  Institut Pasteur (Paris) and CNRS.                #
+# See the COPYRIGHT file for details                                    #
+#                                                                       #
+# This file is part of grep_vcf package.                                #
+#                                                                       #
+# grep_vcf is free software: you can redistribute it and/or modify      #
+# it under the terms of the GNU General Public License as published by  #
+# the Free Software Foundation, either version 3 of the License, or     #
+# (at your option) any later version.                                   #
+#                                                                       #
+# grep_vcf is distributed in the hope that it will be useful,           #
+# but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the          #
+# GNU General Public License for more details .                         #
+#                                                                       #
+# You should have received a copy of the GNU General Public License     #
+# along with grep_vcf (LICENSE).                                        #
+# If not, see <https://www.gnu.org/licenses/>.                          #
+#########################################################################
+
+import os
+import gzip
+import struct
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from tests import GrepVcfTest
+from grep_vcf import grep_vcf
+from grep_vcf import bgzf
+from grep_vcf import tabix
+
+
+def write_indexed_vcf(path, lines, lines_per_block=3, col_seq=1, col_beg=2):
+    """
+    Write lines in a bgzf file and its tabix index, by default each record is a 'chrom pos ...' line.
+    """
+    offsets = []
+    coffset = 0
+    with open(path, 'wb') as vcf:
+        for start in range(0, len(lines), lines_per_block):
+            uoffset = 0
+            for line in lines[start:start + lines_per_block]:
+                offsets.append((coffset << 16) | uoffset)
+                uoffset += len(line)
+            block = bgzf._deflate(b''.join(lines[start:start + lines_per_block]))
+            vcf.write(block)
+            coffset += len(block)
+        vcf.write(bgzf.EOF_BLOCK)
+    offsets.append(coffset << 16)
+    names = []
+    bins = {}
+    linear = {}
+    for i, line in enumerate(lines):
+        if line.startswith(b'#'):
+            continue
+        fields = line.split(b'\t')
+        chrom, pos = fields[col_seq - 1], fields[col_beg - 1]
+        chrom = chrom.decode()
+        if chrom not in names:
+            names.append(chrom)
+            bins[chrom] = {}
+            linear[chrom] = {}
+        beg = int(pos) - 1
+        chunks = bins[chrom].setdefault(4681 + (beg >> 14), [])
+        if chunks and chunks[-1][1] == offsets[i]:
+            chunks[-1][1] = offsets[i + 1]
+        else:
+            chunks.append([offsets[i], offsets[i + 1]])
+        linear[chrom].setdefault(beg >> 14, offsets[i])
+    names_data = b''.join(name.encode() + b'\0' for name in names)
+    index = [b'TBI\1', struct.pack('<8i', len(names), 2, col_seq, col_beg, 0, ord('#'), 0, len(names_data)), names_data]
+    for name in names:
+        index.append(struct.pack('<i', len(bins[name])))
+        for bin_id, chunks in bins[name].items():
+            index.append(struct.pack('<Ii', bin_id, len(chunks)))
+            for chunk in chunks:
+                index.append(struct.pack('<QQ', *chunk))
+        n_intv = max(linear[name]) + 1
+        intervals = []
+        for window in range(n_intv):
+            intervals.append(linear[name].get(window, intervals[-1] if intervals else 0))
+        index.append(struct.pack(f'<i{n_intv}Q', n_intv, *intervals))
+    with open(path + '.tbi', 'wb') as tbi:
+        tbi.write(gzip.compress(b''.join(index)))
+
+
+class GrepVcfTestTabix(GrepVcfTest):
+
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory(prefix='test_grep_vcf')
+        self.vcf_path = os.path.join(self.tmpdir.name, 'data.vcf.gz')
+        self.lines = [b"##fileformat=VCFv4.2\n", b"#CHROM\tPOS\tID\n"]
+        self.lines += [b"chr1\t%d\tvcf line %d\n" % (pos, pos) for pos in range(1000, 200000, 1500)]
+        write_indexed_vcf(self.vcf_path, self.lines)
+
+    def tearDown(self) -> None:
+        self.tmpdir.cleanup()
+
+    def test_reg2bins(self):
+        self.assertListEqual(tabix._reg2bins(0, 1, 14, 5), [0, 1, 9, 73, 585, 4681])
+        self.assertListEqual(tabix._reg2bins(16384, 16385, 14, 5), [0, 1, 9, 73, 585, 4682])
+
+    def test_read_index(self):
+        index = tabix.read_index(self.vcf_path + '.tbi')
+        self.assertListEqual(index.names, ['chr1'])
+        self.assertEqual((index.col_seq, index.col_beg, index.meta), (1, 2, b'#'))
+        self.assertEqual(tabix.find_index(self.vcf_path), self.vcf_path + '.tbi')
+        self.assertIsNone(tabix.find_index(self.find_data('data.vcf')))
+        with self.assertRaises(ValueError):
+            tabix.read_index(self.vcf_path)
+
+    def test_chunks(self):
+        index = tabix.read_index(self.vcf_path + '.tbi')
+        ranges = index.chunks('chr1', [2500, 100000])
+        with open(self.vcf_path, 'rb') as vcf:
+            data = b''.join(tabix.read_ranges(vcf, ranges))
+        self.assertIn(b"chr1\t2500\tvcf line 2500\n", data)
+        self.assertIn(b"chr1\t100000\tvcf line 100000\n", data)
+        self.assertLess(len(data), len(b''.join(self.lines)) // 2)
+        for start, end in zip(ranges, ranges[1:]):
+            self.assertLess(start[1], end[0])
+        with self.assertRaises(KeyError):
+            index.chunks('chr2', [2500])
+
+    def test_tabix_match_generator(self):
+        index = tabix.read_index(self.vcf_path + '.tbi')
+        panel = "# panel\n2500\n2600\n100000\n199000\n300000\n"
+        read_block = tabix._read_block
+        with mock.patch('grep_vcf.tabix._read_block', side_effect=read_block) as blocks:
+            with open(self.vcf_path, 'rb') as vcf:
+                lines = list(tabix.tabix_match_generator(StringIO(panel), vcf, index))
+        self.assertListEqual(lines, [b"chr1\t2500\tvcf line 2500\n",
+                                     b"chr1\t100000\tvcf line 100000\n",
+                                     b"chr1\t199000\tvcf line 199000\n"])
+        # 3 windows of 16kb on 45 blocks
+        self.assertLess(blocks.call_count, len(self.lines) // 3 // 3)
+        with open(self.vcf_path, 'rb') as vcf:
+            self.assertListEqual(list(tabix.tabix_match_generator(StringIO(''), vcf, index)), [])
+        with open(self.vcf_path, 'rb') as vcf:
+            with self.assertRaises(ValueError):
+                list(tabix.tabix_match_generator(StringIO(panel), vcf, index, contig='chr2'))
+
+    def test_column_records(self):
+        data = b"# comment\n  10\tvcf line 1\n20\tvcf line 2"
+        self.assertListEqual(list(tabix._column_records(data, 1)),
+                             [(10, b"10\tvcf line 1\n"), (20, b"20\tvcf line 2")])
+        data = b"#CHROM\tPOS\nchr1\t10\tvcf line 1\nchr1\t20\tvcf line 2\n"
+        self.assertListEqual(list(tabix._column_records(data, 2)),
+                             [(10, b"chr1\t10\tvcf line 1\n"), (20, b"chr1\t20\tvcf line 2\n")])
+        with self.assertRaises(ValueError):
+            list(tabix._column_records(b"chr1\tbad\n", 2))